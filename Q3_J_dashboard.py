@@ -1,5 +1,3 @@
-import pandas as pd
-
 import dash
 from dash import dcc, html
 from dash.dependencies import Output, Input
@@ -8,72 +6,45 @@ import dash_bootstrap_components as dbc
 import plotly_express as px
 
 import analyze_functions as af
+from dashboard_options import (
+    attr_dict, attribute_options_dropdown, athlete_options, gender_options,
+    medal_list, medal_options, unit_dict
+)
+from data_context import DataProxy, shared_manager
+import shared_server
 
 
-# Import data
-df = pd.read_csv("data/canada.csv")
+# Data, shared with the other dashboards in this process (data_context.py)
+data_manager = shared_manager("data/")
+data = DataProxy(data_manager)
 
-# Column names
+# Column names of data.canada
 # ['Unnamed: 0', 'ID', 'Name', 'HashName', 'Sex', 'Age', 'Height',
 #       'Weight', 'Team', 'NOC', 'Games', 'Year', 'Season', 'City', 'Sport',
 #       'Event', 'Medal']
 
 
-# Medal options
-medal_list = "Gold Silver Bronze Total".split()
-medal_options = [{'label': medal, 'value': medal} for medal in medal_list]
+def time_slider():
+    """
+    Range of the Medal-Time slider, computed once per data version
 
-# Medal-Time slider options 
-slider_marks = {
-    str(year): str(year) for year in range(
-        df["Year"].min(), df["Year"].max(), 10
-    )
-}
-
-# Set dataframe for figure1, medal-time-figure
-df_medal = af.count_medals_n(df, "Year")
-
-
-# Attribute dropdown options
-attr_dict = {
-    'Sport':'Sport', 
-    'Event':'Sport event', 
-    'Games':'Year & Season',
-    'Season':'Season', 
-    'Name':'Athlete', 
-    'Sex':'Athlete gender', 
-    'Age':'Athlete age',
-    'City':'City'
-}
-attribute_options_dropdown = [
-    {'label':name, 'value': attribute} 
-    for attribute, name in attr_dict.items()
-]
-
-
-# Athletes dropdown options
-gender_options = [
-    {'label':'Both', 'value':'Both'},
-    {'label':'Female', 'value':'F'},
-    {'label':'Male', 'value':'M'}
-]
-athlete_dict = {
-    'Sex':'Gender',
-    'Age':'Age',
-    'Height':'Height',
-    'Weight':'Weight'
-}
-unit_dict = {
-    'Sex':'Gender',
-    'Age':'Age (years)',
-    'Height':'Height (centimetres)',
-    'Weight':'Weight (kilograms)'
-}
-
-athlete_options = [
-    {'label':name, 'value': attribute} 
-    for attribute, name in athlete_dict.items()
-]
+    Returns:
+        slider: dict with the min and max year with medals and the marks
+    """
+    def build():
+        df_medal = af.count_medals_n(data.canada, "Year")
+        years = df_medal[df_medal.columns[0]]
+        return {
+            "min": years.min(),
+            "max": years.max(),
+            # Medal-Time slider options
+            "marks": {
+                str(year): str(year) for year in range(
+                    data.canada["Year"].min(), data.canada["Year"].max(), 10
+                )
+            },
+        }
+    return data.cached("canada_time_slider", build)
 
 
 # Set theme settings
@@ -82,148 +53,157 @@ stylesheets = [dbc.themes.MATERIA]
 # Initiate dashboard
 #app = dash.Dash(__name__)
 app = dash.Dash(__name__, external_stylesheets=stylesheets,
-    meta_tags=[dict(name="viewport", content="width=device-width, initial-scale=1.0")]
+    meta_tags=[dict(name="viewport", content="width=device-width, initial-scale=1.0")],
+    # mounted on /canada/ of the shared server by dashboards.py
+    **shared_server.dash_options(__name__)
 )
+data_manager.init_server(app.server)
+
+
+# The layout is built on every page load, with the slider range of the data
+# version serving the request (not of the data at import time)
+def serve_layout():
+    slider = time_slider()
+
+    return dbc.Container([
+
+        # Main Title
+        dbc.Card([
+            dbc.CardBody(html.H1(
+                'Canada in 120 years of Olympic history: athletes and results',
+                className='text-primary-m-3'
+            ))
+        ], className='mt-3'),
+
+        # Figure for medals per year
+        # 2 columns,
+        dbc.Row([
+
+            #  1st col: with medal picker and with numbers to the right
+            dbc.Col([
+                dbc.Card([
+                    html.H3('Choose a medal:', className='m-2'),
+                    dcc.RadioItems(
+                        id='medal-picker-radio', 
+                        className='m-2',
+                        value="Total",
+                        options=medal_options,
+                        labelStyle={'display': 'block'}
+                    )
+                ]),
+                dbc.Card([
+                    dbc.Row([
+                        html.H3(
+                            "Number of medals shown",
+                            className='m-2'
+                        ),
+                        dbc.Col([
+                            html.P("Total:", className='m-2'),
+                            html.P("Gold:", className='m-2'),
+                            html.P("Silver:", className='m-2'),
+                            html.P("Bronze:", className='m-2'),
+                        ]),
+                        dbc.Col([
+                            html.P(id='total-medals', className='m-2'),
+                            html.P(id='gold-medals', className='m-2'),
+                            html.P(id='silver-medals', className='m-2'),
+                            html.P(id='bronze-medals', className='m-2'),
+                        ])
+                    ])
+                ], className='mt-1')
+            ], lg='8', xl='2'),
+
+            #  2nd col: with figure
+            dbc.Col([
+                dcc.Graph(
+                    id='medals-graph', 
+                    className=''
+                ),
+                dcc.RangeSlider(
+                    id='time-slider', 
+                    className='',
+                    min = slider["min"],
+                    max = slider["max"],
+                    step = 2,
+                    dots=True, 
+                    value=[slider["min"], slider["max"]],
+                    marks = slider["marks"]
+                ),
+            ]),
+        ], className='mt-4'),
 
+        # 2nd Title, for second figure
+        dbc.Card([
+            dbc.CardBody(html.H1("Top statistics for Canada",
+                className='text-primary-m-4'
+            ))
+        ], className='mt-5'),
 
-app.layout = dbc.Container([
-
-    # Main Title
-    dbc.Card([
-        dbc.CardBody(html.H1(
-            'Canada in 120 years of Olympic history: athletes and results',
-            className='text-primary-m-3'
-        ))
-    ], className='mt-3'),
-
-    # Figure for medals per year
-    # 2 columns,
-    dbc.Row([
-
-        #  1st col: with medal picker and with numbers to the right
-        dbc.Col([
-            dbc.Card([
-                html.H3('Choose a medal:', className='m-2'),
-                dcc.RadioItems(
-                    id='medal-picker-radio', 
-                    className='m-2',
-                    value="Total",
-                    options=medal_options,
-                    labelStyle={'display': 'block'}
-                )
-            ]),
-            dbc.Card([
-                dbc.Row([
-                    html.H3(
-                        "Number of medals shown",
-                        className='m-2'
-                    ),
-                    dbc.Col([
-                        html.P("Total:", className='m-2'),
-                        html.P("Gold:", className='m-2'),
-                        html.P("Silver:", className='m-2'),
-                        html.P("Bronze:", className='m-2'),
-                    ]),
-                    dbc.Col([
-                        html.P(id='total-medals', className='m-2'),
-                        html.P(id='gold-medals', className='m-2'),
-                        html.P(id='silver-medals', className='m-2'),
-                        html.P(id='bronze-medals', className='m-2'),
-                    ])
-                ])
-            ], className='mt-1')
-        ], lg='8', xl='2'),
-
-        #  2nd col: with figure
-        dbc.Col([
-            dcc.Graph(
-                id='medals-graph', 
-                className=''
-            ),
-            dcc.RangeSlider(
-                id='time-slider', 
-                className='',
-                min = df_medal[df_medal.columns[0]].min(), 
-                max = df_medal[df_medal.columns[0]].max(), 
-                step = 2,
-                dots=True, 
-                value=[
-                    df_medal[df_medal.columns[0]].min(), 
-                    df_medal[df_medal.columns[0]].max()
-                ],
-                marks = slider_marks
-            ),
-        ]),
-    ], className='mt-4'),
-
-    # 2nd Title, for second figure
-    dbc.Card([
-        dbc.CardBody(html.H1("Top statistics for Canada",
-            className='text-primary-m-4'
-        ))
-    ], className='mt-5'),
-
-    # 2 columns
-    dbc.Row([
-        # 1st with dropdown menu
-        dbc.Col([
-            html.H3('Choose a statistic', className = 'm-2'),
-            dcc.Dropdown(
-                id = 'attribute-dropdown',
-                className = 'm-2',
-                value = "Sport",
-                options = attribute_options_dropdown
-            ),
-        ], lg='8', xl='2'),
-        # 2nd with figure
-        dbc.Col([
-            dcc.Graph(
-                id='top10-graph',
-                className=''
-            ),
-        ])
-    ], className='mt-4'),
-
-    # 3rd title, for histograms
-    dbc.Card([
-        dbc.CardBody(html.H1("Athlete statistics",
-            className='text-primary-m-4'
-        ))
-    ]),
-
-    # two columns
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
+        # 2 columns
+        dbc.Row([
             # 1st with dropdown menu
-                html.H3('Choose a gender', className = 'm-2'),
-                dcc.RadioItems(
-                    id='gender-picker-radio', 
-                    className='m-2',
-                    value="Both",
-                    options=gender_options,
-                    labelStyle={'display': 'block'}
+            dbc.Col([
+                html.H3('Choose a statistic', className = 'm-2'),
+                dcc.Dropdown(
+                    id = 'attribute-dropdown',
+                    className = 'm-2',
+                    value = "Sport",
+                    options = attribute_options_dropdown
                 ),
+            ], lg='8', xl='2'),
+            # 2nd with figure
+            dbc.Col([
+                dcc.Graph(
+                    id='top10-graph',
+                    className=''
+                ),
+            ])
+        ], className='mt-4'),
+
+        # 3rd title, for histograms
+        dbc.Card([
+            dbc.CardBody(html.H1("Athlete statistics",
+                className='text-primary-m-4'
+            ))
+        ]),
 
-                html.H3('Choose a statistic', className = 'm-2'),
-                dcc.RadioItems(
-                    id='athlete-radio', 
-                    className='m-2',
-                    value="Age",
-                    options=athlete_options,
-                    labelStyle={'display': 'block'}
+        # two columns
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                # 1st with dropdown menu
+                    html.H3('Choose a gender', className = 'm-2'),
+                    dcc.RadioItems(
+                        id='gender-picker-radio', 
+                        className='m-2',
+                        value="Both",
+                        options=gender_options,
+                        labelStyle={'display': 'block'}
+                    ),
+
+                    html.H3('Choose a statistic', className = 'm-2'),
+                    dcc.RadioItems(
+                        id='athlete-radio', 
+                        className='m-2',
+                        value="Age",
+                        options=athlete_options,
+                        labelStyle={'display': 'block'}
+                    ),
+                ], className='mt-1'),
+            ], lg='8', xl='3'),
+            # 2nd with figure
+            dbc.Col([
+                dcc.Graph(
+                    id='athlete-graph',
+                    className=''
                 ),
-            ], className='mt-1'),
-        ], lg='8', xl='3'),
-        # 2nd with figure
-        dbc.Col([
-            dcc.Graph(
-                id='athlete-graph',
-                className=''
-            ),
-        ])
-    ], className='mt-4'),
-])
+            ])
+        ], className='mt-4'),
+    ])
+
+
+app.layout = serve_layout
+
 
 @app.callback(
     Output("medals-graph", "figure"),
@@ -250,7 +230,7 @@ def update_graph(medal,time_index):
     """
 
     # Save number of medals per year
-    df_medal = af.count_medals_n(df, "Year", "Season")
+    df_medal = af.count_medals_n(data.canada, "Year", "Season")
 
     # Set time range
     dff = df_medal[
@@ -268,8 +248,8 @@ def update_graph(medal,time_index):
         labels={"value":"Number medals", "variable":"Medal"}
     )
 
-    for data in fig.data:
-        data["width"]= 0.5
+    for bar in fig.data:
+        bar["width"]= 0.5
     # when user choose a time_index to a small range, t.ex, 5 years,
     # the bar width is so large that spread to the year before and the year after
     # the bar width need to be smaller
@@ -287,7 +267,7 @@ def update_graph(chosen_attribute):
     Figure with top-best for Canada
     """
     # Update df_medal after what is chosen
-    df_top = af.count_medals_n(df, chosen_attribute)
+    df_top = af.count_medals_n(data.canada, chosen_attribute)
 
     # Sort by attribute and extract top 10
     df_top = df_top.sort_values("Total", ascending=False)
@@ -316,6 +296,7 @@ def update_graph(athlete_attribute, athlete_gender):
     """
 
     # Update figure (according to chosen gender)
+    df = data.canada
     if athlete_gender == "Both":
         fig = px.histogram(df, x=athlete_attribute)
     else:
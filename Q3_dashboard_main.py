@@ -15,15 +15,37 @@ For more details on building multi-page Dash applications, check out the Dash
 documentation: https://dash.plot.ly/urls
 """
 
-import pandas as pd
+import functools
+import json
+import os
 
 import dash
 import dash_bootstrap_components as dbc
-from dash import Input, Output, dcc, html
-
-import plotly_express as px
+from dash import Input, Output, Patch, State, ctx, dcc, html
+from dash.exceptions import PreventUpdate
+import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
 
 import analyze_functions as af
+import clientside_medals
+from callback_cache import init_client_cookie, single_flight
+from dashboard_options import (
+    all_athletes_options_radio, athlete_options, attr_dict, attribute_options_dropdown,
+    gender_options, medal_list, medal_options, physique_options, season_options, unit_dict
+)
+from data_context import RELOAD_INTERVAL, DataProxy, shared_manager
+import geo_assets
+import http_cache
+import medals_api
+import profiling
+import shared_server
+import startup
+
+# plotly express is imported on first use: 80-110 ms of the about 1.3 s
+# import in lazy startup mode (python startup.py). dash imports plotly and
+# plotly.graph_objects itself, so they are not deferred, and dashboards.py
+# gains nothing, Q3_J_dashboard and Q3_Y_dashboard_world import plotly express
+px = startup.lazy_import("plotly_express")
 
 
 # Set overall settings
@@ -35,7 +57,9 @@ app = dash.Dash(
             name="viewport", 
             content="width=device-width, initial-scale=1.0"
         )
-    ], suppress_callback_exceptions=True
+    ], suppress_callback_exceptions=True,
+    # mounted on /main/ of the shared server by dashboards.py
+    **shared_server.dash_options(__name__)
 )
 # when suppress_callback_exceptions = False, error message: ID not found in layout
 # If you are assigning callbacks to components that are
@@ -84,9 +108,9 @@ sidebar = html.Div(
             className="lead"
         ),
         dbc.Nav([
-                dbc.NavLink("Canada medals", href="/page-1", active="exact"),
-                dbc.NavLink("Canada statistics", href="/page-2", active="exact"),
-                dbc.NavLink("Sport statistics", href="/page-3", active="exact"),
+                dbc.NavLink("Canada medals", href=app.get_relative_path("/page-1"), active="exact"),
+                dbc.NavLink("Canada statistics", href=app.get_relative_path("/page-2"), active="exact"),
+                dbc.NavLink("Sport statistics", href=app.get_relative_path("/page-3"), active="exact"),
         ], vertical=True, pills=True),
     ],
     style=SIDEBAR_STYLE,
@@ -96,107 +120,96 @@ content = html.Div(id="page-content", style=CONTENT_STYLE)
 app.layout = html.Div([dcc.Location(id="url"), sidebar, content])
 
 
-# Import data
-df_orig = pd.read_csv("data/canada.csv")
-athlete_regions = pd.read_csv("data/athlete_regions.csv")
-athlete_iso = pd.read_csv("data/athlete_iso.csv").iloc[:, 1:]
-noc_iso = pd.read_csv("data/noc_iso.csv").iloc[:, 1:]
+# Data, the files are read on first use or by warm_up() (data_context.py).
+# With OLYMPICS_RELOAD_INTERVAL set, changed files are loaded and warmed up
+# in the background and then swapped in; data is the version the current
+# request started with. The other dashboards in this process share it
+data_manager = shared_manager("data/")
+data_manager.add_warm_up(lambda: warm_up())
+data = DataProxy(data_manager)
+data_manager.init_server(server)
+
 
+def data_version():
+    return data.fingerprint
 
-# Settings for Canada statistics
-# Medal options
-medal_list = "Gold Silver Bronze Total".split()
-medal_options = [{'label': medal, 'value': medal} for medal in medal_list]
 
-# Medal-Time slider options 
-slider_marks = {
-    str(year): str(year) for year in range(
-        df_orig["Year"].min(), df_orig["Year"].max(), 10
+# ETags of the callback responses follow the data files
+http_cache.init_http_cache(server, data_version)
+
+# Browsers get a client id cookie, for the popularity counts of the inputs
+init_client_cookie(server)
+
+# Read-only API with the numbers behind the charts, /api/medals
+server.register_blueprint(
+    medals_api.create_blueprint(
+        lambda: data.athlete_star, version=data_version,
+        partitions=lambda: data.athlete_partitions
     )
-}
+)
 
-# Attribute dropdown options
-attr_dict = {
-    'Sport':'Sport', 
-    'Event':'Sport event', 
-    'Games':'Year & Season',
-    'Season':'Season', 
-    'Name':'Athlete', 
-    'Sex':'Athlete gender', 
-    'Age':'Athlete age',
-    'City':'City'
-}
-attribute_options_dropdown = [
-    {'label':name, 'value': attribute} 
-    for attribute, name in attr_dict.items()
-]
+# World map geometry from our own server, when bundled in data/topojson/
+geo_assets.init_geo_assets(server)
+profiling.init_profiling(server)
 
+# Changes which keep the layout of a figure (e.g. the time slider) are
+# answered with a Patch of the changed arrays and titles instead of a new
+# figure (OLYMPICS_PATCH_UPDATES=0: always whole figures)
+PATCH_UPDATES = os.environ.get("OLYMPICS_PATCH_UPDATES", "1") != "0"
 
-# Athletes dropdown options
-gender_options = [
-    {'label':'Both', 'value':'Both'},
-    {'label':'Female', 'value':'F'},
-    {'label':'Male', 'value':'M'}
-]
-athlete_dict = {
-    'Sex':'Gender',
-    'Age':'Age',
-    'Height':'Height',
-    'Weight':'Weight'
-}
-unit_dict = {
-    'Sex':'Gender',
-    'Age':'Age (years)',
-    'Height':'Height (centimetres)',
-    'Weight':'Weight (kilograms)'
+# Geometry resolution per map: 110 (simplified) or 50 (detailed),
+# the animated map redraws often so it gets the simplified one
+map_resolution = {
+    "sum-medals-map": 50,
+    "medals-graph-world": 110,
 }
 
-athlete_options = [
-    {'label':name, 'value': attribute} 
-    for attribute, name in athlete_dict.items()
-]
+# The options and labels are in dashboard_options.py, shared with the other dashboards
 
-# Set initial dataframe for figure1, medal-time-figure
-df_medal = af.count_medals_n(df_orig, "Year")
+# Settings for international data
 
+# Region dropdown: at most this many regions are sent per search
+max_region_options = 20
 
-# Settings for international data
-# Set initial settings
-
-# Sport dropdown
-sport_list = athlete_regions['Sport'].unique().tolist()
-sport_list.append("All Sports")
-sport_list.sort()
-sport_options_dropdown = [
-    {'label':sport, 'value': sport} 
-    for sport in sport_list
-]
+# Top-10 lookups for the bar charts, built once with the data
+def build_top_indexes():
+    """
+    Gives back the top-10 indexes:
+        "attributes": Canada top statistics per (attribute, medal),
+        "countries": countries per (sport, medal)
+        "country_years": country-years per (sport, medal)
+    """
+    df_orig = data.canada
 
-# Region dropdown
-athlete_regions = athlete_regions[athlete_regions['region'].notna()]
-region_list = athlete_regions['region'].unique().tolist()
-region_list.append("All regions")
-region_list.sort()
-region_options_dropdown = [
-    {'label':country, 'value': country} 
-    for country in region_list
-]
+    top_attributes = {}
+    for attribute in attr_dict:
+        df_attribute = af.count_medals_n(df_orig, attribute)
+        for (medal,), df_top in af.top_n_index(df_attribute, []).items():
+            top_attributes[(attribute, medal)] = df_top
 
-all_athletes_options = ["Yes", "No"]
-all_athletes_options_radio = [
-    {'label':choice, 'value': choice} 
-    for choice in all_athletes_options
-]
+    # Sum over all years (-World-1) and per year (-World-2), shared with the
+    # world dashboard
+    return {"attributes": top_attributes, **data.world_top_indexes}
+
+
+def top_index(name):
+    return data.cached("top_indexes", build_top_indexes)[name]
 
 
 # Start dashboard
-@app.callback(
-    Output("page-content", "children"), 
-    [Input("url", "pathname")]
-)
-def render_page_content(pathname):
+def page_layout(pathname):
 
     if pathname == "/page-1":
+        # Set initial dataframe for figure1, medal-time-figure
+        df_medal = af.count_medals_n(data.canada, "Year")
+
+        # Medal-Time slider options 
+        slider_marks = {
+            str(year): str(year) for year in range(
+                data.canada["Year"].min(), data.canada["Year"].max(), 10
+            )
+        }
+
         return [
             # Main Title
             dbc.Card([
@@ -264,6 +277,8 @@ def render_page_content(pathname):
                     ),
                 ]),
             ], className='mt-4'),
+            # all medal types of medals-graph, when switched in the browser
+            dcc.Store(id="canada-medal-store"),
         ]
 
     # Canada statistiscs
@@ -340,6 +355,12 @@ def render_page_content(pathname):
 
     # Global statistics
     elif pathname == "/page-3":
+        # Sport dropdown
+        sport_options_dropdown = [
+            {'label':sport, 'value': sport} 
+            for sport in data.sport_list
+        ]
+
         return [
              # the first section
             dbc.Card([
@@ -380,9 +401,24 @@ def render_page_content(pathname):
                 ], xs="12", sm="12", md="12", lg='4', xl="3"),
             ]),
 
+            # crossfilter: click a country or box-select athletes to filter the other figures
+            dbc.Row(className='mt-2', children=[
+                dbc.Col(
+                    html.P(id="selection-text", className="mt-1"),
+                    xs="12", md="8", xl={"size": 6, "offset": 1}
+                ),
+                dbc.Col(
+                    dbc.Button(
+                        "Clear selection", id="clear-selection",
+                        color="secondary", size="sm"
+                    ),
+                    xs="12", md="4", xl="2"
+                ),
+            ]),
+
             dbc.Row([
                 dbc.Col([
-                    dcc.Graph(id="sum-medals-map"),
+                    dcc.Graph(id="sum-medals-map", config=geo_assets.graph_config()),
                 ], lg={"size": "6", "offset": 0}, xl={"size": "6", "offset": 0}),
 
                 dbc.Col([
@@ -399,12 +435,17 @@ def render_page_content(pathname):
             ], className="mt-4"),
             dbc.Row([
                 dbc.Col([
-                    dcc.Graph(id="medals-graph-world"),
+                    dcc.Graph(id="medals-graph-world", config=geo_assets.graph_config()),
                 ], lg={"size": "6", "offset": 0}, xl={"size": "6", "offset": 0}),
 
                 dbc.Col([
                     dcc.Graph(id="highlights-graph-world"),
                 ], lg={"size": "6", "offset": 0}, xl={"size": "6", "offset": 0}),
+
+                # distinct athletes and countries, for the same sport and country
+                dbc.Col([
+                    dcc.Graph(id="participation-graph-world"),
+                ], lg={"size": "12", "offset": 0}, xl={"size": "12", "offset": 0}),
     
             # the 3rd section
             dbc.Card([
@@ -423,7 +464,10 @@ def render_page_content(pathname):
                             id = 'region-dropdown',
                             className = 'm-2',
                             value = "All regions",
-                            options = region_options_dropdown
+                            options = [
+                                {'label': "All regions", 'value': "All regions"}
+                            ],
+                            placeholder = "Type to search a region"
                         ),
                     ]),
                     dbc.Card([
@@ -455,28 +499,228 @@ def render_page_content(pathname):
                     ),
                 ],  lg={"size": "10", "offset": 0}, xl={"size": "10", "offset": 0})
             ], className='mt-4'),
+
+            # percentiles over the years, same sport and medal as above
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        html.H4('Choose a statistic', className = 'm-2'),
+                        dcc.RadioItems(
+                            id='bands-attribute-radio', 
+                            className='m-2',
+                            value="Height",
+                            options=physique_options,
+                            labelStyle={'display': 'block'}
+                        ),
+                    ]),
+                    dbc.Card([
+                        html.H4('Choose a gender', className = 'm-2'),
+                        dcc.RadioItems(
+                            id='bands-gender-radio', 
+                            className='m-2',
+                            value="Both",
+                            options=gender_options,
+                            labelStyle={'display': 'block'}
+                        ),
+                    ]),
+                ], lg='6', xl='2'),
+                dbc.Col([
+                    dcc.Graph(id='physique-bands-graph'),
+                ],  lg={"size": "10", "offset": 0}, xl={"size": "10", "offset": 0})
+            ], className='mt-4'),
+
+            # the 4th section
+            dbc.Card([
+                dbc.CardBody(html.H1("Medal table rank over time",
+                    className='card-title text-dark mx-3'
+                ))
+            ], className='mt-4'),
+
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        html.H4('Choose countries', className = 'm-2'),
+                        dcc.Dropdown(
+                            id = 'rank-countries-dropdown',
+                            className = 'm-2',
+                            value = ["Canada"],
+                            options = [
+                                {'label': "Canada", 'value': "Canada"}
+                            ],
+                            multi = True,
+                            placeholder = "Type to search countries"
+                        ),
+                    ]),
+                    dbc.Card([
+                        html.H4('Choose a season', className = 'm-2'),
+                        dcc.RadioItems(
+                            id='rank-season-radio', 
+                            className='m-2',
+                            value="Summer",
+                            options=season_options,
+                            labelStyle={'display': 'block'}
+                        ),
+                    ]),
+                ], lg='6', xl='2'),
+                dbc.Col([
+                    dcc.Graph(id='rank-graph'),
+                ],  lg={"size": "10", "offset": 0}, xl={"size": "10", "offset": 0})
+            ], className='mt-4'),
+
+            # the 5th section
+            dbc.Card([
+                dbc.CardBody(html.H1("Athlete profile",
+                    className='card-title text-dark mx-3'
+                ))
+            ], className='mt-4'),
+
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        html.H4('Search an athlete', className = 'm-2'),
+                        dcc.Dropdown(
+                            id = 'athlete-search-dropdown',
+                            className = 'm-2',
+                            options = [],
+                            placeholder = "Type a name, e.g. phelps"
+                        ),
+                    ]),
+                ], lg='6', xl='3'),
+                dbc.Col(
+                    html.Div(id='athlete-profile'),
+                    lg={"size": "10", "offset": 0}, xl={"size": "9", "offset": 0}
+                )
+            ], className='mt-4'),
         ]),
-            # stores an intermediate value on the clients browser for sharing between callbacks
-            dcc.Store(id="filtered-df")
+            # all medal types of the world figures, when switched in the browser
+            dcc.Store(id="world-medal-store"),
+            # crossfilter selections: a country, and athletes (attribute values)
+            dcc.Store(id="selected-country"),
+            dcc.Store(id="selected-athletes"),
         ]
 
 
+# The page layouts only change with the data, so every page is built once
+# per data version and kept as plain json (instead of a component tree
+# that has to be built and serialized on every navigation)
+@functools.lru_cache(maxsize=16)
+def serialized_page_layout(pathname, data_version):
+    return json.loads(to_json_plotly(page_layout(pathname)))
+
+
+@app.callback(
+    Output("page-content", "children"), 
+    [Input("url", "pathname")]
+)
+def render_page_content(pathname):
+    # the page without the path the app is mounted on
+    pathname = "/" + (app.strip_relative_path(pathname) or "")
+    return serialized_page_layout(pathname, data.fingerprint)
+
+
+# The region dropdown gets its options while the user types, instead of
+# sending all regions with the page
+@app.callback(
+    Output("region-dropdown", "options"),
+    Input("region-dropdown", "search_value"),
+    State("region-dropdown", "value")
+)
+def update_region_options(search_value, chosen_region):
+    if not search_value:
+        raise PreventUpdate
+    search_value = search_value.lower()
+    options = [
+        {'label':country, 'value': country}
+        for country in data.region_list
+        if search_value in country.lower()
+    ][:max_region_options]
+
+    # the chosen region has to stay among the options to be shown
+    if chosen_region is not None and \
+            chosen_region not in [option["value"] for option in options]:
+        options.append({'label': chosen_region, 'value': chosen_region})
+    return options
+
+
+
+# The countries of the rank graph too, the chosen countries stay
+@app.callback(
+    Output("rank-countries-dropdown", "options"),
+    Input("rank-countries-dropdown", "search_value"),
+    State("rank-countries-dropdown", "value")
+)
+def update_rank_country_options(search_value, chosen_countries):
+    if not search_value:
+        raise PreventUpdate
+    search_value = search_value.lower()
+    options = [
+        {'label': country, 'value': country}
+        for country in data.ranked_countries
+        if search_value in country.lower()
+    ][:max_region_options]
+
+    # the chosen countries have to stay among the options to be shown
+    values = [option["value"] for option in options]
+    options += [
+        {'label': country, 'value': country}
+        for country in chosen_countries or [] if country not in values
+    ]
+    return options
+
+
+# The athlete search gets its options while the user types, from the
+# prefix index over the names
+@app.callback(
+    Output("athlete-search-dropdown", "options"),
+    Input("athlete-search-dropdown", "search_value"),
+    State("athlete-search-dropdown", "value")
+)
+def update_athlete_options(search_value, chosen_athlete):
+    if not search_value:
+        raise PreventUpdate
+    athlete_index = data.athlete_index
+    options = [
+        {'label': label, 'value': athlete_id}
+        for athlete_id, label in athlete_index.search(search_value, max_region_options)
+    ]
+
+    # the chosen athlete has to stay among the options to be shown
+    position = athlete_index.position(chosen_athlete) if chosen_athlete else None
+    if position is not None and chosen_athlete not in [option["value"] for option in options]:
+        options.append({'label': athlete_index.label(position), 'value': chosen_athlete})
+    return options
+
+
+@app.callback(
+    Output("athlete-profile", "children"),
+    Input("athlete-search-dropdown", "value")
+)
+def update_athlete_profile(athlete_id):
+    if athlete_id is None:
+        return html.P("Search an athlete to see the career over all Games")
+
+    profile, df_events = data.athlete_index.profile(athlete_id)
+    if profile is None:
+        return html.P("Unknown athlete")
+
+    return [
+        html.H3(profile["Name"], className='m-2'),
+        html.P(
+            f"{profile['NOC']}, {profile['Sports']}: {profile['Games']} Games "
+            f"({profile['First Games']} - {profile['Last Games']}), "
+            f"{profile['Gold']} gold, {profile['Silver']} silver, "
+            f"{profile['Bronze']} bronze medals",
+            className='m-2'
+        ),
+        dbc.Table.from_dataframe(df_events, striped=True, bordered=False, hover=True, size="sm"),
+    ]
 
 
 # Callbacks and functions
 
 # Canada, page1-3
 # -Canada-1
-@app.callback(
-    Output("medals-graph", "figure"),
-    Output("gold-medals", "children"),
-    Output("silver-medals", "children"),
-    Output("bronze-medals", "children"),
-    Output("total-medals", "children"),
-    Input("medal-picker-radio", "value"),
-    Input("time-slider", "value")
-)
-def update_graph(medal,time_index):
+def medals_per_year(medal, time_index):
     """
     time_index is a list of two points choosen by user
     the left point refers to time_index[0]
@@ -493,31 +737,119 @@ def update_graph(medal,time_index):
     """
 
     # Save number of medals per year
-    df_medal = af.count_medals_n(df_orig, "Year", "Season")
+    df_medal = canada_medals_year()
 
-    # Set time range
-    dff = df_medal[
-        (df_medal[df_medal.columns[0]] >= time_index[0]) & 
-        (df_medal[df_medal.columns[0]] <= time_index[1])
-    ]
+    # Set time range: only the Games in it are read (year_partitions.py)
+    dff = canada_medals_range(time_index)
     
     # Save total number of medals shown
     number_medals = [dff[medal].sum() for medal in medal_list]
     
-    # Update figure
+    # Update figure, built on all years so there is always one bar trace
+    # per season (in the same order), then cut to the time range
     fig = px.bar(
-        dff, x="Year", y=medal, color="Season"
+        df_medal, x="Year", y=medal, color="Season"
     )
     fig.update_layout(yaxis_title = "Number of medals")
 
-    for data in fig.data:
-        data["width"]= 0.5
+    for bar, (x, y) in zip(fig.data, season_bars(dff, medal)):
+        bar["x"], bar["y"] = x, y
+        bar["width"]= 0.5
     # when user choose a time_index to a small range, t.ex, 5 years,
     # the bar width is so large that spread to the year before and the year after
     # the bar width need to be smaller
     # http://www.programshelp.com/help/python/Increase__bar_width___px_bar_.html
 
-    return fig, number_medals[0], number_medals[1], number_medals[2], number_medals[3]
+    return fig, number_medals, dff
+
+
+def canada_medals_year():
+    """Canadian medals per year and season"""
+    return data.cached(
+        "canada_medals_year", lambda: data.canada_partitions.medals(None, None, "Year", "Season")
+    )
+
+
+def canada_medals_range(time_index):
+    """Canadian medals per year and season, of the Games in the time range"""
+    return data.canada_partitions.medals(time_index[0], time_index[1], "Year", "Season")
+
+
+def season_bars(dff, medal):
+    """x (years) and y (medals) of the bar trace of every season, in trace order"""
+    # plotly express makes the traces in the order the seasons first appear
+    seasons = canada_medals_year()["Season"].unique()
+    return [
+        (dff.loc[dff["Season"] == season, "Year"].to_numpy(),
+         dff.loc[dff["Season"] == season, medal].to_numpy())
+        for season in seasons
+    ]
+
+
+@single_flight("Canada-1", version=data_version, inputs=2)
+def medals_graph_update(medal, time_index, patch):
+    """
+    Figure (or with patch, a Patch of the bars of the figure in the browser)
+    and numbers of medals for -Canada-1
+    """
+    if not patch:
+        fig, number_medals, _ = medals_per_year(medal, time_index)
+        return fig, number_medals
+
+    # the time range only changes the bars
+    dff = canada_medals_range(time_index)
+    fig = Patch()
+    for i, (x, y) in enumerate(season_bars(dff, medal)):
+        fig["data"][i]["x"] = x
+        fig["data"][i]["y"] = y
+    return fig, [dff[medal].sum() for medal in medal_list]
+
+
+if not clientside_medals.ENABLED:
+    @app.callback(
+        Output("medals-graph", "figure"),
+        Output("gold-medals", "children"),
+        Output("silver-medals", "children"),
+        Output("bronze-medals", "children"),
+        Output("total-medals", "children"),
+        Input("medal-picker-radio", "value"),
+        Input("time-slider", "value")
+    )
+    def update_graph(medal,time_index):
+        patch = PATCH_UPDATES and ctx.triggered_id == "time-slider"
+        fig, number_medals = medals_graph_update(medal, time_index, patch)
+        return fig, number_medals[0], number_medals[1], number_medals[2], number_medals[3]
+
+else:
+    # All medal types are sent with the figure, the medal picker only
+    # switches between them in the browser
+    @app.callback(
+        Output("canada-medal-store", "data"),
+        Output("gold-medals", "children"),
+        Output("silver-medals", "children"),
+        Output("bronze-medals", "children"),
+        Output("total-medals", "children"),
+        Input("time-slider", "value")
+    )
+    @single_flight("Canada-1-series", version=data_version)
+    def update_graph(time_index):
+        fig, number_medals, dff = medals_per_year(clientside_medals.BASE_MEDAL, time_index)
+
+        # one bar trace per season
+        traces = {
+            medal: [
+                {"y": dff.loc[dff["Season"] == trace.name, medal].tolist()}
+                for trace in fig.data
+            ] for medal in medal_list
+        }
+        spec = clientside_medals.medal_spec(fig, traces)
+
+        return [spec], number_medals[0], number_medals[1], number_medals[2], number_medals[3]
+
+    clientside_medals.register_medal_switch(
+        app, [Output("medals-graph", "figure")],
+        "medal-picker-radio", "canada-medal-store"
+    )
 
 
 # -Canada-2
@@ -526,16 +858,13 @@ def update_graph(medal,time_index):
     Output("top10-graph", "figure"),
     Input("attribute-dropdown", "value"),
 )
+@single_flight("Canada-2", version=data_version)
 def update_graph(chosen_attribute):
     """
     Figure with top-best for Canada
     """
-    # Update df_medal after what is chosen
-    df_top = af.count_medals_n(df_orig, chosen_attribute)
-
-    # Sort by attribute and extract top 10
-    df_top = df_top.sort_values("Total", ascending=False)
-    df_top = df_top.head(10)
+    # Top 10 by total medals, from the precomputed index
+    df_top = top_index("attributes")[(chosen_attribute, "Total")]
 
     # Update figure
     fig = px.bar(
@@ -560,10 +889,25 @@ def update_graph(chosen_attribute):
     Input("gender-picker-radio", "value")
 )
 def update_graph(athlete_attribute, athlete_gender):
+    # a new gender only changes the values of the histogram
+    patch = PATCH_UPDATES and ctx.triggered_id == "gender-picker-radio"
+    return athlete_histogram(athlete_attribute, athlete_gender, patch)
+
+
+@single_flight("Canada-3", version=data_version, inputs=2)
+def athlete_histogram(athlete_attribute, athlete_gender, patch):
     """
     Figure with statistics for athletes
     """
 
+    df_orig = data.canada
+
+    if patch:
+        df_gender = df_orig if athlete_gender == "Both" else df_orig[df_orig["Sex"] == athlete_gender]
+        fig = Patch()
+        fig["data"][0]["x"] = df_gender[athlete_attribute].dropna().to_numpy()
+        return fig
+
     # Update figure (according to chosen gender)
     if athlete_gender == "Both":
         fig = px.histogram(df_orig, x=athlete_attribute)
@@ -585,46 +929,117 @@ def update_graph(athlete_attribute, athlete_gender):
 # -Global-
 # Worldwide pages, 4-6
 
-# when something changes in the input component, the code in function below will run and update the output component
-# the components are connected through their id
-@app.callback(
-    Output("filtered-df", "data"), 
-    Input("sport-dropdown-world", "value")
-)
+# The page is one computation graph: the sport gives one intermediate
+# (medals per country and year), which all four figures are built from in
+# one callback. Before, the medal figures listened both to the dropdown and
+# to a dcc.Store filled from it, so one change could render them twice.
 def filter_df(sport):
     """
-    Filters the dataframe and stores it intermediary for usage in callbacks
+    Filters the dataframe, shared intermediate for the world figures,
+    counted once per sport and data version (DataContext.world_medals)
     Returns:
-        a dataframe for chosen sport
+        df_years: medals per country and year for chosen sport
+        df_countries: medals per country summed over the years
     """
+    return data.world_medals(sport)
 
-    # Data for all sports
-    if sport=="All Sports":
-        df = af.count_medals_n(athlete_iso, "Country", "ISO", "Year")
-    # Data for chosen sport
+
+# Crossfilter: a country clicked in sum-medals-map or sum-medals-top10,
+# and athletes box-selected in athlete-distribution-graph, filter the
+# other figures. The selections are combined on the bitmap index.
+@app.callback(
+    Output("selected-country", "data"),
+    Output("selected-athletes", "data"),
+    Output("selection-text", "children"),
+    Input("sum-medals-map", "clickData"),
+    Input("sum-medals-top10", "clickData"),
+    Input("athlete-distribution-graph", "selectedData"),
+    Input("clear-selection", "n_clicks"),
+    State("athlete-radio-world", "value"),
+    State("selected-country", "data"),
+    State("selected-athletes", "data"),
+)
+def update_selection(map_click, top10_click, athlete_selection, clear_clicks,
+                     athlete_attribute, country, athletes):
+    trigger = ctx.triggered_id
+
+    if trigger == "clear-selection":
+        country, athletes = None, None
+    elif trigger == "sum-medals-map" and map_click:
+        country = map_click["points"][0]["hovertext"]
+    elif trigger == "sum-medals-top10" and top10_click:
+        country = top10_click["points"][0]["y"]
+    elif trigger == "athlete-distribution-graph":
+        points = (athlete_selection or {}).get("points", [])
+        athletes = {
+            "attribute": athlete_attribute,
+            "values": sorted({point["x"] for point in points}),
+        } if points else None
+
+    # Number of medals in the selection, counted on the bitmaps
+    index = data.athlete_bitmaps
+    bitmap = selection_bitmap(index, "All Sports", country, athletes)
+    if country is None and athletes is None:
+        text = "Click a country or box-select athletes to filter the figures"
     else:
-        df = af.count_medals_n(athlete_iso, "Country", "ISO", "Year", "Sport")
-        df = df[df["Sport"]==sport]
+        parts = [country] if country else []
+        if athletes:
+            parts.append(
+                f"{athletes['attribute']} {athletes['values'][0]}-{athletes['values'][-1]}"
+            )
+        text = f"Selected: {', '.join(parts)} ({index.count(bitmap)} medals)"
+
+    return country, athletes, text
+
+
+def selection_bitmap(index, sport, country=None, athletes=None):
+    """Bitmap of the medal rows for chosen sport and selection"""
+    bitmap = index.notna("Medal")
+    if sport != "All Sports":
+        bitmap = bitmap & index.equals("Sport", sport)
+    if country:
+        bitmap = bitmap & index.equals("Country", country)
+    if athletes:
+        bitmap = bitmap & index.isin(athletes["attribute"], athletes["values"])
+    return bitmap
+
+
+def world_data(sport, country=None, athletes=None):
+    """
+    Medals per country and year (df_years) and per country (df_countries)
+    for the world figures, crossfiltered by the selection
+    Returns:
+        df_years, df_countries,
+        top10 per medal of the countries and of the country-years
+    """
+    if country is None and athletes is None:
+        df_years, df_countries = filter_df(sport)
+        top_countries = {
+            medal: top_index("countries")[(sport, medal)] for medal in medal_list
+        }
+        top_country_years = {
+            medal: top_index("country_years")[(sport, medal)] for medal in medal_list
+        }
+        return df_years, df_countries, top_countries, top_country_years
+
+    index = data.athlete_bitmaps
+    rows = index.rows(selection_bitmap(index, sport, country, athletes))
+    df_years = data.athlete_star.count_medals("Country", "ISO", "Year", rows=rows)
+    df_years = df_years.sort_values(by=["Year", "ISO"])
+    df_countries = df_years.groupby(["Country", "ISO"])[medal_list].sum().reset_index()
+
+    top_countries = {
+        medal: df_top for (medal,), df_top in af.top_n_index(df_countries, []).items()
+    }
+    top_country_years = {
+        medal: df_top for (medal,), df_top in af.top_n_index(df_years, []).items()
+    }
+    return df_years, df_countries, top_countries, top_country_years
 
-    df = df.sort_values(by=["Year", "ISO"])
-    
-    return df.to_json()
 
 # -World-1
 # World map, medals per sport and per country
-@app.callback(
-    Output("sum-medals-map", "figure"),
-    Output("sum-medals-top10", "figure"),
-    Input("filtered-df", "data"),
-    Input("sport-dropdown-world", "value"),
-    Input("medal-radio-world", "value"),
-)
-def update_graph(json_df, sport, medal):
-    # Extract data (country and medals)
-    df = pd.read_json(json_df)
-    dff= df.groupby(["Country", "ISO"]).sum().reset_index()
-    dff = dff.loc[:, ["Country", "ISO", "Gold", "Silver", "Bronze", "Total"]]
-   
+def sum_medals_figures(dff, top10_all, sport, medal):
     # Update figure
     fig1 = px.choropleth(
         dff, locations="ISO",
@@ -637,10 +1052,8 @@ def update_graph(json_df, sport, medal):
     )
     
     fig1["layout"].pop("updatemenus")
+    fig1.update_geos(resolution=map_resolution["sum-medals-map"])
 
-    # Extract top ten countries for a bar plot    
-    temp = dff.sort_values(medal, ascending=False)
-    top10_all = temp.head(10)
   
     # Update figure with top10 countries per sport
     fig2 = px.bar(
@@ -655,16 +1068,7 @@ def update_graph(json_df, sport, medal):
 
 # -World-2
 # World-map figure over years
-@app.callback(
-    Output("medals-graph-world", "figure"),
-    Output("highlights-graph-world", "figure"),
-    Input("filtered-df", "data"),
-    Input("sport-dropdown-world", "value"),
-    Input("medal-radio-world", "value")
-)
-def update_graph(json_df, sport, medal):
-
-    dff = pd.read_json(json_df)
+def medals_over_years_figures(dff, top10_all, sport, medal):
     fig = px.choropleth(
         dff, locations="ISO",
         color=medal,
@@ -677,11 +1081,9 @@ def update_graph(json_df, sport, medal):
     )
 
     fig["layout"].pop("updatemenus")
+    fig.update_geos(resolution=map_resolution["medals-graph-world"])
 
     # Highlights figure, with top ten
-    temp = dff.sort_values(medal, ascending=False)
-    top10_all = temp.head(10)
- 
     fig2 = px.bar(
         top10_all, y="Country", x=medal, color="Year",
         title=f"Hightlights in {sport}: top ten {medal} medals"
@@ -692,6 +1094,152 @@ def update_graph(json_df, sport, medal):
     return fig, fig2
 
 
+# -World-1 and -World-2, in one pass
+world_outputs = [
+    Output("sum-medals-map", "figure"),
+    Output("sum-medals-top10", "figure"),
+    Output("medals-graph-world", "figure"),
+    Output("highlights-graph-world", "figure"),
+]
+
+if not clientside_medals.ENABLED:
+    @app.callback(
+        *world_outputs,
+        Input("sport-dropdown-world", "value"),
+        Input("medal-radio-world", "value"),
+        Input("selected-country", "data"),
+        Input("selected-athletes", "data"),
+    )
+    @single_flight("World-1-2", version=data_version)
+    def update_world_graphs(sport, medal, country, athletes):
+        # the map and its top 10 are where countries are chosen, so only
+        # the athlete selection filters them
+        df_years, _, _, top_country_years = world_data(sport, country, athletes)
+        _, df_countries, top_countries, _ = world_data(sport, None, athletes)
+
+        fig_map, fig_top10 = sum_medals_figures(df_countries, top_countries[medal], sport, medal)
+        fig_map_years, fig_highlights = medals_over_years_figures(
+            df_years, top_country_years[medal], sport, medal
+        )
+
+        return fig_map, fig_top10, fig_map_years, fig_highlights
+
+else:
+    # All medal types are sent with the figures, the medal radio only
+    # switches between them in the browser
+    @app.callback(
+        Output("world-medal-store", "data"),
+        Input("sport-dropdown-world", "value"),
+        Input("selected-country", "data"),
+        Input("selected-athletes", "data"),
+    )
+    @single_flight("World-1-2-series", version=data_version)
+    def update_world_graphs(sport, country, athletes):
+        # the map and its top 10 are where countries are chosen, so only
+        # the athlete selection filters them
+        df_years, _, _, top_country_years = world_data(sport, country, athletes)
+        _, df_countries, top_countries, _ = world_data(sport, None, athletes)
+        medal = clientside_medals.BASE_MEDAL
+
+        fig_map, fig_top10 = sum_medals_figures(df_countries, top_countries[medal], sport, medal)
+        fig_map_years, fig_highlights = medals_over_years_figures(
+            df_years, top_country_years[medal], sport, medal
+        )
+
+        # plotly express makes one animation frame per year, in this order
+        years = [df_year for _, df_year in df_years.groupby("Year", sort=False)]
+
+        color_countries = {
+            medal: [0, float(df_countries[medal].quantile(0.95))] for medal in medal_list
+        }
+        color_years = {
+            medal: [0, float(df_years[medal].quantile(0.95))] for medal in medal_list
+        }
+        specs = [
+            clientside_medals.medal_spec(
+                fig_map,
+                {medal: [{"z": df_countries[medal].tolist()}] for medal in medal_list},
+                color_range=color_countries
+            ),
+            clientside_medals.medal_spec(fig_top10, {
+                medal: [{
+                    "x": top_countries[medal][medal].tolist(),
+                    "y": top_countries[medal]["Country"].tolist(),
+                }] for medal in medal_list
+            }),
+            clientside_medals.medal_spec(
+                fig_map_years,
+                {medal: [{"z": years[0][medal].tolist()}] for medal in medal_list},
+                frames={
+                    medal: [[{"z": df_year[medal].tolist()}] for df_year in years]
+                    for medal in medal_list
+                },
+                color_range=color_years
+            ),
+            clientside_medals.medal_spec(fig_highlights, {
+                medal: [{
+                    "x": top_country_years[medal][medal].tolist(),
+                    "y": top_country_years[medal]["Country"].tolist(),
+                    "marker": {"color": top_country_years[medal]["Year"].tolist()},
+                }] for medal in medal_list
+            }),
+        ]
+        return specs
+
+    clientside_medals.register_medal_switch(
+        app, world_outputs, "medal-radio-world", "world-medal-store"
+    )
+
+
+# -World-participation
+# Distinct athletes and countries per year, from the HyperLogLog sketches
+# (hyperloglog.py). Box-selected athletes are not in the sketches, they
+# are counted exactly on the bitmap index
+@app.callback(
+    Output("participation-graph-world", "figure"),
+    Input("sport-dropdown-world", "value"),
+    Input("selected-country", "data"),
+    Input("selected-athletes", "data"),
+)
+@single_flight("World-participation", version=data_version)
+def update_participation_graph(sport, country, athletes):
+    if athletes:
+        index = data.athlete_bitmaps
+        bitmap = index.isin(athletes["attribute"], athletes["values"])
+        if sport != "All Sports":
+            bitmap = bitmap & index.equals("Sport", sport)
+        if country:
+            bitmap = bitmap & index.equals("Country", country)
+        df_rows = data.athlete_star.frame(["Year", "ID", "Country"], rows=index.rows(bitmap))
+        df_counts = df_rows.groupby("Year").agg(
+            Athletes=("ID", "nunique"), Countries=("Country", "nunique")
+        ).reset_index()
+        totals = [f"{df_rows['ID'].nunique()}", f"{df_rows['Country'].nunique()}"]
+    else:
+        sketches = data.participation_sketches
+        country = country or "All countries"
+        df_counts = sketches.per_year(sport, country)
+        totals = []
+        for target in ["athletes", "countries"]:
+            counter = sketches.query(target, sport, country=country)
+            # estimates are marked with ~
+            totals.append(f"{'' if counter.exact else '~'}{counter.count()}")
+    fig = go.Figure([
+        go.Scatter(x=df_counts["Year"], y=df_counts["Athletes"], mode="lines+markers",
+                   name="Athletes"),
+        go.Scatter(x=df_counts["Year"], y=df_counts["Countries"], mode="lines+markers",
+                   name="Countries", yaxis="y2"),
+    ])
+    fig.update_layout(
+        title = f"Participants in {sport}: {totals[0]} athletes from {totals[1]} countries",
+        xaxis_title = "Year",
+        yaxis = dict(title="Athletes", rangemode="tozero"),
+        yaxis2 = dict(title="Countries", overlaying="y", side="right", rangemode="tozero"),
+        title_x = 0.5,
+    )
+    return fig
+
+
 # -World-3
 # Figure athlete distribution for this chosen sport over age etc.
 @app.callback(
@@ -700,48 +1248,157 @@ def update_graph(json_df, sport, medal):
     Input("athlete-radio-world", "value"),
     Input("sport-dropdown-world", "value"),
     Input("medal-radio-world", "value"),
-    Input("total-athletes-radio", "value")
+    Input("total-athletes-radio", "value"),
+    Input("selected-country", "data"),
 )
-def update_graph(chosen_region, athlete_attribute, sport, medal, total_athletes):
-    
+def update_graph(chosen_region, athlete_attribute, sport, medal, total_athletes, country):
+    # only a new statistic changes the axes, the rest are new bars and title
+    patch = PATCH_UPDATES and ctx.triggered_id not in (None, "athlete-radio-world")
+    return athlete_distribution(
+        chosen_region, athlete_attribute, sport, medal, total_athletes, country, patch
+    )
+
+
+@single_flight("World-3", version=data_version, inputs=6)
+def athlete_distribution(chosen_region, athlete_attribute, sport, medal, total_athletes,
+                         country, patch):
     
-    # Update dataframe after chosen region
-    if chosen_region == "All regions" and sport=="All Sports":
-        df_sport = athlete_regions.copy()
-    elif chosen_region == "All regions" and sport!="All Sports":
-        df_sport = athlete_regions[athlete_regions["Sport"] == sport]
-    elif chosen_region != "All regions" and sport=="All Sports":
-        df_sport = athlete_regions[athlete_regions["region"] == chosen_region]
-    else:
-        df_sport = athlete_regions[athlete_regions["region"] ==chosen_region] 
-        df_sport = df_sport[df_sport["Sport"] == sport]
     
-    # medal
-    if total_athletes == "Yes":
-        df_athlete = df_sport.copy()
-    elif medal != "Total":
-        df_athlete = df_sport[df_sport["Medal"] == medal]
+    # Country chosen in the world map: count on the bitmap index
+    if country:
+        index = data.athlete_bitmaps
+        bitmap = index.equals("Country", country) & index.notna(athlete_attribute)
+        if sport != "All Sports":
+            bitmap = bitmap & index.equals("Sport", sport)
+        if total_athletes != "Yes":
+            medals = medal_list[:3] if medal == "Total" else [medal]
+            bitmap = bitmap & index.isin("Medal", medals)
+        athlete_counts = data.athlete_star.value_counts(athlete_attribute, rows=index.rows(bitmap))
+    # Count values in the database backend, or on the star schema
     else:
-        df_athlete = df_sport[
-            (df_sport["Medal"]=="Gold") | 
-            (df_sport["Medal"]=="Silver") | 
-            (df_sport["Medal"]=="Bronze")] 
+        filters = {}
+        if chosen_region != "All regions":
+            filters["region"] = chosen_region
+        if sport != "All Sports":
+            filters["Sport"] = sport
+        athlete_counts = data.region_counts(
+            athlete_attribute, None if total_athletes == "Yes" else medal, **filters
+        )
 
-    df_athlete = df_athlete[df_athlete[athlete_attribute].notna()]
+    title = f"{athlete_attribute} of {medal} medals winners and other athletes({total_athletes})"
+    if patch:
+        fig = Patch()
+        fig["data"][0]["x"] = athlete_counts.index.to_numpy()
+        fig["data"][0]["y"] = athlete_counts.to_numpy()
+        fig["layout"]["title"]["text"] = title
+        return fig
 
     # plot:
-    athlete_counts = df_athlete[athlete_attribute].value_counts()
-    fig = px.bar(athlete_counts, title=f"{athlete_attribute} of {medal} medals winners and other athletes({total_athletes})")
+    fig = px.bar(athlete_counts, title=title)
     fig.update_layout(
         xaxis_title = unit_dict[athlete_attribute],
         yaxis_title = "Frequency",
         title_x = 0.5, 
+        # box-select athletes for the crossfilter
+        dragmode = "select",
         #showlegend = False
     )
     
     return fig
 
 
+
+# -World-3-bands
+# Percentiles of age, height or weight per year, from the quantile sketches
+# (quantile_sketch.py) instead of the athlete rows
+@app.callback(
+    Output("physique-bands-graph", "figure"),
+    Input("bands-attribute-radio", "value"),
+    Input("bands-gender-radio", "value"),
+    Input("sport-dropdown-world", "value"),
+    Input("medal-radio-world", "value"),
+    Input("total-athletes-radio", "value"),
+)
+@single_flight("World-3-bands", version=data_version)
+def update_bands_graph(athlete_attribute, athlete_gender, sport, medal, total_athletes):
+    sexes = None if athlete_gender == "Both" else [athlete_gender]
+    if total_athletes == "Yes":
+        medals = None
+    else:
+        medals = medal_list[:3] if medal == "Total" else [medal]
+
+    df_bands = data.physique_sketches.percentile_bands(
+        athlete_attribute, (0.1, 0.25, 0.5, 0.75, 0.9), sport, sexes, medals
+    )
+    years = df_bands["Year"]
+
+    def band(upper, lower, name, color):
+        # the upper line, then the lower line filled up to it
+        return [
+            go.Scatter(x=years, y=df_bands[upper], mode="lines", line_width=0,
+                       showlegend=False, hoverinfo="skip"),
+            go.Scatter(x=years, y=df_bands[lower], mode="lines", line_width=0,
+                       fill="tonexty", fillcolor=color, name=name, hoverinfo="skip"),
+        ]
+
+    fig = go.Figure(
+        band(0.9, 0.1, "10th-90th percentile", "rgba(31, 119, 180, 0.2)")
+        + band(0.75, 0.25, "25th-75th percentile", "rgba(31, 119, 180, 0.4)")
+        + [go.Scatter(x=years, y=df_bands[0.5], mode="lines+markers", name="Median",
+                      line_color="rgb(31, 119, 180)", customdata=df_bands["Count"],
+                      hovertemplate="%{x}: %{y:.0f} (%{customdata} athletes)<extra></extra>")]
+    )
+    fig.update_layout(
+        title = f"{athlete_attribute} of {medal} medals winners and other athletes"
+                f"({total_athletes}) in {sport}, per year",
+        xaxis_title = "Year",
+        yaxis_title = unit_dict[athlete_attribute],
+        title_x = 0.5,
+    )
+    return fig
+
+
+# -World-4
+# Rank in the medal table of every Games, for the chosen countries
+@app.callback(
+    Output("rank-graph", "figure"),
+    Input("rank-countries-dropdown", "value"),
+    Input("rank-season-radio", "value"),
+)
+@single_flight("World-4", version=data_version)
+def update_rank_graph(countries, season):
+    df_ranks = data.medal_rankings.rank_history(countries or [], season)
+
+    fig = px.line(
+        df_ranks, x="Year", y="Rank", color="Country", markers=True,
+        title=f"Medal table rank in the {season} Games"
+    )
+    fig.update_layout(
+        # rank 1 on top
+        yaxis_autorange = "reversed",
+        title_x = 0.5,
+    )
+    return fig
+
+# Load the data and build the indexes before the first request, in a
+# background thread with OLYMPICS_LAZY_STARTUP=1
+def warm_up():
+    data.warm_up()
+    top_index("countries")
+    data.canada_partitions
+    data.athlete_partitions
+    data.medal_rankings
+    data.athlete_index
+    data.physique_sketches
+    data.participation_sketches
+
+startup.warm_up(warm_up)
+
+# Hot reload of the data files
+if RELOAD_INTERVAL:
+    data_manager.watch(RELOAD_INTERVAL)
+
+
 # Run server or debug mode?
 if __name__ == "__main__":
     app.run_server(debug=True)
@@ -3,18 +3,23 @@
 # Load libraries
 import pandas as pd
 
+from star_schema import StarSchema
+
 # Count medals function with arbitrary number of arguments
 def count_medals_n(df_orig, *arg):
     """
     Gives back number of medals groupby several attributes: *arg
 
     Input:
-        df_orig: DataFrame
+        df_orig: DataFrame, or StarSchema (counted on the integer codes)
         *arg: column to get number of "Medal"
     
     Returns:
         df_best: new DataFrame
     """
+    if isinstance(df_orig, StarSchema):
+        return df_orig.count_medals(*arg)
+
     # Remove all NaN (no medal won == NaN)
     df_medals = df_orig[df_orig['Medal'].notna()]
     
@@ -32,6 +37,9 @@ def count_medals_n(df_orig, *arg):
     args = list(arg)
     df_medals = df_medals.pivot(index=args, columns="Medal", values="ID")
 
+    # medal types nobody won in df_orig get a column too (filled with 0 below)
+    df_medals = df_medals.reindex(columns=["Bronze", "Gold", "Silver"])
+
     # replace all NAs by 0
     df_medals.fillna(0, inplace=True)
 
@@ -44,3 +52,35 @@ def count_medals_n(df_orig, *arg):
     # Give back new dataframe
     return df_medals
 
+
+
+# Top-n rows per medal, precomputed so callbacks don't sort whole aggregates
+def top_n_index(df_medals, keys, n=10, medals=("Gold", "Silver", "Bronze", "Total")):
+    """
+    Gives back the n rows with most medals, for every medal type and every
+    value of the key columns
+
+    Input:
+        df_medals: DataFrame from count_medals_n
+        keys: list of columns to split by, e.g. ["Sport"] ([] for no split)
+        n: number of rows to keep
+        medals: medal columns to rank by
+
+    Returns:
+        index: dict with (*key values, medal) as key, and the top n rows
+            (sorted, most medals first) as value
+    """
+    index = {}
+    if not keys:
+        groups = [((), df_medals)]
+    else:
+        # a single key gives scalar group names, several keys give tuples
+        groups = df_medals.groupby(keys[0] if len(keys) == 1 else keys)
+
+    for key, df_group in groups:
+        key = key if isinstance(key, tuple) else (key,)
+        for medal in medals:
+            # nlargest uses a partial sort, only the n best rows are ordered
+            index[(*key, medal)] = df_group.nlargest(n, medal).reset_index(drop=True)
+
+    return index
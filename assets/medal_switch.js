@@ -0,0 +1,74 @@
+// Switches figures between Gold, Silver, Bronze and Total in the browser,
+// see clientside_medals.py for the data sent by the server
+
+// Copies the properties of updates into target, nested objects are merged
+function mergeInto(target, updates) {
+    Object.keys(updates || {}).forEach(function (key) {
+        var value = updates[key];
+        if (value && typeof value === "object" && !Array.isArray(value) &&
+                target[key] && typeof target[key] === "object") {
+            mergeInto(target[key], value);
+        } else {
+            target[key] = value;
+        }
+    });
+    return target;
+}
+
+// Texts made by plotly express name the medal column, e.g. "Total=%{z}"
+function renameMedal(trace, base, medal) {
+    if (typeof trace.hovertemplate === "string") {
+        trace.hovertemplate = trace.hovertemplate.split(base + "=").join(medal + "=");
+    }
+}
+
+function applyMedal(spec, medal) {
+    var fig = JSON.parse(JSON.stringify(spec.figure));
+    var base = spec.medal;
+    var layout = fig.layout || {};
+
+    (fig.data || []).forEach(function (trace, i) {
+        mergeInto(trace, (spec.traces[medal] || [])[i]);
+        renameMedal(trace, base, medal);
+    });
+
+    (fig.frames || []).forEach(function (frame, i) {
+        var updates = (spec.frames[medal] || [])[i] || [];
+        (frame.data || []).forEach(function (trace, j) {
+            mergeInto(trace, updates[j]);
+            renameMedal(trace, base, medal);
+        });
+    });
+
+    if (layout.title && typeof layout.title.text === "string") {
+        layout.title.text = layout.title.text.split(" " + base + " medals").join(" " + medal + " medals");
+    }
+    ["xaxis", "yaxis"].forEach(function (axis) {
+        if (layout[axis] && layout[axis].title && layout[axis].title.text === base) {
+            layout[axis].title.text = medal;
+        }
+    });
+
+    var range = spec.color_range[medal];
+    if (range && layout.coloraxis) {
+        layout.coloraxis.cmin = range[0];
+        layout.coloraxis.cmax = range[1];
+        if (layout.coloraxis.colorbar && layout.coloraxis.colorbar.title) {
+            layout.coloraxis.colorbar.title.text = medal;
+        }
+    }
+    return fig;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    medals: {
+        switch_medal: function (medal, specs) {
+            if (!specs || !medal) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+            return specs.map(function (spec) {
+                return applyMedal(spec, medal);
+            });
+        }
+    }
+});
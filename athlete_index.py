@@ -0,0 +1,155 @@
+# Athlete table: one row per athlete (ID) with the career over all Games,
+# and a prefix index over the names for the athlete search box
+#
+# The columns are kept as numpy arrays. The name index is a sorted array of
+# the lower-case words of all names: every word starting with a prefix is
+# one contiguous slice of it, found with two binary searches (np.searchsorted),
+# which answers like a trie without a node per letter.
+
+# Load libraries
+import numpy as np
+import pandas as pd
+
+
+# Sorts after every character in a name, ends the prefix range
+PREFIX_END = "\U0010ffff"
+
+# Columns of the Games rows in a profile
+EVENT_COLUMNS = ["Games", "City", "Sport", "Event", "Medal"]
+
+
+class AthleteIndex:
+    """Careers of all athletes, keyed by ID, with search over the names"""
+    # columns of df_athletes used, e.g. StarSchema.frame(AthleteIndex.columns)
+    columns = ["ID", "Name", "Sex", "NOC", "Year", "Season", *EVENT_COLUMNS]
+
+    def __init__(self, df_athletes):
+        # the rows of every athlete next to each other, in Games order, as
+        # positions into the Games columns (categorical in the dashboards)
+        self.source = df_athletes.loc[:, EVENT_COLUMNS]
+        season_codes = pd.factorize(df_athletes["Season"], sort=True)[0]
+        self.rows = np.lexsort((
+            season_codes, df_athletes["Year"].to_numpy(), df_athletes["ID"].to_numpy()
+        )).astype(np.int32)
+
+        def column(name):
+            return df_athletes[name].to_numpy()[self.rows]
+
+        ids = column("ID")
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        # rows of athlete i: self.rows[self.starts[i]:self.starts[i + 1]]
+        self.starts = np.r_[starts, len(ids)]
+        self.ids = ids[starts].astype(np.int32)
+
+        self.names = column("Name").astype(object)[starts]
+        self.sex = pd.Categorical(column("Sex")[starts])
+        self.noc = pd.Categorical(column("NOC")[starts])
+
+        years = column("Year")
+        self.first_year = years[starts].astype(np.int16)
+        self.last_year = np.maximum.reduceat(years, starts).astype(np.int16)
+        games = column("Games").astype(object)
+        self.first_games = games[starts]
+        self.last_games = games[self.starts[1:] - 1]
+        df = pd.DataFrame({"ID": ids, "Games": games, "Sport": column("Sport")})
+        self.n_games = df.groupby("ID", sort=True)["Games"].nunique().to_numpy().astype(np.int16)
+
+        # sports of every athlete, as one string
+        sports = df.drop_duplicates(["ID", "Sport"]).groupby("ID", sort=True)["Sport"]
+        self.sports = sports.agg(", ".join).to_numpy(dtype=object)
+
+        medals = column("Medal").astype(object)
+        for medal in ["Gold", "Silver", "Bronze"]:
+            counts = np.add.reduceat((medals == medal).astype(np.int16), starts)
+            setattr(self, medal.lower(), counts)
+        self.total = self.gold + self.silver + self.bronze
+
+        self.build_name_index()
+
+    def build_name_index(self):
+        """Sorted lower-case name words, with the athlete of every word"""
+        words, positions = [], []
+        for position, name in enumerate(self.names):
+            for word in set(str(name).lower().replace('"', " ").split()):
+                words.append(word)
+                positions.append(position)
+
+        words = np.array(words, dtype=object)
+        order = np.argsort(words, kind="stable")
+        self.words = words[order].astype(str)
+        self.word_athletes = np.array(positions, dtype=np.int32)[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefix(self, word):
+        """Positions of the athletes with a name word starting with word"""
+        low = np.searchsorted(self.words, word, side="left")
+        high = np.searchsorted(self.words, word + PREFIX_END, side="left")
+        return self.word_athletes[low:high]
+
+    def search(self, text, limit=10):
+        """
+        Athletes whose name has words starting with every word of text
+
+        Input:
+            text: what was typed, e.g. "mich phel"
+            limit: maximum number of athletes
+
+        Returns:
+            athletes: list of (ID, label), most medals first
+        """
+        positions = None
+        for word in text.lower().split():
+            found = np.unique(self.prefix(word))
+            positions = found if positions is None else np.intersect1d(positions, found)
+        if positions is None or len(positions) == 0:
+            return []
+
+        # most medals first, then by name
+        order = np.lexsort((self.names[positions].astype(str), -self.total[positions]))
+        positions = positions[order][:limit]
+        return [(int(self.ids[i]), self.label(i)) for i in positions]
+
+    def label(self, position):
+        return (
+            f"{self.names[position]} ({self.noc[position]}, "
+            f"{self.first_year[position]}-{self.last_year[position]})"
+        )
+
+    def position(self, athlete_id):
+        """Position of the athlete with ID athlete_id, None if unknown"""
+        position = np.searchsorted(self.ids, athlete_id)
+        if position < len(self.ids) and self.ids[position] == athlete_id:
+            return int(position)
+        return None
+
+    def profile(self, athlete_id):
+        """
+        Career of one athlete
+
+        Returns:
+            profile: dict with the athlete table columns, None if unknown
+            df_events: DataFrame with the Games, Sport, Event and Medal rows
+        """
+        position = self.position(athlete_id)
+        if position is None:
+            return None, pd.DataFrame()
+
+        profile = {
+            "ID": int(self.ids[position]),
+            "Name": self.names[position],
+            "Sex": self.sex[position],
+            "NOC": self.noc[position],
+            "First Games": self.first_games[position],
+            "Last Games": self.last_games[position],
+            "Games": int(self.n_games[position]),
+            "Sports": self.sports[position],
+            "Gold": int(self.gold[position]),
+            "Silver": int(self.silver[position]),
+            "Bronze": int(self.bronze[position]),
+            "Total": int(self.total[position]),
+        }
+        rows = self.rows[self.starts[position]:self.starts[position + 1]]
+        df_events = self.source.iloc[rows].astype(object)
+        return profile, df_events.reset_index(drop=True).fillna("")
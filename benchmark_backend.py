@@ -0,0 +1,151 @@
+# Benchmark of the pandas and database backends for the global dashboard queries:
+# latency per query and peak memory (RSS) of a worker using the backend
+#
+# The memory is that of a worker running only these queries. With a database
+# backend the dashboard process builds the database from the csv files in
+# chunks (DataContext.chunks) and doesn't read athlete_regions; it keeps the
+# star schema of athlete_iso for its other charts
+#
+# Usage:
+#   python benchmark_backend.py                 (all available backends)
+#   python benchmark_backend.py pandas sqlite
+
+# Load libraries
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+import analyze_functions as af
+import sql_backend
+from callback_cache import data_fingerprint
+
+
+data_files = ["data/athlete_iso.csv", "data/athlete_regions.csv"]
+
+# Queries like the ones -World-1 and -World-3 in Q3_dashboard_main.py run
+medal_queries = [{}, {"Sport": "Swimming"}, {"Sport": "Ice Hockey"}]
+athlete_queries = [
+    ("Age", "Total", {}),
+    ("Height", "Gold", {"Sport": "Swimming"}),
+    ("Weight", None, {"region": "Canada", "Sport": "Ice Hockey"}),
+]
+
+REPEATS = 20
+
+
+def load_tables():
+    athlete_iso = pd.read_csv("data/athlete_iso.csv").iloc[:, 1:]
+    athlete_regions = pd.read_csv("data/athlete_regions.csv")
+    athlete_regions = athlete_regions[athlete_regions["region"].notna()]
+    return athlete_iso, athlete_regions
+
+
+def pandas_medals(athlete_iso, filters):
+    df = athlete_iso
+    for column, value in filters.items():
+        df = df[df[column] == value]
+    return af.count_medals_n(df, "Country", "ISO", "Year")
+
+
+def pandas_athletes(athlete_regions, attribute, medal, filters):
+    df = athlete_regions
+    for column, value in filters.items():
+        df = df[df[column] == value]
+    if medal == "Total":
+        df = df[df["Medal"].notna()]
+    elif medal is not None:
+        df = df[df["Medal"] == medal]
+    return df[df[attribute].notna()][attribute].value_counts()
+
+
+def timed(func, repeats=REPEATS):
+    """Gives back the median time in milliseconds of func()"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def peak_rss_mb():
+    """Peak memory of this process in MB"""
+    # ru_maxrss survives exec on Linux (it would include the parent), the
+    # high water mark in /proc does not
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(engine):
+    """Runs the queries with one backend, like a dashboard worker would"""
+    start = time.perf_counter()
+    if engine == "pandas":
+        athlete_iso, athlete_regions = load_tables()
+        medals = lambda filters: pandas_medals(athlete_iso, filters)
+        athletes = lambda *query: pandas_athletes(athlete_regions, *query)
+    else:
+        # the database file is built beforehand, the worker only opens it
+        backend = sql_backend.SQLBackend(engine=engine, path=f"data/benchmark.{engine}")
+        medals = lambda filters: backend.count_medals("athlete_iso", "Country", "ISO", "Year", **filters)
+        athletes = lambda attribute, medal, filters: backend.athlete_counts(
+            "athlete_regions", attribute, medal, **filters
+        )
+    startup = (time.perf_counter() - start) * 1000
+
+    latencies = {}
+    for filters in medal_queries:
+        latencies[f"medals {filters}"] = timed(lambda: medals(filters))
+    for attribute, medal, filters in athlete_queries:
+        latencies[f"{attribute} {medal} {filters}"] = timed(lambda: athletes(attribute, medal, filters))
+
+    return {
+        "engine": engine,
+        "startup_ms": startup,
+        "latency_ms": latencies,
+        "max_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(engines):
+    fingerprint = data_fingerprint(data_files)
+    athlete_iso, athlete_regions = load_tables()
+    for engine in engines:
+        if engine != "pandas":
+            sql_backend.SQLBackend(engine=engine, path=f"data/benchmark.{engine}").build(
+                {"athlete_iso": athlete_iso, "athlete_regions": athlete_regions}, fingerprint
+            )
+    del athlete_iso, athlete_regions
+
+    # every backend in its own process, so the memory is measured separately
+    results = []
+    for engine in engines:
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", engine],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output))
+
+    for result in results:
+        print(f"\n{result['engine']}: startup {result['startup_ms']:.0f} ms, "
+              f"max RSS {result['max_rss_mb']:.0f} MB")
+        for query, latency in result["latency_ms"].items():
+            print(f"    {latency:8.2f} ms  {query}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        print(json.dumps(run_worker(sys.argv[2])))
+    else:
+        default = ["pandas", "sqlite"] + (["duckdb"] if sql_backend.duckdb else [])
+        main(sys.argv[1:] or default)
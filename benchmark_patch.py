@@ -0,0 +1,96 @@
+# Benchmark of whole figures against Patch updates (PATCH_UPDATES in
+# Q3_dashboard_main.py): server CPU time and response bytes per update,
+# for slider drags, gender switches and sport changes
+#
+# Usage:
+#   python benchmark_patch.py
+
+# Load libraries
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# (name, output, first input values, [(changed input, new values), ...])
+scenarios = [
+    ("medals-graph, time slider drag", "medals-graph.figure",
+     ["Gold", [1900, 2016]],
+     [("time-slider.value", ["Gold", [start, 2016]]) for start in range(1900, 2000, 4)]),
+    ("athlete-graph, gender switch", "athlete-graph.figure",
+     ["Age", "Both"],
+     [("gender-picker-radio.value", ["Age", gender]) for gender in ["F", "M", "Both"] * 8]),
+    ("athlete-distribution-graph, sport change", "athlete-distribution-graph.figure",
+     ["All regions", "Height", "Swimming", "Gold", "No", None],
+     [("sport-dropdown-world.value", ["All regions", "Height", sport, "Gold", "No", None])
+      for sport in ["Swimming", "Athletics", "Rowing", "Judo", "All Sports"] * 5]),
+]
+
+
+def run_worker():
+    """Posts the updates of every scenario, like the browser would"""
+    import Q3_dashboard_main as dashboard
+
+    app = dashboard.app
+    client = app.server.test_client()
+    url = app.config.requests_pathname_prefix + "_dash-update-component"
+
+    def post(output, values, changed):
+        key = next(key for key in app.callback_map if output in key)
+        callback = app.callback_map[key]
+        outputs = [
+            dict(zip(("id", "property"), item.rsplit(".", 1)))
+            for item in key.strip(".").split("...")
+        ]
+        body = {
+            "output": key,
+            "outputs": outputs if key.startswith("..") else outputs[0],
+            "inputs": [
+                {"id": dependency["id"], "property": dependency["property"], "value": value}
+                for dependency, value in zip(callback["inputs"], values)
+            ],
+            "state": [],
+            "changedPropIds": changed,
+        }
+        start = time.process_time()
+        response = client.post(url, json=body)
+        return time.process_time() - start, len(response.data)
+
+    results = {}
+    for name, output, first, updates in scenarios:
+        # the first figure, and the data loaded, before measuring
+        post(output, first, [])
+        cpu, size = 0, 0
+        for changed, values in updates:
+            seconds, length = post(output, values, [changed])
+            cpu += seconds
+            size += length
+        results[name] = {"cpu_ms": cpu * 1000 / len(updates), "bytes": size / len(updates)}
+    return results
+
+
+def main():
+    results = {}
+    for patch in ["0", "1"]:
+        # no result cache: every update is computed, as on its first request
+        env = dict(os.environ, OLYMPICS_PATCH_UPDATES=patch, OLYMPICS_CLIENTSIDE_MEDALS="0",
+                   OLYMPICS_RESULT_CACHE_SIZE="0")
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker"],
+            check=True, capture_output=True, text=True, env=env
+        ).stdout
+        results[patch] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'per update':45} {'figure ms':>10} {'patch ms':>10} {'figure kB':>10} {'patch kB':>10}")
+    for name in results["0"]:
+        before, after = results["0"][name], results["1"][name]
+        print(f"{name:45} {before['cpu_ms']:10.1f} {after['cpu_ms']:10.1f} "
+              f"{before['bytes'] / 1024:10.1f} {after['bytes'] / 1024:10.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        print(json.dumps(run_worker()))
+    else:
+        main()
@@ -0,0 +1,77 @@
+# Bitmap indexes: for every value of a column, one bit per row telling if
+# the row has that value. Selections over several columns are combined
+# with bitwise AND/OR and counted with popcount, instead of filtering
+# the DataFrame again for every selection.
+
+# Load libraries
+import numpy as np
+import pandas as pd
+
+
+# Number of set bits for every byte value
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+class BitmapIndex:
+    """Packed bitmaps (np.packbits) per value of the chosen columns of a DataFrame"""
+    def __init__(self, df, columns):
+        self.n_rows = len(df)
+        self.n_bytes = (self.n_rows + 7) // 8
+        self.bitmaps = {}
+
+        for column in columns:
+            # codes is -1 for missing values, those get no bitmap
+            codes, values = pd.factorize(df[column], sort=True)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+
+            self.bitmaps[column] = {}
+            for code, value in enumerate(values):
+                mask = np.zeros(self.n_rows, dtype=bool)
+                mask[order[bounds[code]:bounds[code + 1]]] = True
+                self.bitmaps[column][self._key(value)] = np.packbits(mask)
+
+    @staticmethod
+    def _key(value):
+        # numpy numbers are looked up with plain python numbers
+        return value.item() if isinstance(value, np.generic) else value
+
+    def values(self, column):
+        return list(self.bitmaps[column])
+
+    def all_rows(self):
+        """Bitmap with every row set"""
+        return np.packbits(np.ones(self.n_rows, dtype=bool))
+
+    def no_rows(self):
+        return np.zeros(self.n_bytes, dtype=np.uint8)
+
+    def equals(self, column, value):
+        """Bitmap of the rows where column == value"""
+        return self.bitmaps[column].get(self._key(value), self.no_rows())
+
+    def isin(self, column, values):
+        """Bitmap of the rows where column is any of values (OR)"""
+        bitmap = self.no_rows()
+        for value in values:
+            bitmap = bitmap | self.equals(column, value)
+        return bitmap
+
+    def between(self, column, low, high):
+        """Bitmap of the rows where low <= column <= high"""
+        return self.isin(column, [
+            value for value in self.bitmaps[column] if low <= value <= high
+        ])
+
+    def notna(self, column):
+        """Bitmap of the rows where column has a value"""
+        return self.isin(column, self.bitmaps[column])
+
+    @staticmethod
+    def count(bitmap):
+        """Number of rows in the bitmap (popcount)"""
+        return int(POPCOUNT[bitmap].sum(dtype=np.int64))
+
+    def rows(self, bitmap):
+        """Row positions in the bitmap, for df.iloc"""
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows))
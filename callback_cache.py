@@ -0,0 +1,597 @@
+# Functions for sharing callback results between identical concurrent requests,
+# a result cache favouring popular inputs, and speculative precomputation
+#
+# With OLYMPICS_SPECULATE=1 every call of a single_flight callback is
+# counted: how often each input value is chosen, and which input a user
+# changes after which (users on page 3 choose a sport, then switch the
+# medal, then pick regions). The most likely next calls are computed in a
+# background thread while the worker is idle, and kept in the result cache
+# when their inputs are popular enough to be admitted.
+
+# Load libraries
+import collections
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+
+import flask
+
+import profiling
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks on Windows, coalescing is then done per worker only
+    fcntl = None
+
+
+# Directory for the cross-worker lock files, switched off when not set
+LOCK_DIR = os.environ.get("OLYMPICS_SINGLE_FLIGHT_DIR")
+
+# Seconds a result written by another worker is reused
+LOCK_RESULT_TTL = 30
+
+# Callback results kept per worker, opt-in (0: no result cache)
+RESULT_CACHE_SIZE = int(os.environ.get("OLYMPICS_RESULT_CACHE_SIZE", 0))
+
+# Speculative precomputation of the likely next calls, in idle time; the
+# results are kept in the result cache, so it needs OLYMPICS_RESULT_CACHE_SIZE
+SPECULATE = os.environ.get("OLYMPICS_SPECULATE") == "1"
+
+# Cookie with a random id per browser, the client of the popularity counts
+# (only set with OLYMPICS_SPECULATE=1)
+CLIENT_COOKIE = "olympics_client"
+
+# Calls of a callback after which its popularity counts are halved, so old
+# popularity fades and the counters of rare values are dropped
+POPULARITY_HALF_LIFE = 1000
+
+# Seconds without callback requests before the worker counts as idle
+IDLE_SECONDS = 0.2
+
+# Next calls predicted after every call, and most waiting to be computed
+SPECULATE_PER_CALL = 4
+SPECULATE_QUEUE_SIZE = 64
+
+
+class _Flight:
+    """One running computation, which waiting requests subscribe to"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def data_fingerprint(paths):
+    """
+    Gives back a fingerprint of the data files, changes when any file changes
+
+    Input:
+        paths: list with file paths
+
+    Returns:
+        fingerprint: hex string
+    """
+    stats = []
+    for path in paths:
+        stat = os.stat(path)
+        stats.append([path, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha1(json.dumps(stats).encode()).hexdigest()
+
+
+def flight_key(callback_id, args):
+    """
+    Gives back a key for a callback and its inputs
+
+    Input:
+        callback_id: name of the callback
+        args: tuple with the callback inputs (json serializable)
+
+    Returns:
+        key: hex string
+    """
+    payload = json.dumps([callback_id, list(args)], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _lock_file(path, shared=False):
+    """
+    Opens and locks path (shared: a read lock, which other processes may
+    hold at the same time), again when a sweep removed it meanwhile
+    """
+    while True:
+        lock_file = open(path, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            # a sweep may have removed the file while we waited for its lock
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+def hold_shared_lock(path):
+    """
+    Takes a shared lock on the lock file path, for as long as the file it
+    stands for (a data version) is used in this process; the other
+    processes then leave it alone (remove_unlocked)
+
+    Returns:
+        the open lock file, closing it releases the lock (None without
+        file locks, on Windows)
+    """
+    if fcntl is None:
+        return None
+    return _lock_file(path, shared=True)
+
+
+def remove_unlocked(path, remove):
+    """
+    Calls remove() and removes the lock file path, when no process holds a
+    lock on it (hold_shared_lock)
+
+    Returns:
+        True when removed
+    """
+    try:
+        lock_file = open(path, "a")
+    except FileNotFoundError:
+        return False
+    with lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                # removed, and made again, by another process meanwhile
+                if os.fstat(lock_file.fileno()).st_ino != os.stat(path).st_ino:
+                    return False
+            except FileNotFoundError:
+                return False
+        remove()
+        os.remove(path)
+        return True
+
+
+def sweep_lock_dir(lock_dir, max_age=LOCK_RESULT_TTL):
+    """
+    Removes the lock and result files of the keys not used for max_age
+    seconds, so lock_dir doesn't grow with every new input combination
+
+    Returns:
+        number of removed files
+    """
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(lock_dir):
+        try:
+            if now - entry.stat().st_mtime < max_age:
+                continue
+            if entry.name.endswith(".lock"):
+                with open(entry.path, "a") as lock_file:
+                    # in use by another worker: left for the next sweep
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    # the result of a key is only removed under its lock
+                    result_path = entry.path[:-len(".lock")] + ".pkl"
+                    if os.path.exists(result_path):
+                        os.remove(result_path)
+                        removed += 1
+                    os.remove(entry.path)
+                    removed += 1
+            elif entry.name.endswith(".tmp"):
+                # left by a worker which stopped while writing a result
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # removed by another worker's sweep
+            pass
+    return removed
+
+
+_last_sweep = 0.0
+
+
+def _run_with_file_lock(key, func, args, lock_dir):
+    """
+    Runs func once over all workers sharing lock_dir, the other workers
+    wait for the lock and then read the pickled result
+    """
+    global _last_sweep
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_path = os.path.join(lock_dir, key + ".lock")
+    result_path = os.path.join(lock_dir, key + ".pkl")
+
+    with _lock_file(lock_path) as lock_file:
+        try:
+            # the last use of the key, for sweep_lock_dir
+            os.utime(lock_path)
+
+            # Another worker finished the same computation while we waited
+            if os.path.exists(result_path) and \
+                    time.time() - os.path.getmtime(result_path) < LOCK_RESULT_TTL:
+                with open(result_path, "rb") as f:
+                    return pickle.load(f)
+
+            result = func(*args)
+
+            # write to a temporary file first, so nobody reads half a result
+            tmp_path = f"{result_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, result_path)
+            return result
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            # old keys are removed now and then, by any of the workers
+            if time.time() - _last_sweep > LOCK_RESULT_TTL:
+                _last_sweep = time.time()
+                sweep_lock_dir(lock_dir)
+
+
+class ResultCache:
+    """
+    Callback results, least recently used first out. A new result is only
+    admitted in place of the oldest one when its key was asked for at
+    least as often (speculative results: more often), so one-off requests
+    and unlikely guesses don't push popular results out
+    """
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        # requests per key, halved now and then so old popularity fades
+        self.frequency = collections.Counter()
+        self.requests = 0
+        self.hits = 0
+        self.speculative_keys = set()
+        self.speculative_hits = 0
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        """Counts a request for key"""
+        with self.lock:
+            self.frequency[key] += 1
+            self.requests += 1
+            if self.requests % (10 * max(self.max_entries, 1)) == 0:
+                for counted_key in list(self.frequency):
+                    self.frequency[counted_key] //= 2
+                    if not self.frequency[counted_key]:
+                        del self.frequency[counted_key]
+
+    def get(self, key):
+        """Gives back (True, result) when cached, otherwise (False, None)"""
+        with self.lock:
+            if key not in self.entries:
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if key in self.speculative_keys:
+                self.speculative_keys.discard(key)
+                self.speculative_hits += 1
+            return True, self.entries[key]
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, result, speculative=False):
+        """
+        Adds result, when admitted
+
+        Returns:
+            True when the result was kept
+        """
+        with self.lock:
+            if self.max_entries <= 0:
+                return False
+            if key not in self.entries and len(self.entries) >= self.max_entries:
+                victim = next(iter(self.entries))
+                candidate = self.frequency[key] + (1 if speculative else 0)
+                victim_frequency = self.frequency[victim]
+                if candidate < victim_frequency or (speculative and candidate == victim_frequency):
+                    return False
+                del self.entries[victim]
+                self.speculative_keys.discard(victim)
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            if speculative:
+                self.speculative_keys.add(key)
+            return True
+
+
+def value_key(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class Popularity:
+    """
+    Popularity of the input values of one callback, and transition counts
+    between the inputs users change one after another
+    """
+    def __init__(self, max_clients=1024, half_life=POPULARITY_HALF_LIFE):
+        self.max_clients = max_clients
+        self.half_life = half_life
+        # {input position: Counter(json value)}, halved every half_life calls
+        self.values = collections.defaultdict(collections.Counter)
+        # {input changed last (None: first call): Counter(input changed next)}
+        self.transitions = collections.defaultdict(collections.Counter)
+        # {client: (last inputs, input changed last)}
+        self.last = collections.OrderedDict()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def decay(self):
+        """Halves all counts, the ones down to 0 are removed"""
+        for counters in (self.values, self.transitions):
+            for name in list(counters):
+                counter = counters[name]
+                for key in list(counter):
+                    counter[key] //= 2
+                    if not counter[key]:
+                        del counter[key]
+                if not counter:
+                    del counters[name]
+
+    def record(self, client, args):
+        """
+        Counts a call of client with the inputs args
+
+        Returns:
+            position of the input the client changed (None: not known)
+        """
+        with self.lock:
+            self.calls += 1
+            if self.calls % self.half_life == 0:
+                self.decay()
+            for position, value in enumerate(args):
+                self.values[position][value_key(value)] += 1
+
+            changed = None
+            previous = self.last.pop(client, None)
+            if previous is not None:
+                previous_args, previous_changed = previous
+                positions = [
+                    position for position, (old, new) in enumerate(zip(previous_args, args))
+                    if old != new
+                ]
+                if positions:
+                    changed = positions[0]
+                    self.transitions[previous_changed][changed] += 1
+                else:
+                    changed = previous_changed
+            self.last[client] = (args, changed)
+            while len(self.last) > self.max_clients:
+                self.last.popitem(last=False)
+            return changed
+
+    def predict(self, args, changed, n=SPECULATE_PER_CALL):
+        """
+        Gives back the n most likely next calls after args, when the input
+        at position changed was changed last
+
+        Returns:
+            list of (probability, inputs), most likely first
+        """
+        with self.lock:
+            next_inputs = self.transitions.get(changed)
+            if not next_inputs:
+                return []
+            total = sum(next_inputs.values())
+            candidates = []
+            for position, count in next_inputs.most_common(2):
+                values = self.values.get(position)
+                if not values:
+                    continue
+                values_total = sum(values.values())
+                for value, value_count in values.most_common(n + 1):
+                    value = json.loads(value)
+                    if value == args[position]:
+                        continue
+                    candidate = args[:position] + (value,) + args[position + 1:]
+                    candidates.append((count / total * value_count / values_total, candidate))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        return candidates[:n]
+
+
+class Speculator:
+    """Computes predicted calls in a background thread while the worker is idle"""
+    def __init__(self, max_queue=SPECULATE_QUEUE_SIZE, idle_seconds=IDLE_SECONDS):
+        self.max_queue = max_queue
+        self.idle_seconds = idle_seconds
+        self.queue = []
+        self.order = itertools.count()
+        self.last_request = time.monotonic()
+        self.computed = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def request_started(self):
+        with self.condition:
+            self.last_request = time.monotonic()
+
+    def submit(self, probability, compute, args):
+        """Queues compute(args), the least likely calls are dropped when full"""
+        with self.condition:
+            heapq.heappush(self.queue, (-probability, next(self.order), compute, args))
+            if len(self.queue) > self.max_queue:
+                self.queue = heapq.nsmallest(self.max_queue, self.queue)
+                heapq.heapify(self.queue)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="speculate", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def idle(self):
+        with _flights_lock:
+            busy = bool(_flights)
+        return not busy and time.monotonic() - self.last_request >= self.idle_seconds
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+            if not self.idle():
+                time.sleep(self.idle_seconds)
+                continue
+            with self.condition:
+                if not self.queue:
+                    continue
+                _, _, compute, args = heapq.heappop(self.queue)
+            try:
+                if compute(args):
+                    self.computed += 1
+            except Exception:
+                # a guess that fails is only a wasted guess
+                pass
+
+
+result_cache = ResultCache()
+speculator = Speculator()
+popularity = collections.defaultdict(Popularity)
+
+
+def client_key():
+    """
+    Identifies the browser of the current request by its client cookie,
+    None outside requests. Browsers behind one address (NAT, proxies) with
+    the same User-Agent are still told apart. Without the cookie a new id
+    is made, which init_client_cookie sends back to the browser
+    """
+    if not flask.has_request_context():
+        return None
+    client = flask.request.cookies.get(CLIENT_COOKIE)
+    if not client:
+        client = flask.g.setdefault(CLIENT_COOKIE, uuid.uuid4().hex)
+    return client
+
+
+def init_client_cookie(server):
+    """Sets the client cookie of client_key on the responses of a Flask server"""
+    @server.after_request
+    def set_client_cookie(response):
+        client = flask.g.get(CLIENT_COOKIE)
+        if client is not None and not flask.request.cookies.get(CLIENT_COOKIE):
+            response.set_cookie(CLIENT_COOKIE, client, httponly=True, samesite="Lax")
+        return response
+
+
+def cache_stats():
+    """Numbers of the result cache and the speculative precomputation"""
+    return {
+        "entries": len(result_cache.entries),
+        "requests": result_cache.requests,
+        "hits": result_cache.hits,
+        "speculative computed": speculator.computed,
+        "speculative hits": result_cache.speculative_hits,
+        "speculative queued": len(speculator.queue),
+    }
+
+
+def single_flight(callback_id, lock_dir=LOCK_DIR, version=None, inputs=None):
+    """
+    Decorator: identical concurrent calls (same callback_id and inputs)
+    run the function only once, the other callers get the same result
+
+    Input:
+        callback_id: name of the callback, the dashboards reuse the
+            function name update_graph so it has to be given explicitly
+        lock_dir: directory for lock files, to also coalesce calls across
+            worker processes (None: only threads within this worker)
+        version: function giving back the data version, calls on different
+            versions of the data don't share results (None: no version)
+        inputs: number of leading arguments which are callback inputs,
+            the others (e.g. a patch flag) are set by the caller and kept
+            as they are in the predicted calls (None: all arguments)
+
+    Returns:
+        decorator
+    """
+    def decorator(func):
+        # profiled through the debug endpoint, unchanged when switched off;
+        # speculative computations run func itself, they don't use up the
+        # armed calls
+        profiled_func = profiling.profiled(callback_id)(func)
+
+        def speculate(args):
+            """Computes a predicted call, when its result is not there yet"""
+            key_args = args if version is None else (version(), *args)
+            key = flight_key(callback_id, key_args)
+            if key in result_cache:
+                return False
+            compute(key, args, speculative=True)
+            return True
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key_args = args if version is None else (version(), *args)
+            key = flight_key(callback_id, key_args)
+
+            # the popularity is only counted (and the client cookie set)
+            # when it is used to speculate
+            if SPECULATE and result_cache.max_entries > 0:
+                client = client_key()
+                if client is not None:
+                    speculator.request_started()
+                    count = len(args) if inputs is None else inputs
+                    input_args, flags = args[:count], args[count:]
+                    changed = popularity[callback_id].record(client, input_args)
+                    for probability, next_inputs in popularity[callback_id].predict(
+                        input_args, changed
+                    ):
+                        speculator.submit(probability, speculate, next_inputs + flags)
+
+            result_cache.count(key)
+            cached, result = result_cache.get(key)
+            if cached:
+                return result
+            return compute(key, args)
+
+        def compute(key, args, speculative=False):
+            with _flights_lock:
+                flight = _flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _flights[key] = _Flight()
+
+            # Someone else is computing this already, wait for the result
+            if not leader:
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+
+            run = func if speculative else profiled_func
+            try:
+                if lock_dir and fcntl is not None:
+                    flight.result = _run_with_file_lock(key, run, args, lock_dir)
+                else:
+                    flight.result = run(*args)
+            except Exception as error:
+                flight.error = error
+                raise
+            finally:
+                with _flights_lock:
+                    del _flights[key]
+                flight.done.set()
+
+            result_cache.put(key, flight.result, speculative)
+            return flight.result
+        return wrapper
+    return decorator
@@ -0,0 +1,58 @@
+# Functions for switching the medal type of a figure in the browser.
+# The server sends a figure once, together with the data of all four
+# medal types, and a clientside callback (assets/medal_switch.js) swaps
+# the arrays when the user picks another medal.
+
+# Load libraries
+import os
+
+from dash import ClientsideFunction, Input
+
+
+# Switched on with OLYMPICS_CLIENTSIDE_MEDALS=1
+ENABLED = os.environ.get("OLYMPICS_CLIENTSIDE_MEDALS") == "1"
+
+# Medal the figures are built with on the server
+BASE_MEDAL = "Total"
+
+
+def medal_spec(fig, traces, frames=None, color_range=None):
+    """
+    Gives back a figure together with its data for every medal type
+
+    Input:
+        fig: plotly figure built for BASE_MEDAL
+        traces: dict with medal as key and a list (one per trace in fig.data)
+            of trace properties to replace, e.g. {"Gold": [{"z": [...]}]}
+        frames: same as traces, but a list per animation frame
+        color_range: dict with medal as key and [min, max] of the color axis
+
+    Returns:
+        spec: dict, for a dcc.Store
+    """
+    return {
+        "figure": fig.to_plotly_json(),
+        "medal": BASE_MEDAL,
+        "traces": traces,
+        "frames": frames or {},
+        "color_range": color_range or {},
+    }
+
+
+def register_medal_switch(app, outputs, medal_input, store_id):
+    """
+    Adds the clientside callback which shows the chosen medal
+
+    Input:
+        app: Dash app
+        outputs: list with Output of the figures, in the order of the specs
+            in the store
+        medal_input: id of the medal radio items
+        store_id: id of the dcc.Store with a list of medal_spec
+    """
+    app.clientside_callback(
+        ClientsideFunction(namespace="medals", function_name="switch_medal"),
+        outputs,
+        Input(medal_input, "value"),
+        Input(store_id, "data"),
+    )
@@ -0,0 +1,69 @@
+# Options of the radio items and dropdowns, and the labels, shared by the
+# dashboards (Q3_dashboard_main.py, Q3_J_dashboard.py, Q3_Y_dashboard_world.py).
+# The options built from the data (sports, regions) are in data_context.py
+
+
+# Medal options
+medal_list = "Gold Silver Bronze Total".split()
+medal_options = [{'label': medal, 'value': medal} for medal in medal_list]
+
+# Attribute dropdown options
+attr_dict = {
+    'Sport':'Sport', 
+    'Event':'Sport event', 
+    'Games':'Year & Season',
+    'Season':'Season', 
+    'Name':'Athlete', 
+    'Sex':'Athlete gender', 
+    'Age':'Athlete age',
+    'City':'City'
+}
+attribute_options_dropdown = [
+    {'label':name, 'value': attribute} 
+    for attribute, name in attr_dict.items()
+]
+
+
+# Athletes dropdown options
+gender_options = [
+    {'label':'Both', 'value':'Both'},
+    {'label':'Female', 'value':'F'},
+    {'label':'Male', 'value':'M'}
+]
+athlete_dict = {
+    'Sex':'Gender',
+    'Age':'Age',
+    'Height':'Height',
+    'Weight':'Weight'
+}
+unit_dict = {
+    'Sex':'Gender',
+    'Age':'Age (years)',
+    'Height':'Height (centimetres)',
+    'Weight':'Weight (kilograms)'
+}
+
+athlete_options = [
+    {'label':name, 'value': attribute} 
+    for attribute, name in athlete_dict.items()
+]
+# numeric statistics only, for the percentile bands
+physique_options = athlete_options[1:]
+
+
+# Settings for international data
+all_athletes_options = ["Yes", "No"]
+all_athletes_options_radio = [
+    {'label':choice, 'value': choice} 
+    for choice in all_athletes_options
+]
+
+season_options = [
+    {'label': season, 'value': season}
+    for season in ["Summer", "Winter"]
+]
+
+
+def dropdown_options(values):
+    """Options of a dropdown with the same label and value, e.g. data.sport_list"""
+    return [{'label': value, 'value': value} for value in values]
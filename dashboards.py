@@ -0,0 +1,30 @@
+# All three dashboards in one process, on one Flask server with one data
+# context: /main/ (sidebar dashboard), /canada/ and /world/
+#
+# Usage:
+#   python dashboards.py
+#   gunicorn dashboards:server
+
+# Load libraries
+import importlib
+
+import flask
+
+import shared_server
+
+
+server = shared_server.mount()
+
+# the modules build their Dash apps on the shared server when imported
+apps = {
+    name: importlib.import_module(name).app for name in shared_server.MOUNTS
+}
+
+
+@server.route("/")
+def index():
+    return flask.redirect(shared_server.MOUNTS["Q3_dashboard_main"])
+
+
+if __name__ == "__main__":
+    server.run(port=8050)
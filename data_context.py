@@ -0,0 +1,572 @@
+# Data context: the data files and everything computed from them, read
+# and computed on first use (or in warm_up), so the dashboards can start
+# without waiting for the data
+#
+# DataManager keeps the current DataContext and, with hot reload on, loads
+# a new one in the background when the data files change and swaps it in.
+# Every request works on the DataContext that was current when it started.
+# All dashboards of a process share one DataManager (shared_manager).
+
+# Load libraries
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+import analyze_functions as af
+from athlete_index import AthleteIndex
+from bitmap_index import BitmapIndex
+from callback_cache import data_fingerprint
+from hyperloglog import ParticipationSketches
+from medal_rankings import MedalRankings
+from quantile_sketch import PhysiqueSketches
+import sql_backend
+from star_schema import REGION_DIMENSIONS, StarSchema
+import year_partitions
+
+
+data_file_names = ["canada.csv", "athlete_regions.csv", "athlete_iso.csv", "noc_iso.csv"]
+
+# How every data file is prepared after parsing: the index column of the
+# csv is dropped, athlete_regions loses the rows without region
+table_readers = {
+    "canada": lambda df: df,
+    "athlete_regions": lambda df: df[df["region"].notna()].reset_index(drop=True),
+    "athlete_iso": lambda df: df.iloc[:, 1:],
+    "noc_iso": lambda df: df.iloc[:, 1:],
+}
+
+# Seconds between two checks of the data files, 0: no hot reload
+RELOAD_INTERVAL = float(os.environ.get("OLYMPICS_RELOAD_INTERVAL", 0))
+
+# Columns of athlete_iso with a bitmap index, for the crossfilter on page 3
+bitmap_columns = ["Country", "Sport", "Year", "Sex", "Medal", "Age", "Height", "Weight"]
+
+
+class DataContext:
+    """One version of the data files, with the aggregates computed from them"""
+    def __init__(self, data_path="data/", previous=None):
+        """
+        Input:
+            data_path: directory with the data files
+            previous: DataContext of the previous data version, while this
+                one is loaded, so aggregates of appended rows are updated
+                instead of computed again
+        """
+        self.data_path = data_path
+        self.previous = previous
+        self.data_files = [data_path + name for name in data_file_names]
+        # identifies this version of the data, for caches and ETags
+        self.fingerprint = data_fingerprint(self.data_files)
+        # seconds spent on each table or aggregate, for the startup report
+        self.load_times = {}
+        self._cache = {}
+        # one lock per key: a cheap table isn't built after an unrelated
+        # slow one (e.g. in warm_up), only the same key waits
+        self._locks = {}
+        self._lock = threading.Lock()
+        # requests using this version, and what to close once none does
+        # after it was replaced (e.g. database connections)
+        self._users = 0
+        self._retired = False
+        self._closers = []
+        # {table: (bytes, sha1)} of the data files read, for appended_rows
+        self.sources = {}
+
+    def cached(self, key, builder):
+        """
+        Gives back builder() computed only once for this data version
+
+        Input:
+            key: name of the table or aggregate
+            builder: function without arguments
+
+        Returns:
+            the result of builder()
+        """
+        if key in self._cache:
+            return self._cache[key]
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.RLock())
+        with lock:
+            if key not in self._cache:
+                start = time.perf_counter()
+                self._cache[key] = builder()
+                self.load_times[key] = time.perf_counter() - start
+            return self._cache[key]
+
+    def add_closer(self, close):
+        """Calls close() when this version was replaced and no request uses it any more"""
+        with self._lock:
+            self._closers.append(close)
+
+    def acquire(self):
+        """A request starts using this version"""
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        """A request is done with this version"""
+        with self._lock:
+            self._users -= 1
+            closing = self._retired and self._users == 0
+        if closing:
+            self.close()
+
+    def retire(self):
+        """This version was replaced: closed now, or when its last request is done"""
+        with self._lock:
+            self._retired = True
+            closing = self._users == 0
+        if closing:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            closers, self._closers = self._closers, []
+        for close in closers:
+            try:
+                close()
+            except Exception:
+                logging.getLogger(__name__).exception("closing data version failed")
+
+    def built(self, key):
+        """The table or aggregate of key when it was built already, otherwise None"""
+        return self._cache.get(key)
+
+    def appended_rows(self, table):
+        """
+        Rows at the end of the data file of table which the previous data
+        version didn't have: the old file is the start of the new one
+
+        Returns:
+            DataFrame, or None when other rows changed as well, or there is
+            no previous version which read the file
+        """
+        source = self.previous.sources.get(table) if self.previous is not None else None
+        if source is None:
+            return None
+        size, digest = source
+        with open(self.data_path + table + ".csv", "rb") as f:
+            raw = f.read()
+        if len(raw) < size or hashlib.sha1(raw[:size]).hexdigest() != digest:
+            return None
+        header = raw[:raw.index(b"\n") + 1]
+        return table_readers[table](pd.read_csv(io.BytesIO(header + raw[size:])))
+
+    def read(self, table):
+        """
+        Reads the data file of table, not kept: the tables are kept through
+        the properties below
+        """
+        with open(self.data_path + table + ".csv", "rb") as f:
+            raw = f.read()
+        self.sources[table] = (len(raw), hashlib.sha1(raw).hexdigest())
+        return table_readers[table](pd.read_csv(io.BytesIO(raw)))
+
+    def chunks(self, table, chunksize=100_000):
+        """
+        The rows of the data file of table in DataFrames of chunksize rows,
+        prepared like read, to load them elsewhere (the database backend)
+        without holding the whole table
+        """
+        path = self.data_path + table + ".csv"
+        # text columns stay text in every chunk, also in a chunk with only
+        # missing values in them
+        sample = pd.read_csv(path, nrows=1000)
+        dtype = {
+            column: object for column in sample.columns
+            if sample[column].dtype == object or sample[column].isna().all()
+        }
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtype):
+            yield table_readers[table](chunk)
+
+    # Tables
+    @property
+    def canada(self):
+        return self.cached("canada", lambda: self.read("canada"))
+
+    @property
+    def noc_iso(self):
+        return self.cached("noc_iso", lambda: self.read("noc_iso"))
+
+    @property
+    def athlete_star(self):
+        """
+        athlete_iso as integer fact table and dimension tables, the store of
+        the table: the DataFrame read from the csv is dropped after the build
+        """
+        return self.cached("athlete_star", lambda: StarSchema(self.read("athlete_iso")))
+
+    @property
+    def regions_star(self):
+        """athlete_regions (only the rows with region) as star schema"""
+        return self.cached(
+            "regions_star", lambda: StarSchema(self.read("athlete_regions"), REGION_DIMENSIONS)
+        )
+
+    @property
+    def athlete_iso(self):
+        """
+        athlete_iso as DataFrame, materialized from the star schema on every
+        call and not kept: for the aggregates built once
+        """
+        return self.athlete_star.frame()
+
+    @property
+    def athlete_regions(self):
+        """Athletes with region, the rows without region are removed (not kept)"""
+        return self.regions_star.frame()
+
+    def partitions(self, table):
+        """
+        The table partitioned by Games, in data/partitions/<table>/<version>/,
+        written when missing: from the partitions of the previous version and
+        only the appended rows, when rows were appended. The directory is
+        removed when this version was replaced and its requests are done
+        """
+        def load():
+            directory = os.path.join(self.data_path, "partitions", table)
+            source = data_fingerprint([self.data_path + table + ".csv"])
+            previous = self.previous.built(f"{table}_partitions") if self.previous is not None else None
+            partitions = year_partitions.open_partitions(
+                lambda: getattr(self, table), directory, source,
+                previous, lambda: self.appended_rows(table)
+            )
+            self.add_closer(lambda: year_partitions.close_partitions(partitions, directory))
+            return partitions
+        return self.cached(f"{table}_partitions", load)
+
+    @property
+    def canada_partitions(self):
+        return self.partitions("canada")
+
+    @property
+    def athlete_partitions(self):
+        return self.partitions("athlete_iso")
+
+    @property
+    def backend(self):
+        """
+        Optional database backend for the global statistics, set by
+        OLYMPICS_BACKEND=sqlite/duckdb (None: pandas), built from the csv
+        files in chunks. Every data version has its own database file,
+        closed when the version is replaced and unused
+        """
+        def open_backend():
+            path = sql_backend.DATABASE_PATH
+            backend = sql_backend.open_backend(
+                {table: self.chunks(table) for table in ["athlete_iso", "athlete_regions"]},
+                self.fingerprint, sql_backend.BACKEND, path
+            )
+            if backend is not None:
+                self.add_closer(lambda: sql_backend.close_backend(backend, path))
+            return backend
+        return self.cached("backend", open_backend)
+
+    def distinct(self, column):
+        """Values of a column of athlete_regions, from the backend if there is one"""
+        if self.backend is not None:
+            return self.backend.distinct("athlete_regions", column)
+        return self.regions_star.lookup(column)[1].tolist()
+
+    def region_counts(self, attribute, medal=None, **filters):
+        """
+        How many athletes of athlete_regions have each value of attribute,
+        counted in the backend if there is one, else on the star schema
+
+        Input:
+            attribute: column to count values of (Age, Height ...)
+            medal: None for all athletes, "Total" for all medal winners,
+                or Gold/Silver/Bronze
+            **filters: column=value to filter on (region, Sport)
+
+        Returns:
+            athlete_counts: Series with counts, index is the attribute values
+        """
+        if self.backend is not None:
+            return self.backend.athlete_counts("athlete_regions", attribute, medal, **filters)
+        if medal == "Total":
+            medals = ["Gold", "Silver", "Bronze"]
+        else:
+            medals = None if medal is None else [medal]
+        return self.regions_star.value_counts(attribute, medals, **filters)
+
+    # Dropdown values
+    @property
+    def sport_list(self):
+        def build():
+            sport_list = self.distinct("Sport")
+            sport_list.append("All Sports")
+            sport_list.sort()
+            return sport_list
+        return self.cached("sport_list", build)
+
+    @property
+    def region_list(self):
+        def build():
+            region_list = self.distinct("region")
+            region_list.append("All regions")
+            region_list.sort()
+            return region_list
+        return self.cached("region_list", build)
+
+    # Indexes
+    @property
+    def athlete_bitmaps(self):
+        """Bitmap index over athlete_iso"""
+        return self.cached(
+            "athlete_bitmaps",
+            lambda: BitmapIndex(self.athlete_star.frame(bitmap_columns), bitmap_columns)
+        )
+
+    @property
+    def athlete_index(self):
+        """Careers of all athletes, with the name search"""
+        return self.cached(
+            "athlete_index",
+            lambda: AthleteIndex(self.athlete_star.frame(AthleteIndex.columns, categorical=True))
+        )
+
+    @property
+    def medal_rankings(self):
+        """Medal table ranks per Games, only the Games of appended rows ranked again"""
+        def build():
+            appended = self.appended_rows("athlete_iso")
+            previous = self.previous.built("medal_rankings") if appended is not None else None
+            if previous is None:
+                return MedalRankings(self.athlete_star)
+            rankings = previous.copy()
+            rankings.append(appended)
+            return rankings
+        return self.cached("medal_rankings", build)
+
+    @property
+    def physique_sketches(self):
+        """Quantile sketches of Age, Height and Weight per Sport, Year, Sex and Medal status"""
+        return self.cached("physique_sketches", lambda: PhysiqueSketches(self.athlete_iso))
+
+    @property
+    def participation_sketches(self):
+        """Distinct athletes and countries per Sport, Year and Country"""
+        return self.cached(
+            "participation_sketches", lambda: ParticipationSketches(self.athlete_iso)
+        )
+
+    @property
+    def ranked_countries(self):
+        """Countries in the medal tables, for the dropdown"""
+        return self.cached(
+            "ranked_countries",
+            lambda: sorted(self.medal_rankings.table["Country"].astype(str).unique())
+        )
+
+    # World figures, shared by the world pages of the dashboards
+    def world_medals(self, sport):
+        """
+        Medals per country for chosen sport ("All Sports": all of them),
+        the shared intermediate of the world figures, counted in the backend
+        if there is one, else on the star schema
+
+        Returns:
+            df_years: medals per country and year
+            df_countries: medals per country summed over the years
+        """
+        def build():
+            filters = {} if sport == "All Sports" else {"Sport": sport}
+            if self.backend is not None:
+                df = self.backend.count_medals("athlete_iso", "Country", "ISO", "Year", **filters)
+            # the sport is found by its code in the star schema
+            else:
+                df = self.athlete_star.count_medals("Country", "ISO", "Year", **filters)
+            df_years = df.sort_values(by=["Year", "ISO"])
+
+            # Sum over all years (country and medals)
+            df_countries = df_years.groupby(["Country", "ISO"])[
+                ["Gold", "Silver", "Bronze", "Total"]
+            ].sum().reset_index()
+            return df_years, df_countries
+        return self.cached(f"world_medals/{sport}", build)
+
+    @property
+    def world_top_indexes(self):
+        """
+        Top-10 lookups of the world bar charts:
+            "countries": countries per (sport, medal), summed over the years
+            "country_years": country-years per (sport, medal)
+        """
+        def build():
+            top_countries = af.top_n_index(
+                af.count_medals_n(self.athlete_star, "Sport", "Country", "ISO"), ["Sport"]
+            )
+            top_country_years = af.top_n_index(
+                af.count_medals_n(self.athlete_star, "Sport", "Country", "ISO", "Year"), ["Sport"]
+            )
+            for (medal,), df_top in af.top_n_index(
+                af.count_medals_n(self.athlete_star, "Country", "ISO"), []
+            ).items():
+                top_countries[("All Sports", medal)] = df_top
+            for (medal,), df_top in af.top_n_index(
+                af.count_medals_n(self.athlete_star, "Country", "ISO", "Year"), []
+            ).items():
+                top_country_years[("All Sports", medal)] = df_top
+            return {"countries": top_countries, "country_years": top_country_years}
+        return self.cached("world_top_indexes", build)
+
+    def warm_up(self):
+        """Reads all tables now, instead of on first use"""
+        for table in ["canada", "noc_iso", "athlete_star"]:
+            getattr(self, table)
+        # with a database backend, the dashboards read athlete_regions from it
+        if self.backend is None:
+            self.regions_star
+        return self
+
+
+class DataManager:
+    """The current DataContext, replaced by a new one when the data files change"""
+    def __init__(self, data_path="data/", warm_up=None):
+        """
+        Input:
+            data_path: directory with the data files
+            warm_up: function computing the aggregates, run for a new
+                DataContext (through DataProxy) before it is swapped in
+        """
+        self.data_path = data_path
+        self.warm_ups = [warm_up] if warm_up is not None else []
+        self.current = DataContext(data_path)
+        self._pinned = threading.local()
+        self._reload_lock = threading.Lock()
+        self._servers = set()
+        self._watching = False
+
+    def add_warm_up(self, warm_up):
+        """Adds a warm_up function, e.g. of another dashboard sharing this manager"""
+        self.warm_ups.append(warm_up)
+
+    def snapshot(self):
+        """The DataContext pinned to this thread, otherwise the current one"""
+        return getattr(self._pinned, "context", None) or self.current
+
+    @contextlib.contextmanager
+    def pinned(self, context=None):
+        """Pins context (default: the current one) to this thread"""
+        previous = getattr(self._pinned, "context", None)
+        context = context or self.current
+        context.acquire()
+        self._pinned.context = context
+        try:
+            yield context
+        finally:
+            self._pinned.context = previous
+            context.release()
+
+    def init_server(self, server):
+        """
+        Pins the current DataContext to every request of the Flask server,
+        so a request started before a swap finishes on the old data.
+        Call it before other before_request hooks use the data. A server
+        is set up only once, when dashboards share it
+        """
+        if id(server) in self._servers:
+            return
+        self._servers.add(id(server))
+
+        @server.before_request
+        def pin_data():
+            context = self.current
+            context.acquire()
+            self._pinned.context = context
+
+        @server.teardown_request
+        def unpin_data(exc):
+            context = getattr(self._pinned, "context", None)
+            self._pinned.context = None
+            if context is not None:
+                context.release()
+
+    def reload(self):
+        """
+        Loads the data files again when they changed, computes the
+        aggregates, and swaps the new DataContext in
+
+        Returns:
+            True when a new DataContext was swapped in
+        """
+        with self._reload_lock:
+            if data_fingerprint(self.current.data_files) == self.current.fingerprint:
+                return False
+
+            context = DataContext(self.data_path, previous=self.current)
+            with self.pinned(context):
+                context.warm_up()
+                for warm_up in self.warm_ups:
+                    warm_up()
+            # the old version isn't kept alive by the new one
+            context.previous = None
+
+            # the files changed again while loading, next check tries again
+            if data_fingerprint(context.data_files) != context.fingerprint:
+                context.retire()
+                return False
+
+            # one assignment, requests see either the old or the new context
+            old, self.current = self.current, context
+            # closed once the requests started on it are done
+            old.retire()
+            return True
+
+    def watch(self, interval=RELOAD_INTERVAL):
+        """
+        Checks the data files every interval seconds, in a background
+        thread (one thread per manager, None when it runs already)
+        """
+        if self._watching:
+            return None
+        self._watching = True
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload():
+                        logging.getLogger(__name__).info(
+                            "data reloaded, version %s", self.current.fingerprint
+                        )
+                except Exception:
+                    # keep serving the old data, e.g. a file only half written
+                    logging.getLogger(__name__).exception("data reload failed")
+
+        thread = threading.Thread(target=run, name="data-reload", daemon=True)
+        thread.start()
+        return thread
+
+
+class DataProxy:
+    """Stands in for the DataContext of the current request (DataManager.snapshot)"""
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self.manager.snapshot(), name)
+
+
+# One DataManager per data directory for all dashboards in a process
+_shared_managers = {}
+_shared_lock = threading.Lock()
+
+
+def shared_manager(data_path="data/"):
+    """
+    Gives back the DataManager of data_path shared by all dashboards in
+    this process, made on first use
+    """
+    with _shared_lock:
+        if data_path not in _shared_managers:
+            _shared_managers[data_path] = DataManager(data_path)
+        return _shared_managers[data_path]
@@ -0,0 +1,284 @@
+# Static export of Q3_dashboard_main: every combination of the dropdowns,
+# radio items and slider ranges is computed once, in parallel, and written
+# as compressed figure JSON (identical responses stored once). Together
+# with the dashboard's own html/js and a thin client (static_client.js)
+# answering the callbacks from these files, any static file server can
+# host the dashboard.
+#
+# Usage:
+#   python export_static.py                                  (into build/static/)
+#   python export_static.py --only sum-medals-map top10-graph --processes 8
+#   python -m http.server --directory build/static           (open /index.html)
+#
+# The pages are written as page-1.html etc., for servers mapping /page-1 to
+# page-1.html (GitHub Pages, Netlify, nginx try_files $uri $uri.html).
+# Not exported: what depends on free input (athlete search, crossfilter
+# clicks and selections), only single countries in the rank chart.
+
+# Load libraries
+import argparse
+import gzip
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+
+import geo_assets
+
+
+STATIC_CLIENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static_client.js")
+EXPORT_DIR = "export/"
+PAGES = ["/", "/page-1", "/page-2", "/page-3"]
+
+
+def input_domains(dashboard):
+    """
+    Gives back the values every input can take, as {"id.property": values}.
+    Callbacks with an input or state not in here are not exported
+    """
+    data = dashboard.data
+    years = sorted(dashboard.af.count_medals_n(data.canada, "Year")["Year"])
+    slider_years = list(range(years[0], years[-1] + 1, 2))
+
+    def values(options):
+        return [option["value"] for option in options]
+
+    return {
+        "url.pathname": PAGES,
+        "medal-picker-radio.value": dashboard.medal_list,
+        "time-slider.value": [
+            [start, end] for start, end in
+            itertools.combinations_with_replacement(slider_years, 2)
+        ],
+        "attribute-dropdown.value": list(dashboard.attr_dict),
+        "gender-picker-radio.value": values(dashboard.gender_options),
+        "athlete-radio.value": values(dashboard.athlete_options),
+        "sport-dropdown-world.value": data.sport_list,
+        "medal-radio-world.value": dashboard.medal_list,
+        "selected-country.data": [None],
+        "selected-athletes.data": [None],
+        "region-dropdown.value": data.region_list,
+        "athlete-radio-world.value": values(dashboard.athlete_options),
+        "total-athletes-radio.value": values(dashboard.all_athletes_options_radio),
+        "bands-attribute-radio.value": values(dashboard.physique_options),
+        "bands-gender-radio.value": values(dashboard.gender_options),
+        "rank-countries-dropdown.value": [[country] for country in data.ranked_countries],
+        "rank-season-radio.value": values(dashboard.season_options),
+        "athlete-search-dropdown.value": [None],
+    }
+
+
+def value_key(values):
+    """Lookup key of the input values, the same as JSON.stringify in static_client.js"""
+    return json.dumps(values, separators=(",", ":"), ensure_ascii=False)
+
+
+def request_body(output, callback, values):
+    """Body of the POST to /_dash-update-component, like the browser sends it"""
+    dependencies = callback["inputs"] + callback.get("state", [])
+    specs = [
+        {"id": dependency["id"], "property": dependency["property"], "value": value}
+        for dependency, value in zip(dependencies, values)
+    ]
+    outputs = [
+        dict(zip(("id", "property"), item.rsplit(".", 1)))
+        for item in output.strip(".").split("...")
+    ]
+    return {
+        "output": output,
+        "outputs": outputs if output.startswith("..") else outputs[0],
+        "inputs": specs[:len(callback["inputs"])],
+        "state": specs[len(callback["inputs"]):],
+        "changedPropIds": [],
+    }
+
+
+def exported_callbacks(app, domains, only=None):
+    """
+    Gives back the server callbacks with all inputs in domains
+
+    Returns:
+        callbacks: list of (output key, callback, list of value lists)
+    """
+    callbacks = []
+    for output, callback in app.callback_map.items():
+        if "callback" not in callback or callback.get("clientside_function"):
+            continue
+        if only and not any(name in output for name in only):
+            continue
+        dependencies = [
+            f"{dependency['id']}.{dependency['property']}"
+            for dependency in callback["inputs"] + callback.get("state", [])
+        ]
+        if all(dependency in domains for dependency in dependencies):
+            callbacks.append((output, callback, [domains[name] for name in dependencies]))
+    return callbacks
+
+
+# Worker processes: the dashboard is imported once per process
+_worker = {}
+
+
+def init_worker(module, out_dir):
+    dashboard = importlib.import_module(module)
+    _worker["app"] = dashboard.app
+    _worker["client"] = dashboard.app.server.test_client()
+    _worker["out_dir"] = out_dir
+    _worker["dropdown_options"] = {
+        "region-dropdown": [
+            {"label": region, "value": region} for region in dashboard.data.region_list
+        ],
+        "rank-countries-dropdown": [
+            {"label": country, "value": country} for country in dashboard.data.ranked_countries
+        ],
+    }
+
+
+def with_all_regions(response):
+    """
+    The region and rank country dropdowns get their options while typing,
+    which needs the server: the exported page 3 lists all of them instead
+    """
+    def walk(component):
+        if isinstance(component, list):
+            for child in component:
+                walk(child)
+        elif isinstance(component, dict) and "props" in component:
+            options = _worker["dropdown_options"].get(component["props"].get("id"))
+            if options is not None:
+                component["props"]["options"] = options
+            walk(component["props"].get("children"))
+
+    walk(response.get("response", {}).get("page-content", {}).get("children"))
+    return response
+
+
+def export_combination(task):
+    """
+    Computes one callback response and writes it, named by its hash
+
+    Returns:
+        (output, value key, figure hash or None when there is no update)
+    """
+    output, values = task
+    callback = _worker["app"].callback_map[output]
+    prefix = _worker["app"].config.requests_pathname_prefix
+    response = _worker["client"].post(
+        prefix + "_dash-update-component", json=request_body(output, callback, values)
+    )
+    if response.status_code != 200:
+        return output, value_key(values), None
+
+    body = response.data
+    if output == "page-content.children":
+        body = json.dumps(with_all_regions(json.loads(body))).encode()
+
+    figure_hash = hashlib.sha1(body).hexdigest()[:20]
+    path = os.path.join(_worker["out_dir"], EXPORT_DIR, "figures", figure_hash + ".json.gz")
+    if not os.path.exists(path):
+        # written under another name first, processes may write the same figure
+        temporary = f"{path}.{os.getpid()}"
+        with open(temporary, "wb") as f:
+            f.write(gzip.compress(body, compresslevel=9))
+        os.replace(temporary, path)
+    return output, value_key(values), figure_hash
+
+
+def export_frontend(app, out_dir):
+    """
+    Writes the html pages, the javascript of dash and its components, the
+    assets and the world map geometry
+    """
+    client = app.server.test_client()
+    prefix = app.config.requests_pathname_prefix
+
+    def write(url_path, body):
+        path = os.path.join(out_dir, url_path.split("?")[0].lstrip("/"))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+
+    index = client.get(prefix).data.decode()
+    # the thin client has to be there before the dash renderer starts
+    index = index.replace("<head>", '<head>\n<script src="/static_client.js"></script>', 1)
+    for page in PAGES:
+        write(("index" if page == "/" else page) + ".html", index.encode())
+
+    # files linked from the page, with their fingerprinted names
+    urls = re.findall(r'(?:src|href)="(/[^"]+)"', index)
+    # chunks loaded later by the components (e.g. the graph and plotly.js)
+    for package, paths in app.registered_paths.items():
+        for path in paths:
+            if not path.endswith(".map"):
+                urls.append(f"{prefix}_dash-component-suites/{package}/{path}")
+    urls += [prefix + "_dash-layout", prefix + "_dash-dependencies"]
+    # the topojson at the URL in the config of the maps, /geo/<version>/
+    # (not bundled: the maps load it from the plotly CDN)
+    if geo_assets.bundled():
+        urls += [geo_assets.topojson_url() + name for name in geo_assets.topojson_files.values()]
+
+    for url in urls:
+        if url == "/static_client.js":
+            continue
+        response = client.get(url)
+        if response.status_code == 200:
+            write(url, response.data)
+    shutil.copy(STATIC_CLIENT, os.path.join(out_dir, "static_client.js"))
+
+
+def export(module="Q3_dashboard_main", out_dir="build/static", processes=None, only=None):
+    dashboard = importlib.import_module(module)
+    app = dashboard.app
+    os.makedirs(os.path.join(out_dir, EXPORT_DIR, "figures"), exist_ok=True)
+
+    callbacks = exported_callbacks(app, input_domains(dashboard), only)
+    tasks = [
+        (output, list(values))
+        for output, _, domains in callbacks
+        for values in itertools.product(*domains)
+    ]
+    print(f"{len(callbacks)} callbacks, {len(tasks)} combinations")
+
+    index = {output: {} for output, _, _ in callbacks}
+    with multiprocessing.Pool(processes, init_worker, (module, out_dir)) as pool:
+        for done, (output, key, figure_hash) in enumerate(
+            pool.imap_unordered(export_combination, tasks, chunksize=16), 1
+        ):
+            if figure_hash is not None:
+                index[output][key] = figure_hash
+            if done % 1000 == 0:
+                print(f"    {done}/{len(tasks)}")
+
+    # one index file per callback, the manifest tells which file is which
+    manifest = {}
+    for number, (output, entries) in enumerate(index.items()):
+        name = f"callback-{number}.json"
+        manifest[output] = name
+        with open(os.path.join(out_dir, EXPORT_DIR, name), "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, separators=(",", ":"))
+    with open(os.path.join(out_dir, EXPORT_DIR, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    export_frontend(app, out_dir)
+
+    figures = os.listdir(os.path.join(out_dir, EXPORT_DIR, "figures"))
+    size = sum(
+        os.path.getsize(os.path.join(out_dir, EXPORT_DIR, "figures", name)) for name in figures
+    )
+    print(f"{sum(len(entries) for entries in index.values())} responses, "
+          f"{len(figures)} distinct files, {size / 1e6:.1f} MB compressed, in {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Static export of the dashboard")
+    parser.add_argument("--module", default="Q3_dashboard_main")
+    parser.add_argument("--out", default="build/static", help="output directory")
+    parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--only", nargs="+",
+                        help="only callbacks with one of these in their outputs, e.g. top10-graph")
+    args = parser.parse_args()
+    export(args.module, args.out, args.processes, args.only)
@@ -0,0 +1,166 @@
+# Functions for serving the world map geometry (topojson) from our own
+# server, so the choropleth maps work without the plotly CDN
+#
+# The files are plotly's own topojson (world_110m.json, world_50m.json).
+# Fetch them once where there is internet, and bundle data/topojson/
+# with the deployment:
+#   python geo_assets.py download
+#
+# The URLs have a hash of the file contents in them (/geo/<version>/), so
+# the browsers may keep a file for good: new files get new URLs.
+
+# Load libraries
+import functools
+import gzip
+import hashlib
+import os
+import sys
+import urllib.request
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+TOPOJSON_DIR = "data/topojson/"
+# plotly.js asks for <topojsonURL>world_<resolution>m.json, the topojsonURL
+# is TOPOJSON_URL<version>/
+TOPOJSON_URL = "/geo/"
+CDN_URL = "https://cdn.plot.ly/un/"
+
+# Resolutions plotly offers: 110 (simplified, small) and 50 (detailed)
+topojson_files = {110: "world_110m.json", 50: "world_50m.json"}
+
+# A versioned URL never changes its content, so browsers and proxies may
+# keep it for a year; an old version is answered with the current files,
+# checked again with the ETag every time
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+CACHE_CONTROL_OLD_VERSION = "no-cache"
+
+
+def bundled(path=TOPOJSON_DIR):
+    """True when all topojson files are there to be served locally"""
+    return all(os.path.exists(path + name) for name in topojson_files.values())
+
+
+def version(path=TOPOJSON_DIR):
+    """Hash of the contents of the topojson files, the version in their URLs"""
+    stamps = tuple(
+        (os.stat(path + name).st_size, os.stat(path + name).st_mtime_ns)
+        for name in topojson_files.values()
+    )
+    return _content_version(path, stamps)
+
+
+@functools.lru_cache(maxsize=8)
+def _content_version(path, stamps):
+    # stamps: size and mtime of the files, read again when they changed
+    sha1 = hashlib.sha1()
+    for name in topojson_files.values():
+        with open(path + name, "rb") as f:
+            sha1.update(f.read())
+    return sha1.hexdigest()[:12]
+
+
+def topojson_url(path=TOPOJSON_DIR):
+    """URL of the topojson files, with their version: /geo/<version>/"""
+    return f"{TOPOJSON_URL}{version(path)}/"
+
+
+def graph_config(path=TOPOJSON_DIR):
+    """
+    Gives back the dcc.Graph config for a map: with the local topojson
+    when it is bundled, otherwise plotly's CDN is used as before
+    """
+    if not bundled(path):
+        return {}
+    return {"topojsonURL": topojson_url(path)}
+
+
+def load_variants(path=TOPOJSON_DIR):
+    """
+    Reads the topojson files and compresses them once
+
+    Returns:
+        variants: dict with (file name, encoding) as key and the bytes as
+            value, encoding is None, "gzip" or "br"
+    """
+    variants = {}
+    for name in topojson_files.values():
+        with open(path + name, "rb") as f:
+            body = f.read()
+        variants[(name, None)] = body
+        variants[(name, "gzip")] = gzip.compress(body, compresslevel=9)
+        if brotli is not None:
+            variants[(name, "br")] = brotli.compress(body, quality=11)
+    return variants
+
+
+def init_geo_assets(server, path=TOPOJSON_DIR):
+    """
+    Adds the route TOPOJSON_URL<version>/<file name> to the Flask server,
+    when the topojson files are bundled. A server is set up only once, when
+    dashboards share it
+
+    Returns:
+        True when the files are served locally
+    """
+    if not bundled(path):
+        return False
+    if "topojson" in server.view_functions:
+        return True
+
+    variants = load_variants(path)
+    current_version = version(path)
+    etags = {
+        name: '"' + hashlib.sha1(variants[(name, None)]).hexdigest() + '"'
+        for name in topojson_files.values()
+    }
+
+    @server.route(TOPOJSON_URL + "<file_version>/<name>")
+    def topojson(file_version, name):
+        if name not in etags:
+            flask.abort(404)
+
+        request = flask.request
+        if etags[name] in request.headers.get("If-None-Match", ""):
+            response = flask.Response(status=304)
+        else:
+            accepted = request.headers.get("Accept-Encoding", "")
+            encoding = None
+            if "br" in accepted and (name, "br") in variants:
+                encoding = "br"
+            elif "gzip" in accepted:
+                encoding = "gzip"
+
+            response = flask.Response(variants[(name, encoding)], mimetype="application/json")
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+            response.headers["Vary"] = "Accept-Encoding"
+
+        response.headers["ETag"] = etags[name]
+        if file_version == current_version:
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = CACHE_CONTROL_OLD_VERSION
+        return response
+
+    return True
+
+
+def download(path=TOPOJSON_DIR, url=CDN_URL):
+    """Fetches the topojson files from the plotly CDN into path"""
+    os.makedirs(path, exist_ok=True)
+    for name in topojson_files.values():
+        print(f"{url}{name} -> {path}{name}")
+        urllib.request.urlretrieve(url + name, path + name)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["download"]:
+        download(*sys.argv[2:3])
+    else:
+        print("Usage: python geo_assets.py download [path]")
@@ -0,0 +1,182 @@
+# Functions for HTTP caching (ETag, Cache-Control) and compression of
+# the Dash responses
+#
+# Callback responses are POSTs: browsers and proxies don't cache them and
+# the Dash renderer doesn't send If-None-Match, so they get an ETag but
+# are only answered with 304 for clients sending it themselves. The GET
+# resources (the layout, _dash-dependencies and the medals API) are
+# revalidated by the browser cache and answered with 304 when unchanged.
+
+# Load libraries
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+CALLBACK_PATH = "_dash-update-component"
+
+# GET resources of the Dash apps, with an ETag of their body
+APP_RESOURCES = ("_dash-layout", "_dash-dependencies")
+
+
+class CompressedCache:
+    """Size-bounded store of precompressed response bodies, least recently used is removed first"""
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes and self.entries:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+
+
+def callback_etag(fingerprint, body, path=""):
+    """
+    Gives back the ETag for a callback request
+
+    Input:
+        fingerprint: data fingerprint (callback_cache.data_fingerprint)
+        body: json body of the callback request
+        path: url path of the request, dashboards on one server can have
+            callbacks with the same outputs and inputs
+
+    Returns:
+        etag: quoted hex string
+    """
+    # changedPropIds is part of the key: callbacks answering with a Patch
+    # give a different response depending on which input triggered
+    request_key = {
+        key: body.get(key) for key in ("output", "inputs", "state", "changedPropIds")
+    }
+    payload = fingerprint + path + json.dumps(request_key, sort_keys=True)
+    return '"' + hashlib.sha1(payload.encode()).hexdigest() + '"'
+
+
+def resource_etag(fingerprint, full_path):
+    """ETag of a GET resource made from the data, e.g. /api/medals?group=Year"""
+    return '"' + hashlib.sha1((fingerprint + full_path).encode()).hexdigest() + '"'
+
+
+def choose_encoding(accept_encoding):
+    """Gives back the best supported content encoding, or None"""
+    accepted = [part.split(";")[0].strip() for part in accept_encoding.split(",")]
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def init_http_cache(server, fingerprint, max_age=0, min_size=1024, cache=None,
+                    data_blueprints=("medals_api",)):
+    """
+    Adds ETag, Cache-Control and compression to the callback responses and
+    GET resources of a Flask server. A callback request or a GET of
+    data_blueprints with a matching If-None-Match header is answered with
+    304 before it runs; the layout and _dash-dependencies are compared by
+    the ETag of their body.
+
+    Input:
+        server: Flask server (app.server)
+        fingerprint: data fingerprint, or function giving back the current one
+        max_age: seconds clients and proxies may reuse a response unvalidated
+        min_size: smallest response (bytes) to compress
+        cache: CompressedCache for precompressed bodies
+        data_blueprints: names of the blueprints whose GET responses only
+            change with the data (and their url)
+
+    Returns:
+        cache: the CompressedCache in use
+    """
+    cache = cache if cache is not None else CompressedCache()
+    current_fingerprint = fingerprint if callable(fingerprint) else lambda: fingerprint
+
+    @server.before_request
+    def check_etag():
+        request = flask.request
+        if request.method == "GET" and request.blueprint in data_blueprints:
+            etag = resource_etag(current_fingerprint(), request.full_path)
+        elif request.method == "POST" and request.path.endswith(CALLBACK_PATH):
+            body = request.get_json(silent=True)
+            if body is None:
+                return None
+            etag = callback_etag(current_fingerprint(), body, request.path)
+        else:
+            return None
+        flask.g.callback_etag = etag
+
+        # Client already has this response, skip the callback (or query)
+        if etag in request.headers.get("If-None-Match", ""):
+            response = flask.Response(status=304)
+            response.headers["ETag"] = etag
+            return response
+        return None
+
+    @server.after_request
+    def add_cache_headers(response):
+        request = flask.request
+        etag = flask.g.pop("callback_etag", None)
+        if response.status_code != 200:
+            return response
+        if etag is None and request.method == "GET" and request.path.endswith(APP_RESOURCES):
+            # depends on the code as well as the data: the ETag of the body
+            response.add_etag()
+            response.make_conditional(request)
+            etag = response.headers["ETag"]
+            if response.status_code == 304:
+                return response
+        if etag is None:
+            return response
+
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = f"public, max-age={max_age}, must-revalidate"
+        response.headers["Vary"] = "Accept-Encoding"
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding is None or "Content-Encoding" in response.headers:
+            return response
+        if response.direct_passthrough or response.content_length is None \
+                or response.content_length < min_size:
+            return response
+
+        # The same ETag always has the same body, so compress it only once
+        body = cache.get((etag, encoding))
+        if body is None:
+            body = compress(response.get_data(), encoding)
+            cache.put((etag, encoding), body)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    return cache
@@ -0,0 +1,196 @@
+# Distinct counts of athletes and countries with HyperLogLog sketches
+#
+# DistinctCounter keeps the hashes of the values exactly while there are
+# few of them (no more than the bytes of the registers), and turns into a
+# HyperLogLog sketch beyond that: 2**p registers with the most leading
+# zeros seen per register, about 1.04 / sqrt(2**p) relative error (1.6%
+# for p=12). Counters merge, exactly while the union stays small.
+#
+# ParticipationSketches keeps a counter of athlete IDs and of countries
+# per Sport x Year x Country cell, and per Year with all sports and/or all
+# countries, built in one pass over the athlete table. The distinct counts
+# of a filter merge at most one cell per year.
+
+# Load libraries
+import numpy as np
+import pandas as pd
+
+
+ALL_SPORTS = "All Sports"
+ALL_COUNTRIES = "All countries"
+
+# (target, column of the athlete table) counted per cell
+TARGETS = {"athletes": "ID", "countries": "Country"}
+
+
+def hash_values(values):
+    """64-bit hashes of an array of values (numbers or strings)"""
+    return pd.util.hash_array(np.asarray(values))
+
+
+class DistinctCounter:
+    """Distinct count of hashed values, exact while small, HyperLogLog beyond"""
+    def __init__(self, p=12):
+        # the register bits and the rank bits have to fit in a float exactly
+        if not 11 <= p <= 18:
+            raise ValueError("p must be between 11 and 18")
+        self.p = p
+        # sorted distinct hashes in exact mode, None as HyperLogLog
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.registers = None
+
+    @property
+    def exact(self):
+        return self.registers is None
+
+    @property
+    def exact_limit(self):
+        """Most hashes kept exactly, as many bytes as the registers"""
+        return 2 ** self.p // 8
+
+    def add_hashes(self, hashes):
+        """Adds 64-bit hashes (from hash_values)"""
+        if self.exact:
+            if len(self.hashes):
+                self.hashes = np.union1d(self.hashes, hashes)
+            else:
+                self.hashes = np.unique(hashes)
+            if len(self.hashes) > self.exact_limit:
+                self.registers = np.zeros(2 ** self.p, dtype=np.uint8)
+                self.update_registers(self.hashes)
+                self.hashes = None
+        else:
+            self.update_registers(hashes)
+        return self
+
+    def add(self, values):
+        return self.add_hashes(hash_values(values))
+
+    def update_registers(self, hashes):
+        """The first p bits choose the register, the rank of the rest is kept if higher"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        rest_bits = 64 - self.p
+        register = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64(2 ** rest_bits - 1)
+        # position of the highest set bit + 1 (0 for 0), exact below 2**53
+        exponent = np.frexp(rest.astype(np.float64))[1]
+        rank = (rest_bits + 1 - exponent).astype(np.uint8)
+        np.maximum.at(self.registers, register, rank)
+
+    def merge(self, other):
+        """Adds the values counted by other, a DistinctCounter with the same p"""
+        if other.exact:
+            return self.add_hashes(other.hashes)
+        if self.exact:
+            hashes = self.hashes
+            self.registers = other.registers.copy()
+            self.hashes = None
+            self.update_registers(hashes)
+        else:
+            np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def copy(self):
+        counter = DistinctCounter(self.p)
+        counter.hashes = None if self.hashes is None else self.hashes.copy()
+        counter.registers = None if self.registers is None else self.registers.copy()
+        return counter
+
+    def count(self):
+        """Number of distinct values, estimated in HyperLogLog mode"""
+        if self.exact:
+            return len(self.hashes)
+        m = 2 ** self.p
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        # linear counting is better for small counts
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class ParticipationSketches:
+    """Distinct athletes and countries per Sport, Year and Country, mergeable"""
+    def __init__(self, athlete_df=None, p=12, chunk_size=100_000):
+        self.p = p
+        # {target: {(Sport, Year, Country): DistinctCounter}}, Sport and
+        # Country can be ALL_SPORTS and ALL_COUNTRIES
+        self.counters = {target: {} for target in TARGETS}
+        self.years = set()
+        if athlete_df is not None:
+            for start in range(0, len(athlete_df), chunk_size):
+                self.update(athlete_df.iloc[start:start + chunk_size])
+
+    def update(self, athlete_df):
+        """Adds the athlete rows (columns like athlete_iso) to the counters of their cells"""
+        df = athlete_df[["Sport", "Year", "Country"]]
+        self.years.update(df["Year"].unique().tolist())
+        hashes = {
+            target: hash_values(athlete_df[column].to_numpy())
+            for target, column in TARGETS.items()
+        }
+
+        # the cells, and the same cells over all sports and/or all countries
+        for columns in [["Sport", "Year", "Country"], ["Year", "Country"],
+                        ["Sport", "Year"], ["Year"]]:
+            cells = df.groupby(columns if len(columns) > 1 else columns[0], sort=False).indices
+            for cell, positions in cells.items():
+                values = dict(zip(columns, cell if len(columns) > 1 else (cell,)))
+                key = (
+                    values.get("Sport", ALL_SPORTS), values["Year"],
+                    values.get("Country", ALL_COUNTRIES)
+                )
+                for target, target_hashes in hashes.items():
+                    counters = self.counters[target]
+                    if key not in counters:
+                        counters[key] = DistinctCounter(self.p)
+                    counters[key].add_hashes(target_hashes[positions])
+        return self
+
+    def query(self, target, sport=ALL_SPORTS, years=None, country=ALL_COUNTRIES):
+        """
+        Merges the counters of the years for a sport and country
+
+        Input:
+            target: "athletes" or "countries"
+            sport: a sport or ALL_SPORTS
+            years: list of years, None: all
+            country: a country or ALL_COUNTRIES
+
+        Returns:
+            DistinctCounter of the distinct values in those cells
+        """
+        years = sorted(self.years) if years is None else years
+        counters = self.counters[target]
+        merged = DistinctCounter(self.p)
+        for year in years:
+            counter = counters.get((sport, year, country))
+            if counter is not None:
+                merged.merge(counter)
+        return merged
+
+    def per_year(self, sport=ALL_SPORTS, country=ALL_COUNTRIES):
+        """
+        Returns:
+            DataFrame with Year, Athletes, Countries, and Exact (False when
+            a count is a HyperLogLog estimate), only years with athletes
+        """
+        rows = []
+        for year in sorted(self.years):
+            athletes = self.counters["athletes"].get((sport, year, country))
+            if athletes is None:
+                continue
+            countries = self.counters["countries"][(sport, year, country)]
+            rows.append([
+                year, athletes.count(), countries.count(), athletes.exact and countries.exact
+            ])
+        return pd.DataFrame(rows, columns=["Year", "Athletes", "Countries", "Exact"])
+
+    def memory_usage(self):
+        """Bytes of the hashes and registers of all counters"""
+        return sum(
+            counter.hashes.nbytes if counter.exact else counter.registers.nbytes
+            for counters in self.counters.values()
+            for counter in counters.values()
+        )
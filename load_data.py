@@ -1,10 +1,6 @@
-import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly_express as px
-import plotly.graph_objects as go
-from datetime import datetime
+
+import parse_cache
 
 ## The clean data process OOP is inspired by the following referenes:
 # 1. https://opendatascience.com/an-introduction-to-object-oriented-data-science-in-python/
@@ -13,21 +9,33 @@ from datetime import datetime
 
 class ShowMeData:
     """The class is used for the intention to parse data, check missing data, clean missing data, and then export cleaned data"""
-    def __init__(self, name, import_path="data/", export_path="data_clean/", sheet_name = None):
+    def __init__(self, name, import_path="data/", export_path="data_clean/", sheet_name = None, use_cache = True):
         self.name = name
+        # parsed files are kept in an on-disk cache (parse_cache.py)
+        self.use_cache = use_cache
         self.sheetname = sheet_name
         self.datatype = name.split(".")[-1]
         self.import_path = import_path
         self.export_path = export_path
 
-    def parse_data(self): 
+    def read_data(self):
         if self.datatype == "csv":
-            self.df = pd.read_csv(self.import_path+self.name)
+            return pd.read_csv(self.import_path+self.name)
         elif self.datatype == "xlsx":
-            self.df = pd.read_excel(self.import_path+self.name, sheet_name=self.sheetname)
+            return pd.read_excel(self.import_path+self.name, sheet_name=self.sheetname)
+
+    def parse_data(self): 
+        if self.use_cache and self.datatype in ("csv", "xlsx"):
+            self.df = parse_cache.cached_parse(
+                self.import_path+self.name, self.read_data, self.sheetname
+            )
+        else:
+            self.df = self.read_data()
         return self.df
 
     def show_info(self):
+        if not hasattr(self, "df"):
+            self.parse_data()
         return f"""
         Dataframe info:\n{self.df.info()}
 
@@ -35,7 +43,7 @@ class ShowMeData:
 
         Sheet name: {self.sheetname}
 
-        Data head():\n{self.parse_data().head()}
+        Data head():\n{self.df.head()}
 
         Shape: {self.df.shape}
 
@@ -0,0 +1,305 @@
+# Load test of a dashboard: simulated users click through scripted sessions
+# (page navigation, dropdowns, medal radios, slider drags), and every
+# callback the browser would fire is posted to /_dash-update-component.
+# Reports throughput, latency percentiles and payload size per callback.
+#
+# Usage:
+#   python load_test.py                                (in-process test client)
+#   python load_test.py --users 16 --sessions 4
+#   python load_test.py --url http://127.0.0.1:8050    (running server, e.g. gunicorn)
+
+# Load libraries
+import argparse
+import http.cookiejar
+import importlib
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Session scripts: a list of (component id.property, choices) changes, made
+# one after another like a user would. Every user picks one of the choices
+# at random, so the users don't all ask for the same figures.
+SESSIONS = {
+    "canada": [
+        ("url.pathname", ["/page-1"]),
+        ("medal-picker-radio.value", ["Gold", "Silver", "Bronze"]),
+        ("time-slider.value", [[1900, 1960], [1920, 2000], [1950, 2016]]),
+        ("time-slider.value", [[1960, 2016], [1980, 2000]]),
+        ("medal-picker-radio.value", ["Total", "Gold"]),
+        ("url.pathname", ["/page-2"]),
+        ("attribute-dropdown.value", ["Sport", "Event", "Name", "Games"]),
+        ("gender-picker-radio.value", ["F", "M", "Both"]),
+        ("athlete-radio.value", ["Age", "Height", "Weight"]),
+    ],
+    "world": [
+        ("url.pathname", ["/page-3"]),
+        ("sport-dropdown-world.value", ["Swimming", "Athletics", "Ice Hockey", "Judo"]),
+        ("medal-radio-world.value", ["Gold", "Silver", "Bronze"]),
+        ("medal-radio-world.value", ["Total", "Gold"]),
+        ("sport-dropdown-world.value", ["All Sports", "Football", "Rowing"]),
+        ("region-dropdown.search_value", ["can", "swe", "nor"]),
+        ("athlete-radio-world.value", ["Height", "Weight", "Age"]),
+        ("total-athletes-radio.value", ["Yes", "No"]),
+        ("bands-gender-radio.value", ["F", "M"]),
+        ("bands-attribute-radio.value", ["Age", "Weight"]),
+    ],
+}
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of values, nearest rank"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+class TestClientTransport:
+    """Posts to the Flask test client of an app, in this process"""
+    def __init__(self, app):
+        # a client of its own, with its own cookies, like a browser
+        self.client = app.server.test_client()
+        self.prefix = app.config.requests_pathname_prefix
+
+    def post(self, body):
+        response = self.client.post(self.prefix + "_dash-update-component", json=body)
+        return response.status_code, response.data
+
+
+class HTTPTransport:
+    """Posts to a running server, with the cookies of one browser"""
+    def __init__(self, url, prefix="/"):
+        self.url = url.rstrip("/") + prefix + "_dash-update-component"
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def post(self, body):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+def server_callbacks(app):
+    """The callbacks of app run on the server, {output key: callback}"""
+    # clientside callbacks run in the browser, not on the server
+    return {
+        key: callback for key, callback in app.callback_map.items()
+        if "callback" in callback and not callback.get("clientside_function")
+    }
+
+
+def layout_props(component, props=None):
+    """
+    Gives back {"id.property": value} of all components in a layout (json),
+    "id.id" is there for every component with an id
+    """
+    props = {} if props is None else props
+    if isinstance(component, list):
+        for child in component:
+            layout_props(child, props)
+    elif isinstance(component, dict) and "props" in component:
+        component_id = component["props"].get("id")
+        for name, value in component["props"].items():
+            if name == "children":
+                layout_props(value, props)
+            elif isinstance(component_id, str):
+                props[f"{component_id}.{name}"] = value
+    return props
+
+
+def dependency_props(dependencies):
+    return [f"{dependency['id']}.{dependency['property']}" for dependency in dependencies]
+
+
+class Renderer:
+    """
+    One simulated browser: the values of the components on the page, and
+    the callbacks the Dash renderer posts when they change
+
+    Input:
+        callbacks: server_callbacks of the app
+        transport: TestClientTransport or HTTPTransport, one per browser
+        values: {"id.property": value} on the page, "id.id" for every
+            component (None: the empty page at /)
+        record: function(key, status, seconds, size) called per request
+    """
+    def __init__(self, callbacks, transport, values=None, record=None):
+        self.callbacks = callbacks
+        self.transport = transport
+        self.values = {"url.id": "url", "url.pathname": "/"} if values is None else dict(values)
+        self.record = record
+
+    def body(self, key, changed):
+        callback = self.callbacks[key]
+
+        def spec(dependency):
+            prop = f"{dependency['id']}.{dependency['property']}"
+            return {"id": dependency["id"], "property": dependency["property"],
+                    "value": self.values.get(prop)}
+
+        outputs = [
+            dict(zip(("id", "property"), output.rsplit(".", 1)))
+            for output in key.strip(".").split("...")
+        ]
+        return {
+            "output": key,
+            "outputs": outputs if key.startswith("..") else outputs[0],
+            "inputs": [spec(dependency) for dependency in callback["inputs"]],
+            "state": [spec(dependency) for dependency in callback.get("state", [])],
+            "changedPropIds": changed,
+        }
+
+    def post(self, key, changed):
+        """Posts the callback key, gives back the status and the payload"""
+        start = time.perf_counter()
+        status, payload = self.transport.post(self.body(key, changed))
+        if self.record is not None:
+            self.record(key, status, time.perf_counter() - start, len(payload))
+        return status, payload
+
+    def callbacks_of(self, changed):
+        """
+        Callbacks with an input in changed (or on a component new on the
+        page), and all inputs on the page
+        """
+        return [
+            key for key, callback in self.callbacks.items()
+            if any(prop in changed or prop.rsplit(".", 1)[0] + ".id" in changed
+                   for prop in dependency_props(callback["inputs"]))
+            and all(f"{dependency['id']}.id" in self.values for dependency in callback["inputs"])
+        ]
+
+    def change(self, props):
+        """
+        Sets values ({"id.property": value}) and fires the callbacks
+        depending on them, and then the callbacks depending on their
+        outputs, each once, as the renderer does
+
+        Returns:
+            fired: keys of the callbacks posted
+        """
+        self.values.update(props)
+        pending = list(props)
+        fired = set()
+        while pending:
+            keys = [key for key in self.callbacks_of(set(pending)) if key not in fired]
+            changed, pending = set(pending), []
+            for key in keys:
+                inputs = dependency_props(self.callbacks[key]["inputs"])
+                status, payload = self.post(key, [prop for prop in inputs if prop in changed])
+                fired.add(key)
+                if status != 200:
+                    continue
+                for component_id, values in json.loads(payload).get("response", {}).items():
+                    for name, value in values.items():
+                        prop = f"{component_id}.{name}"
+                        self.values[prop] = value
+                        pending.append(prop)
+                        if name == "children":
+                            # a new page: its components start with their initial values
+                            new_props = layout_props(value)
+                            self.values.update(new_props)
+                            pending.extend(new_props)
+        return fired
+
+    def run(self, script, rng):
+        """Makes the changes of a session script, with values chosen by rng"""
+        for prop, choices in script:
+            value = rng.choice(choices)
+            # an unchanged value fires no callback (except navigation)
+            if self.values.get(prop) == value and prop != "url.pathname":
+                continue
+            self.change({prop: value})
+
+
+class LoadTest:
+    """Runs sessions of users at the same time and collects the timings"""
+    def __init__(self, app, new_transport):
+        self.callbacks = server_callbacks(app)
+        # every user gets a transport of its own (cookies, connection)
+        self.new_transport = new_transport
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def record(self, key, status, seconds, size):
+        with self.lock:
+            self.timings.setdefault(key, []).append((status, seconds, size))
+
+    def user(self, number, sessions, scripts, seed):
+        rng = random.Random(seed + number)
+        transport = self.new_transport()
+        for _ in range(sessions):
+            name = rng.choice(scripts)
+            Renderer(self.callbacks, transport, record=self.record).run(SESSIONS[name], rng)
+
+    def run(self, users, sessions, scripts, seed=0):
+        """
+        Runs users simulated users, each doing sessions sessions
+
+        Returns:
+            seconds: wall time of the whole run
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            for future in [
+                pool.submit(self.user, number, sessions, scripts, seed)
+                for number in range(users)
+            ]:
+                future.result()
+        return time.perf_counter() - start
+
+    def report(self, seconds, users):
+        requests = sum(len(timings) for timings in self.timings.values())
+        errors = sum(
+            status >= 400 for timings in self.timings.values() for status, _, _ in timings
+        )
+        print(f"{users} users, {requests} requests in {seconds:.1f} s: "
+              f"{requests / seconds:.1f} requests/s, {errors} errors")
+        print(f"{'callback (outputs)':60} {'n':>5} {'p50 ms':>8} {'p90 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8} {'mean kB':>8}")
+        for key, timings in sorted(self.timings.items(), key=lambda item: -len(item[1])):
+            times = [seconds * 1000 for _, seconds, _ in timings]
+            sizes = [size for _, _, size in timings]
+            print(f"{key.strip('.')[:60]:60} {len(timings):5d} {percentile(times, 50):8.1f} "
+                  f"{percentile(times, 90):8.1f} {percentile(times, 99):8.1f} "
+                  f"{max(times):8.1f} {sum(sizes) / len(sizes) / 1024:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of a dashboard: simulated users click through "
+                    "scripted sessions, with the latency and payload size per callback"
+    )
+    parser.add_argument("--module", default="Q3_dashboard_main",
+                        help="dashboard module with the Dash app")
+    parser.add_argument("--url", help="post to a running server instead of the test client")
+    parser.add_argument("--users", type=int, default=8, help="simulated users at the same time")
+    parser.add_argument("--sessions", type=int, default=3, help="sessions per user")
+    parser.add_argument("--scripts", nargs="+", default=list(SESSIONS), choices=list(SESSIONS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # the callbacks are read from the app in both cases
+    app = importlib.import_module(args.module).app
+    if args.url:
+        new_transport = lambda: HTTPTransport(args.url, app.config.requests_pathname_prefix)
+    else:
+        new_transport = lambda: TestClientTransport(app)
+
+    load_test = LoadTest(app, new_transport)
+    seconds = load_test.run(args.users, args.sessions, args.scripts, args.seed)
+    load_test.report(seconds, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Medal table per Games: countries ranked by Gold, then Silver, then Bronze
+#
+# All Games are ranked at once with np.lexsort, and when results are
+# appended only the Games they belong to are ranked again.
+
+# Load libraries
+import numpy as np
+import pandas as pd
+
+import analyze_functions as af
+
+
+class MedalRankings:
+    """Per-Games medal table ranks of all countries"""
+    def __init__(self, athlete_df):
+        self.counts = self.count(athlete_df)
+        self.table = self.rank(self.counts)
+
+    @staticmethod
+    def count(athlete_df):
+        """Medals per Games and country, with the Season and Year of the Games"""
+        return af.count_medals_n(athlete_df, "Games", "Season", "Year", "Country")
+
+    @staticmethod
+    def rank(counts):
+        """
+        Ranks the countries within every Games, one lexsort for all Games
+
+        Input:
+            counts: DataFrame from count, with Games, Season, Year, Country
+                and the medal columns
+
+        Returns:
+            table: DataFrame with Games, Season, Year, Country (categorical),
+                Gold, Silver, Bronze, Total and Rank, sorted by Games and Rank.
+                Countries with the same medals share a rank (1, 2, 2, 4)
+        """
+        games = counts["Games"].to_numpy()
+        gold = counts["Gold"].to_numpy()
+        silver = counts["Silver"].to_numpy()
+        bronze = counts["Bronze"].to_numpy()
+
+        # the last key is the primary one: Games, then most Gold, Silver, Bronze
+        games_codes = pd.factorize(games, sort=True)[0]
+        order = np.lexsort((-bronze, -silver, -gold, games_codes))
+
+        games_codes = games_codes[order]
+        medals = np.column_stack((gold, silver, bronze))[order]
+
+        # a new Games starts, or the medals differ from the row above
+        position = np.arange(len(order))
+        new_games = np.r_[True, games_codes[1:] != games_codes[:-1]]
+        new_medals = new_games | np.r_[True, (medals[1:] != medals[:-1]).any(axis=1)]
+
+        # first position of the Games, and of the group of tied countries
+        games_start = np.maximum.accumulate(np.where(new_games, position, 0))
+        tie_start = np.maximum.accumulate(np.where(new_medals, position, 0))
+
+        table = counts.iloc[order].reset_index(drop=True)
+        # the same table from a DataFrame (columns named Medal) and a StarSchema
+        table.columns.name = None
+        table["Rank"] = (tie_start - games_start + 1).astype(np.int16)
+        for column in ["Games", "Season", "Country"]:
+            table[column] = table[column].astype("category")
+        table["Year"] = table["Year"].astype(np.int16)
+        for column in ["Gold", "Silver", "Bronze", "Total"]:
+            table[column] = table[column].astype(np.int32)
+        return table
+
+    def copy(self):
+        """Copy sharing the frames: append replaces them, it doesn't change them"""
+        rankings = MedalRankings.__new__(MedalRankings)
+        rankings.counts, rankings.table = self.counts, self.table
+        return rankings
+
+    def append(self, athlete_df):
+        """
+        Adds new results (rows like athlete_iso) and ranks again only the
+        Games they belong to
+
+        Returns:
+            games: list of the Games which were ranked again
+        """
+        new_counts = self.count(athlete_df)
+        if new_counts.empty:
+            return []
+        games = new_counts["Games"].unique().tolist()
+
+        keys = ["Games", "Season", "Year", "Country"]
+        affected = self.counts["Games"].isin(games)
+        counts = (
+            pd.concat([self.counts[affected], new_counts])
+            .groupby(keys, as_index=False)[["Bronze", "Gold", "Silver", "Total"]]
+            .sum()
+        )
+        self.counts = pd.concat([self.counts[~affected], counts], ignore_index=True)
+
+        kept = self.table[~self.table["Games"].isin(games)]
+        # categoricals with other categories are concatenated as plain strings
+        table = pd.concat([kept, self.rank(counts)], ignore_index=True)
+        self.table = self.rank_order(table)
+        return games
+
+    @staticmethod
+    def rank_order(table):
+        """Sorts by Games and Rank, with compact column types again"""
+        table = table.sort_values(["Games", "Rank", "Country"], ignore_index=True)
+        for column in ["Games", "Season", "Country"]:
+            table[column] = table[column].astype("category")
+        return table
+
+    def games(self, games):
+        """Medal table of one Games, e.g. "1988 Winter" """
+        return self.table[self.table["Games"] == games].reset_index(drop=True)
+
+    def rank_history(self, countries, season="Summer"):
+        """
+        Rank of countries in every Games of a season
+
+        Returns:
+            df: DataFrame with Year, Country and Rank, sorted by Year
+        """
+        table = self.table
+        df = table[(table["Season"] == season) & table["Country"].isin(countries)]
+        df = df.loc[:, ["Year", "Country", "Rank"]]
+        df["Country"] = df["Country"].astype(str)
+        return df.sort_values(["Year", "Country"], ignore_index=True)
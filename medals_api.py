@@ -0,0 +1,191 @@
+# Read-only query API over the medal aggregates, mounted on the dashboard server
+#
+# Example:
+#   /api/medals?group=Country,Year&sport=Swimming&format=ndjson&limit=100&offset=200
+#   /api/medals?group=Country&from=1980&to=2000      (Games from 1980 to 2000)
+
+# Load libraries
+import functools
+import json
+
+import flask
+import numpy as np
+import pandas as pd
+
+import analyze_functions as af
+from star_schema import StarSchema
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+# Columns the medals can be grouped and filtered by
+group_columns = [
+    "Country", "ISO", "NOC", "Year", "Season", "Games",
+    "Sport", "Event", "Sex", "City"
+]
+filter_columns = {
+    "sport": "Sport",
+    "season": "Season",
+    "country": "Country",
+    "sex": "Sex",
+}
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+def error_response(message, status=400):
+    response = flask.jsonify({"error": message})
+    response.status_code = status
+    return response
+
+
+def create_blueprint(athlete_df, url_prefix="/api", cache_size=256, version=None,
+                     partitions=None):
+    """
+    Gives back a Flask blueprint with the medal query endpoints
+
+    Input:
+        athlete_df: DataFrame with one row per athlete and event (athlete_iso)
+            or its StarSchema (counted on the codes), or a function giving
+            it back (so it can be loaded on first use)
+        url_prefix: where the endpoints are mounted
+        cache_size: number of aggregated queries kept in memory
+        version: function giving back the data version, cached queries of
+            other versions are not used (None: the data never changes)
+        partitions: function giving back athlete_df as YearPartitions
+            (year_partitions.py), year ranges then read only their Games
+
+    Returns:
+        blueprint: flask.Blueprint, register it with server.register_blueprint
+    """
+    blueprint = flask.Blueprint("medals_api", __name__, url_prefix=url_prefix)
+    get_athlete_df = athlete_df if callable(athlete_df) else lambda: athlete_df
+    get_version = version if version is not None else lambda: None
+
+    @functools.lru_cache(maxsize=cache_size)
+    def query(data_version, group, filters, years=(None, None)):
+        """
+        Medals grouped by the columns in group, filters is a tuple of
+        (column, value), years the first and last year (None: no limit),
+        data_version is only part of the cache key
+        """
+        athlete_df = get_athlete_df()
+        # counted on the codes, the years as a row mask (unless partitioned)
+        if isinstance(athlete_df, StarSchema) and (years == (None, None) or partitions is None):
+            year = athlete_df.column("Year")
+            rows = np.ones(len(year), dtype=bool)
+            if years[0] is not None:
+                rows &= year >= years[0]
+            if years[1] is not None:
+                rows &= year <= years[1]
+            return athlete_df.count_medals(*group, rows=rows, **dict(filters))
+
+        if years == (None, None):
+            df = athlete_df
+        elif partitions is None:
+            df = athlete_df
+            if years[0] is not None:
+                df = df[df["Year"] >= years[0]]
+            if years[1] is not None:
+                df = df[df["Year"] <= years[1]]
+        else:
+            year_partitions = partitions()
+            columns = list(group) + [column for column, _ in filters]
+            # added up from the medal counts of the Games in the range
+            if all(column in year_partitions.aggregate_columns for column in columns):
+                return year_partitions.medals(*years, *group, **dict(filters))
+            df = year_partitions.events(*years)
+
+        for column, value in filters:
+            df = df[df[column] == value]
+        # no medals at all for this selection
+        if df["Medal"].notna().sum() == 0:
+            return pd.DataFrame(columns=[*group, "Bronze", "Gold", "Silver", "Total"])
+        df_medals = af.count_medals_n(df, *group)
+        return df_medals.sort_values(list(group)).reset_index(drop=True)
+
+    @blueprint.route("/medals")
+    def medals():
+        args = flask.request.args
+
+        group = tuple(column for column in args.get("group", "Country").split(",") if column)
+        unknown = [column for column in group if column not in group_columns]
+        if not group or unknown:
+            return error_response(f"group must be among {group_columns}, got {unknown or 'nothing'}")
+
+        filters = tuple(
+            (column, args[name]) for name, column in filter_columns.items() if name in args
+        )
+
+        try:
+            limit = min(int(args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+            offset = int(args.get("offset", 0))
+        except ValueError:
+            return error_response("limit and offset must be integers")
+        try:
+            years = tuple(int(args[name]) if name in args else None for name in ["from", "to"])
+        except ValueError:
+            return error_response("from and to must be years")
+        # a page of 0 rows would link to itself as the next page
+        if limit < 1 or offset < 0:
+            return error_response("limit must be at least 1, offset must not be negative")
+
+        df = query(get_version(), group, filters, years)
+        page = df.iloc[offset:offset + limit]
+
+        output_format = args.get("format", "ndjson")
+        if output_format == "ndjson":
+            response = flask.Response(
+                flask.stream_with_context(ndjson_lines(page)),
+                mimetype="application/x-ndjson"
+            )
+        elif output_format == "arrow":
+            if pa is None:
+                return error_response("format=arrow needs pyarrow installed", status=406)
+            response = flask.Response(
+                arrow_stream(page), mimetype="application/vnd.apache.arrow.stream"
+            )
+        else:
+            return error_response("format must be ndjson or arrow")
+
+        # pagination info, the next page is left out on the last page
+        response.headers["X-Total-Count"] = str(len(df))
+        if offset + limit < len(df):
+            next_args = args.to_dict()
+            next_args.update(offset=offset + limit, limit=limit)
+            response.headers["Link"] = '<{}>; rel="next"'.format(
+                flask.url_for("medals_api.medals", **next_args)
+            )
+        return response
+
+    @blueprint.route("/medals/columns")
+    def columns():
+        return flask.jsonify({
+            "group": group_columns,
+            "filters": filter_columns,
+            "years": ["from", "to"],
+            "formats": ["ndjson", "arrow"] if pa is not None else ["ndjson"],
+        })
+
+    return blueprint
+
+
+def ndjson_lines(df, chunk_size=500):
+    """Yields the DataFrame as newline delimited json, chunk_size rows at a time"""
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        for record in json.loads(chunk.to_json(orient="records")):
+            yield json.dumps(record) + "\n"
+
+
+def arrow_stream(df):
+    """Gives back the DataFrame as Arrow IPC stream bytes"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
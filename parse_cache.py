@@ -0,0 +1,207 @@
+# On-disk cache of parsed data files, used by ShowMeData (load_data.py)
+#
+# A parsed file is kept under a key of its path, size, modification time,
+# content hash and sheet name, so any change of the file is a new entry.
+# Numeric and date columns are stored as .npy files and read back memory
+# mapped (copy on write, the file is not changed), the other columns are
+# pickled. Excel files, slow to parse, load almost at once the second time.
+#
+# The least recently used entries are removed when the cache is larger than
+# OLYMPICS_PARSE_CACHE_BYTES (default 1 GB), in OLYMPICS_PARSE_CACHE_DIR
+# (default .parse_cache/).
+
+# Load libraries
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_DIR = os.environ.get("OLYMPICS_PARSE_CACHE_DIR", ".parse_cache")
+MAX_BYTES = int(os.environ.get("OLYMPICS_PARSE_CACHE_BYTES", 2 ** 30))
+
+# Column dtypes stored as .npy: bool, integers, floats, complex, dates
+NPY_KINDS = "biufcmM"
+
+# content hashes of the files seen in this process,
+# {(path, inode, size, mtime, ctime): hash}
+_content_hashes = {}
+_lock = threading.Lock()
+
+
+def content_hash(path, stat):
+    """
+    sha1 of the file, hashed once per size and modification time; the
+    change time is part of the key, a write with the modification time set
+    back (os.utime, copy tools) still changes it
+    """
+    key = (
+        os.path.abspath(path), stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns
+    )
+    with _lock:
+        if key in _content_hashes:
+            return _content_hashes[key]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            digest.update(chunk)
+    with _lock:
+        _content_hashes[key] = digest.hexdigest()
+    return _content_hashes[key]
+
+
+def cache_key(path, sheet_name=None):
+    """
+    Key of a parsed file
+
+    Input:
+        path: data file
+        sheet_name: sheet(s) of an Excel file, part of the key
+
+    Returns:
+        hex string, changes with the path, size, mtime, content or sheet_name
+    """
+    stat = os.stat(path)
+    parts = [
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+        content_hash(path, stat), repr(sheet_name)
+    ]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def write_frame(directory, df):
+    """Writes a DataFrame as .npy columns and a pickle of the rest"""
+    os.makedirs(directory)
+    columns = []
+    for position in range(df.shape[1]):
+        values = df.iloc[:, position]
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in NPY_KINDS:
+            file_name = f"column-{position}.npy"
+            np.save(os.path.join(directory, file_name), values.to_numpy())
+            columns.append(("npy", file_name))
+        else:
+            columns.append(("pickle", values.array))
+    meta = {"columns": df.columns, "index": df.index, "data": columns}
+    with open(os.path.join(directory, "frame.pkl"), "wb") as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_frame(directory):
+    """Reads a DataFrame written by write_frame, the .npy columns memory mapped"""
+    with open(os.path.join(directory, "frame.pkl"), "rb") as f:
+        meta = pickle.load(f)
+    arrays = {}
+    for position, (kind, value) in enumerate(meta["data"]):
+        if kind == "npy":
+            # copy on write: changes stay in memory, the cache is not changed
+            value = np.load(os.path.join(directory, value), mmap_mode="c")
+        arrays[position] = value
+    df = pd.DataFrame(arrays, index=meta["index"], copy=False)
+    df.columns = meta["columns"]
+    return df
+
+
+def write_entry(directory, result):
+    """Writes a parsed result: a DataFrame, or a dict of them (Excel sheets)"""
+    if isinstance(result, dict):
+        os.makedirs(directory)
+        sheets = list(result)
+        for number, sheet in enumerate(sheets):
+            write_frame(os.path.join(directory, f"sheet-{number}"), result[sheet])
+        with open(os.path.join(directory, "sheets.pkl"), "wb") as f:
+            pickle.dump(sheets, f)
+    else:
+        write_frame(directory, result)
+
+
+def read_entry(directory):
+    sheets_path = os.path.join(directory, "sheets.pkl")
+    if not os.path.exists(sheets_path):
+        return read_frame(directory)
+    with open(sheets_path, "rb") as f:
+        sheets = pickle.load(f)
+    return {
+        sheet: read_frame(os.path.join(directory, f"sheet-{number}"))
+        for number, sheet in enumerate(sheets)
+    }
+
+
+def entry_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """
+    Removes the least recently used entries until the cache is at most max_bytes
+
+    Returns:
+        number of entries removed
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        directory = os.path.join(cache_dir, name)
+        if os.path.isdir(directory) and not name.startswith("."):
+            entries.append((os.path.getmtime(directory), entry_size(directory), directory))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, directory in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def cached_parse(path, parser, sheet_name=None, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """
+    Gives back parser() for the file at path, from the cache when the file
+    was parsed before
+
+    Input:
+        path: data file
+        parser: function without arguments parsing the file, giving back a
+            DataFrame or a dict of DataFrames
+        sheet_name: the sheet_name given to the parser, part of the key
+        cache_dir: where the entries are kept
+        max_bytes: size of the cache, least recently used entries are removed
+
+    Returns:
+        the parsed DataFrame (or dict of DataFrames)
+    """
+    directory = os.path.join(cache_dir, cache_key(path, sheet_name))
+    if os.path.isdir(directory):
+        try:
+            result = read_entry(directory)
+            # used now, evicted last
+            os.utime(directory)
+            return result
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # removed by another process, or only half there
+            pass
+
+    result = parser()
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary = os.path.join(cache_dir, f".{os.path.basename(directory)}.{os.getpid()}")
+    shutil.rmtree(temporary, ignore_errors=True)
+    try:
+        write_entry(temporary, result)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temporary, directory)
+    except OSError:
+        # the cache is only an optimization: a full disk or another
+        # process writing the same entry doesn't stop the parse
+        shutil.rmtree(temporary, ignore_errors=True)
+        return result
+    evict(cache_dir, max_bytes)
+    return result
@@ -0,0 +1,242 @@
+# Opt-in profiling of live callbacks (OLYMPICS_PROFILING=1): ask the server
+# to profile the next N calls of a callback, then fetch the result as
+# collapsed stacks for a flame graph (flamegraph.pl, speedscope.app)
+#
+# Usage, with the server started with OLYMPICS_PROFILING=1:
+#   curl -X POST "localhost:8050/debug/profile/World-3?n=5"   (arm)
+#   ... use the dashboard ...
+#   curl localhost:8050/debug/profile/World-3                  (phases per call)
+#   curl localhost:8050/debug/profile/World-3/collapsed > world3.folded
+#
+# The stacks are sampled from one thread for the process while profiled
+# callbacks run, speculative computations are never profiled. The
+# first frame of every stack is the phase it belongs to: count_medals_n,
+# pandas filtering, px figure, JSON serialization or callback code.
+# Without OLYMPICS_PROFILING=1 the callbacks are not wrapped at all.
+
+# Load libraries
+import collections
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+
+import flask
+from plotly.io.json import to_json_plotly
+
+
+ENABLED = os.environ.get("OLYMPICS_PROFILING") == "1"
+URL = "/debug/profile/"
+
+# Seconds between two samples of the stack
+INTERVAL = 0.001
+
+# Calls kept per callback
+MAX_RESULTS = 20
+
+# (phase, test on the file name and function name of a frame), the first
+# frame from the callback inwards that matches gives the phase of a sample
+PHASES = [
+    ("count_medals_n", lambda path, name: name in ("count_medals_n", "count_medals")),
+    ("JSON serialization", lambda path, name: name == "serialize_result"
+        or "plotly/io/_json" in path or "/json/" in path),
+    ("px figure", lambda path, name: "plotly/express/" in path
+        or "plotly/graph_objs/" in path or "plotly/basedatatypes" in path),
+    ("pandas filtering", lambda path, name: "/pandas/" in path),
+]
+OTHER_PHASE = "callback code"
+
+_registered = set()
+_armed = {}
+_results = {}
+_lock = threading.Lock()
+
+
+class Sampler:
+    """
+    Samples the stacks of the threads running profiled calls. One sampler
+    thread serves all calls of the process: it runs, and the switch
+    interval is lowered, only while at least one call is profiled
+    """
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        # {call: (thread id, Counter of its stacks)}
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.stop_event = None
+
+    def run(self, stop_event):
+        while not stop_event.wait(self.interval):
+            current_frames = sys._current_frames()
+            with self.lock:
+                # a newer sampler thread took over
+                if stop_event.is_set():
+                    return
+                for thread_id, stacks in self.calls.values():
+                    frame = current_frames.get(thread_id)
+                    frames = []
+                    while frame is not None:
+                        code = frame.f_code
+                        frames.append((code.co_filename, code.co_name))
+                        frame = frame.f_back
+                    frames.reverse()
+                    stacks[tuple(frames)] += 1
+
+    @contextlib.contextmanager
+    def sample(self, thread_id):
+        """Samples the stack of thread_id in the with block, gives the Counter of stacks"""
+        call = object()
+        stacks = collections.Counter()
+        with self.lock:
+            self.calls[call] = (thread_id, stacks)
+            if len(self.calls) == 1:
+                # other threads get the GIL more often, so the samples come on time
+                self.switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(self.interval / 4)
+                self.stop_event = threading.Event()
+                threading.Thread(
+                    target=self.run, args=(self.stop_event,), name="profiler", daemon=True
+                ).start()
+        try:
+            yield stacks
+        finally:
+            with self.lock:
+                del self.calls[call]
+                if not self.calls:
+                    self.stop_event.set()
+                    sys.setswitchinterval(self.switch_interval)
+
+
+sampler = Sampler()
+
+
+def phase(frames, start):
+    """Phase of a sampled stack, frames[start:] are inside the callback"""
+    for path, name in frames[start:]:
+        for phase_name, test in PHASES:
+            if test(path.replace("\\", "/"), name):
+                return phase_name
+    return OTHER_PHASE
+
+
+def frame_label(path, name):
+    return f"{os.path.splitext(os.path.basename(path))[0]}.{name}"
+
+
+def serialize_result(result):
+    """
+    Serializes the result like dash does after the callback returned, so
+    the JSON serialization shows up in the profile
+    """
+    return to_json_plotly(result)
+
+
+def profiled(callback_id):
+    """
+    Decorator: profiles the next calls of the function when armed through
+    the endpoint, the function is given back unchanged when not ENABLED
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        _registered.add(callback_id)
+
+        @functools.wraps(func)
+        def profiled_call(*args):
+            with _lock:
+                remaining = _armed.get(callback_id, 0)
+                if remaining:
+                    _armed[callback_id] = remaining - 1
+            if not remaining:
+                return func(*args)
+
+            start = time.perf_counter()
+            with sampler.sample(threading.get_ident()) as stacks:
+                result = func(*args)
+                serialize_result(result)
+            seconds = time.perf_counter() - start
+
+            record(callback_id, args, seconds, stacks)
+            return result
+        return profiled_call
+    return decorator
+
+
+def record(callback_id, args, seconds, stacks):
+    """Keeps the samples of one call, with the stacks starting at the callback"""
+    collapsed = collections.Counter()
+    phases = collections.Counter()
+    for frames, count in stacks.items():
+        # the stack below the callback (server, dash) is the same for all samples
+        names = [name for _, name in frames]
+        start = names.index("profiled_call") + 1 if "profiled_call" in names else 0
+        phase_name = phase(frames, start)
+        phases[phase_name] += count
+        labels = [phase_name] + [frame_label(*frame) for frame in frames[start:]]
+        collapsed[";".join(labels)] += count
+
+    samples = sum(phases.values()) or 1
+    result = {
+        "args": [repr(arg)[:200] for arg in args],
+        "seconds": seconds,
+        "samples": sum(phases.values()),
+        # seconds per phase, the wall time split by the share of samples
+        "phases": {name: seconds * count / samples for name, count in phases.most_common()},
+        "collapsed": collapsed,
+    }
+    with _lock:
+        results = _results.setdefault(callback_id, [])
+        results.append(result)
+        del results[:-MAX_RESULTS]
+
+
+def init_profiling(server):
+    """
+    Adds the profiling endpoint to the Flask server, when ENABLED
+
+    Returns:
+        True when the endpoint was added
+    """
+    if not ENABLED:
+        return False
+
+    @server.route(URL, methods=["GET"])
+    def profile_index():
+        with _lock:
+            return flask.jsonify({
+                "callbacks": sorted(_registered),
+                "armed": dict(_armed),
+                "results": {key: len(value) for key, value in _results.items()},
+            })
+
+    @server.route(URL + "<callback_id>", methods=["POST"])
+    def profile_arm(callback_id):
+        if callback_id not in _registered:
+            flask.abort(404)
+        n = flask.request.args.get("n", 1, type=int)
+        with _lock:
+            _armed[callback_id] = n
+            _results.pop(callback_id, None)
+        return flask.jsonify({"callback": callback_id, "armed": n})
+
+    @server.route(URL + "<callback_id>", methods=["GET"])
+    def profile_result(callback_id):
+        with _lock:
+            results = list(_results.get(callback_id, []))
+        return flask.jsonify([
+            {key: value for key, value in result.items() if key != "collapsed"}
+            for result in results
+        ])
+
+    @server.route(URL + "<callback_id>/collapsed", methods=["GET"])
+    def profile_collapsed(callback_id):
+        collapsed = collections.Counter()
+        with _lock:
+            for result in _results.get(callback_id, []):
+                collapsed.update(result["collapsed"])
+        lines = [f"{stack} {count}" for stack, count in sorted(collapsed.items())]
+        return flask.Response("\n".join(lines) + "\n", mimetype="text/plain")
+
+    return True
@@ -0,0 +1,214 @@
+# Quantile sketches of the athlete physique (Age, Height, Weight)
+#
+# KLLSketch is a KLL sketch: values are kept in levels, a value on level h
+# stands for 2**h values. A full level is sorted and every other value is
+# moved up one level, so a sketch keeps about 3k values whatever the number
+# of values it has seen. Two sketches merge into one sketch of all their
+# values, with the same error (about 1.7/k in rank for k=200).
+#
+# PhysiqueSketches keeps one sketch per Sport x Year x Sex x Medal status
+# cell (and per Year x Sex x Medal status over all sports), built in one
+# pass over the athlete table in chunks. The quantiles of any filter are
+# read from the merged sketches of the matching cells, at most a few cells
+# per year, so the cost doesn't grow with the number of athlete rows.
+
+# Load libraries
+import math
+import random
+
+import numpy as np
+import pandas as pd
+
+
+# Medal status of athletes without a medal
+NO_MEDAL = "None"
+MEDAL_STATUSES = ["Gold", "Silver", "Bronze", NO_MEDAL]
+
+ALL_SPORTS = "All Sports"
+
+
+class KLLSketch:
+    """Mergeable quantile sketch of a stream of numbers"""
+    def __init__(self, k=200):
+        self.k = k
+        self.levels = [np.empty(0)]
+        # number of values seen, and kept
+        self.n = 0
+        self.size = 0
+        self._rng = None
+
+    def capacity(self, level):
+        """Values level can keep, smaller the further below the top level"""
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        """Adds values (a number or an array), NaN is skipped"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.levels[0] = np.concatenate((self.levels[0], values))
+            self.n += len(values)
+            self.size += len(values)
+            self.compress()
+        return self
+
+    def merge(self, other):
+        """Adds the values of other, a KLLSketch, to this sketch"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, values in enumerate(other.levels):
+            if len(values):
+                self.levels[level] = np.concatenate((self.levels[level], values))
+        self.n += other.n
+        self.size += other.size
+        self.compress()
+        return self
+
+    def copy(self):
+        sketch = KLLSketch(self.k)
+        sketch.levels = list(self.levels)
+        sketch.n = self.n
+        sketch.size = self.size
+        return sketch
+
+    def compress(self):
+        """Compacts the lowest full level until the sketch fits in its capacity"""
+        while self.size > sum(self.capacity(level) for level in range(len(self.levels))):
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) >= self.capacity(level):
+                    self.compact(level)
+                    break
+
+    def compact(self, level):
+        """Moves every other value of level (sorted) up one level"""
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        if self._rng is None:
+            self._rng = random.Random(self.n)
+
+        values = np.sort(self.levels[level])
+        # an odd value out stays on this level
+        kept = values[len(values) - len(values) % 2:]
+        pairs = values[:len(values) - len(values) % 2]
+        promoted = pairs[self._rng.randint(0, 1)::2]
+
+        self.levels[level] = kept
+        self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+        self.size -= len(pairs) - len(promoted)
+
+    def quantiles(self, qs):
+        """
+        Input:
+            qs: list of quantiles between 0 and 1
+
+        Returns:
+            list of values at those quantiles (NaN without values), exact
+            as long as the sketch had no level full
+        """
+        if self.n == 0:
+            return [np.nan] * len(qs)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level_values), 2 ** level, dtype=np.int64)
+            for level, level_values in enumerate(self.levels)
+        ])
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side="left")
+        return values[np.minimum(positions, len(values) - 1)].tolist()
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+
+class PhysiqueSketches:
+    """KLL sketches of Age, Height and Weight per Sport, Year, Sex and Medal status"""
+    def __init__(self, athlete_df=None, attributes=("Age", "Height", "Weight"),
+                 k=200, chunk_size=100_000):
+        self.attributes = list(attributes)
+        self.k = k
+        # {attribute: {(Sport, Year, Sex, Medal status): KLLSketch}}
+        self.sketches = {attribute: {} for attribute in self.attributes}
+        self.years = set()
+        if athlete_df is not None:
+            for start in range(0, len(athlete_df), chunk_size):
+                self.update(athlete_df.iloc[start:start + chunk_size])
+
+    def update(self, athlete_df):
+        """Adds the athlete rows (columns like athlete_iso) to the sketches of their cells"""
+        df = athlete_df[["Sport", "Year", "Sex"]].copy()
+        df["Medal status"] = athlete_df["Medal"].fillna(NO_MEDAL)
+        self.years.update(df["Year"].unique().tolist())
+
+        # the cells of the sports, and the same cells over all sports
+        for columns in [["Sport", "Year", "Sex", "Medal status"], ["Year", "Sex", "Medal status"]]:
+            cells = df.groupby(columns, sort=False).indices
+            for attribute in self.attributes:
+                values = athlete_df[attribute].to_numpy(dtype=float)
+                sketches = self.sketches[attribute]
+                for cell, positions in cells.items():
+                    if len(columns) == 3:
+                        cell = (ALL_SPORTS,) + cell
+                    cell_values = values[positions]
+                    cell_values = cell_values[~np.isnan(cell_values)]
+                    if not len(cell_values):
+                        continue
+                    if cell not in sketches:
+                        sketches[cell] = KLLSketch(self.k)
+                    sketches[cell].update(cell_values)
+        return self
+
+    def query(self, attribute, sport=ALL_SPORTS, years=None, sexes=None, medals=None):
+        """
+        Merges the sketches of the cells matching the filters
+
+        Input:
+            attribute: "Age", "Height" or "Weight"
+            sport: a sport or "All Sports"
+            years, sexes, medals: lists of the values to include, None: all.
+                Medal statuses are Gold, Silver, Bronze and NO_MEDAL
+
+        Returns:
+            KLLSketch of the values of all matching athlete rows
+        """
+        years = sorted(self.years) if years is None else years
+        sexes = ["F", "M"] if sexes is None else sexes
+        medals = MEDAL_STATUSES if medals is None else medals
+
+        sketches = self.sketches[attribute]
+        merged = KLLSketch(self.k)
+        for year in years:
+            for sex in sexes:
+                for medal in medals:
+                    sketch = sketches.get((sport, year, sex, medal))
+                    if sketch is not None:
+                        merged.merge(sketch)
+        return merged
+
+    def percentile_bands(self, attribute, qs=(0.1, 0.25, 0.5, 0.75, 0.9),
+                         sport=ALL_SPORTS, sexes=None, medals=None):
+        """
+        Quantiles per Year
+
+        Returns:
+            DataFrame with Year, Count and one column per quantile,
+            only the years with values
+        """
+        rows = []
+        for year in sorted(self.years):
+            sketch = self.query(attribute, sport, [year], sexes, medals)
+            if sketch.n:
+                rows.append([year, sketch.n] + sketch.quantiles(qs))
+        return pd.DataFrame(rows, columns=["Year", "Count"] + list(qs))
+
+    def memory_usage(self):
+        """Bytes of the values kept in all sketches"""
+        return sum(
+            level.nbytes
+            for sketches in self.sketches.values()
+            for sketch in sketches.values()
+            for level in sketch.levels
+        )
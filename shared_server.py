@@ -0,0 +1,45 @@
+# One Flask server for all three dashboards (dashboards.py): every Dash app
+# is mounted under its own path, and they share one DataManager
+# (data_context.shared_manager), so every data file is read once.
+#
+# A dashboard module asks for its dash.Dash arguments with
+# dash_options(__name__): its own server when run alone, the shared server
+# and its path once mount() was called.
+
+# Load libraries
+import flask
+
+
+# Path of every dashboard module on the shared server
+MOUNTS = {
+    "Q3_dashboard_main": "/main/",
+    "Q3_J_dashboard": "/canada/",
+    "Q3_Y_dashboard_world": "/world/",
+}
+
+server = None
+
+
+def mount(flask_server=None):
+    """
+    Makes the dashboards imported from now on mount on one Flask server
+
+    Input:
+        flask_server: Flask server to use (None: a new one)
+
+    Returns:
+        the shared Flask server
+    """
+    global server
+    server = flask_server if flask_server is not None else flask.Flask(__name__)
+    return server
+
+
+def dash_options(module_name):
+    """
+    Gives back the keyword arguments of dash.Dash for a dashboard module:
+    nothing when not mounted, otherwise the shared server and the path
+    """
+    if server is None or module_name not in MOUNTS:
+        return {}
+    return {"server": server, "url_base_pathname": MOUNTS[module_name]}
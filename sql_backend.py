@@ -0,0 +1,298 @@
+# Embedded database backend (SQLite or DuckDB) for the dashboard queries,
+# the pandas functions in analyze_functions stay as the default/fallback
+#
+# Every data version has its own database file (version_path), so a hot
+# reload builds the new file next to the one the old version still reads.
+# The old backend is closed, and its file removed, when the old version
+# is no longer used (DataContext.add_closer). Every process using a file
+# holds a shared lock on <file>.lock, a file is only removed when nobody
+# does, so worker processes sharing the data directory may run different
+# versions for a while.
+
+# Load libraries
+import collections
+import glob
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from callback_cache import hold_shared_lock, remove_unlocked
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# Which backend the dashboard uses: "pandas", "sqlite" or "duckdb"
+BACKEND = os.environ.get("OLYMPICS_BACKEND", "pandas")
+# Base name of the database files, data/olympics-<version>.db
+DATABASE_PATH = os.environ.get("OLYMPICS_DATABASE", "data/olympics.db")
+
+medal_names = ["Bronze", "Gold", "Silver"]
+
+# Indexes for the columns the dashboards filter on (SQLite only, DuckDB
+# uses its own min-max indexes)
+table_indexes = {
+    "athlete_iso": [["Medal", "Sport"], ["Year"]],
+    "athlete_regions": [["region", "Sport"], ["Sport"], ["Medal"]],
+}
+
+
+# Database files of the backends open in this process, {path: backends},
+# and the lock files held for them
+_open_paths = collections.Counter()
+_path_locks = {}
+_open_lock = threading.Lock()
+
+
+def version_path(path, fingerprint):
+    """Database file of one data version, e.g. data/olympics-1a2b3c4d5e6f.db"""
+    root, extension = os.path.splitext(path)
+    return f"{root}-{fingerprint[:12]}{extension}"
+
+
+def quote(column):
+    """Quotes a column name for SQL"""
+    return '"' + column.replace('"', '""') + '"'
+
+
+class SQLBackend:
+    """The data tables in a local database file, with one connection per thread"""
+    def __init__(self, path=DATABASE_PATH, engine="sqlite"):
+        if engine == "duckdb" and duckdb is None:
+            raise ImportError("OLYMPICS_BACKEND=duckdb needs the duckdb package installed")
+        self.path = path
+        self.engine = engine
+        self.local = threading.local()
+        # the connections of all threads, for close()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def connect(self):
+        """A new read-only connection to the database file"""
+        if self.engine == "duckdb":
+            return duckdb.connect(self.path, read_only=True)
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def connection(self):
+        con = getattr(self.local, "con", None)
+        if con is None:
+            with self.lock:
+                if self.closed:
+                    raise RuntimeError(f"{self.path} is closed, its data version was replaced")
+                con = self.connect()
+                self.connections.append(con)
+            self.local.con = con
+        return con
+
+    def close(self):
+        """Closes the connections of all threads"""
+        with self.lock:
+            self.closed = True
+            connections, self.connections = self.connections, []
+        for con in connections:
+            con.close()
+
+    def query(self, sql, params=()):
+        """Gives back the result of sql as a DataFrame"""
+        con = self.connection()
+        if self.engine == "duckdb":
+            return con.execute(sql, list(params)).df()
+        return pd.read_sql_query(sql, con, params=list(params))
+
+    def build(self, tables, fingerprint):
+        """
+        Writes the tables ({name: DataFrame, or DataFrames in chunks, e.g.
+        DataContext.chunks}) to the database file, if it was not built
+        already for the same data fingerprint
+        """
+        if self.fingerprint() == fingerprint:
+            return
+
+        # build into a temporary file, other workers keep reading the old one
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        con = duckdb.connect(tmp_path) if self.engine == "duckdb" else sqlite3.connect(tmp_path)
+        for name, chunks in tables.items():
+            if isinstance(chunks, pd.DataFrame):
+                chunks = [chunks]
+            for number, df in enumerate(chunks):
+                if self.engine == "duckdb":
+                    con.register("df_view", df)
+                    if number == 0:
+                        con.execute(f"CREATE TABLE {quote(name)} AS SELECT * FROM df_view")
+                    else:
+                        con.execute(f"INSERT INTO {quote(name)} SELECT * FROM df_view")
+                    con.unregister("df_view")
+                else:
+                    df.to_sql(name, con, index=False, if_exists="append", chunksize=10000)
+            if self.engine != "duckdb":
+                for columns in table_indexes.get(name, []):
+                    index_name = f"idx_{name}_{'_'.join(columns)}"
+                    con.execute(
+                        f"CREATE INDEX {quote(index_name)} ON {quote(name)} "
+                        f"({', '.join(quote(column) for column in columns)})"
+                    )
+        con.execute("CREATE TABLE meta (fingerprint VARCHAR)")
+        con.execute("INSERT INTO meta VALUES (?)", [fingerprint])
+        con.commit()
+        con.close()
+
+        os.replace(tmp_path, self.path)
+
+    def fingerprint(self):
+        """Fingerprint of the data the database file was built from, or None"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            # a connection of its own: the file may be replaced by build
+            con = self.connect()
+            try:
+                return con.execute("SELECT fingerprint FROM meta").fetchone()[0]
+            finally:
+                con.close()
+        except Exception:
+            return None
+
+    def count_medals(self, table, *arg, **filters):
+        """
+        Gives back number of medals groupby several attributes: *arg,
+        same result as analyze_functions.count_medals_n
+
+        Input:
+            table: name of the table (athlete_iso)
+            *arg: column to get number of "Medal"
+            **filters: column=value to filter on before counting
+
+        Returns:
+            df_medals: new DataFrame
+        """
+        columns = ", ".join(quote(column) for column in arg)
+        medal_sums = ", ".join(
+            f"SUM(CASE WHEN Medal = '{medal}' THEN 1 ELSE 0 END) AS {medal}"
+            for medal in medal_names
+        )
+        where = ["Medal IS NOT NULL"]
+        where += [f"{quote(column)} = ?" for column in filters]
+
+        df_medals = self.query(
+            f"SELECT {columns}, {medal_sums} FROM {quote(table)} "
+            f"WHERE {' AND '.join(where)} GROUP BY {columns} ORDER BY {columns}",
+            filters.values()
+        )
+        df_medals[medal_names] = df_medals[medal_names].astype(int)
+        df_medals["Total"] = df_medals["Gold"] + df_medals["Silver"] + df_medals["Bronze"]
+        return df_medals
+
+    def distinct(self, table, column):
+        """Sorted values of column, without missing values"""
+        df = self.query(
+            f"SELECT DISTINCT {quote(column)} FROM {quote(table)} "
+            f"WHERE {quote(column)} IS NOT NULL ORDER BY {quote(column)}"
+        )
+        return df[column].tolist()
+
+    def athlete_counts(self, table, attribute, medal=None, **filters):
+        """
+        Gives back how many rows have each value of attribute, like
+        value_counts() after filtering
+
+        Input:
+            table: name of the table (athlete_regions)
+            attribute: column to count values of (Age, Height ...)
+            medal: None for all athletes, "Total" for all medal winners,
+                or Gold/Silver/Bronze
+            **filters: column=value to filter on
+
+        Returns:
+            athlete_counts: Series with counts, index is the attribute values
+        """
+        where = [f"{quote(attribute)} IS NOT NULL"]
+        params = list(filters.values())
+        where += [f"{quote(column)} = ?" for column in filters]
+        if medal == "Total":
+            where.append("Medal IS NOT NULL")
+        elif medal is not None:
+            where.append("Medal = ?")
+            params.append(medal)
+
+        df = self.query(
+            f"SELECT {quote(attribute)}, COUNT(*) AS count FROM {quote(table)} "
+            f"WHERE {' AND '.join(where)} GROUP BY {quote(attribute)} "
+            f"ORDER BY count DESC",
+            params
+        )
+        athlete_counts = df.set_index(attribute)["count"]
+        athlete_counts.index.name = None
+        athlete_counts.name = attribute
+        return athlete_counts
+
+
+def open_backend(tables, fingerprint, engine=BACKEND, path=DATABASE_PATH):
+    """
+    Gives back the SQLBackend for engine, built from tables if needed,
+    or None for the pandas backend
+
+    Input:
+        tables: dict with table name and DataFrame (or DataFrames in
+            chunks), only read when the database file has to be built
+        fingerprint: data fingerprint, each one has its own database file
+        engine: "pandas", "sqlite" or "duckdb"
+        path: base name of the database files (version_path)
+
+    Returns:
+        backend: SQLBackend or None, close it with close_backend
+    """
+    if engine == "pandas":
+        return None
+    backend = SQLBackend(version_path(path, fingerprint), engine)
+    with _open_lock:
+        _open_paths[backend.path] += 1
+        if backend.path not in _path_locks:
+            # before the file is built: no other process removes it then
+            _path_locks[backend.path] = hold_shared_lock(backend.path + ".lock")
+    backend.build(tables, fingerprint)
+    remove_unused(path)
+    return backend
+
+
+def close_backend(backend, path=DATABASE_PATH):
+    """Closes backend, and removes the database files no backend uses any more"""
+    backend.close()
+    with _open_lock:
+        _open_paths[backend.path] -= 1
+        if _open_paths[backend.path] <= 0:
+            del _open_paths[backend.path]
+            lock_file = _path_locks.pop(backend.path)
+            if lock_file is not None:
+                lock_file.close()
+    remove_unused(path)
+
+
+def remove_database(version_file):
+    try:
+        os.remove(version_file)
+    except FileNotFoundError:
+        pass
+
+
+def remove_unused(path=DATABASE_PATH):
+    """
+    Removes the database files of other data versions, which no process
+    holds a lock on (not open in this process nor in another one)
+    """
+    root, extension = os.path.splitext(path)
+    pattern = glob.escape(root) + "-*" + extension
+    with _open_lock:
+        version_files = set(glob.glob(pattern))
+        # and the lock files left without their database file
+        version_files.update(lock[:-len(".lock")] for lock in glob.glob(pattern + ".lock"))
+        for version_file in version_files:
+            if version_file not in _open_paths:
+                remove_unlocked(version_file + ".lock", lambda: remove_database(version_file))
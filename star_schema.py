@@ -0,0 +1,250 @@
+# Star schema of the athlete events: an integer fact table (one row per
+# athlete and event) and small dimension tables with the strings
+#
+# The strings of Games, Event, NOC etc. are stored once in their dimension
+# table instead of once per row, and counting medals groups integer codes
+# instead of hashing strings.
+#
+# It is the store of the athlete tables in the dashboards
+# (data_context.athlete_star and regions_star): the csv is read, the star
+# schema built from it and the DataFrame dropped. Medal counts, value
+# counts and row selections are answered on the codes; the aggregates built
+# once (bitmaps, sketches, partitions ...) get a DataFrame materialized from
+# it (frame), which is not kept. On the sample data the two athlete tables
+# take about 12 MB instead of 93 MB.
+
+# Load libraries
+import numpy as np
+import pandas as pd
+
+
+# Dimension tables of athlete_iso: name -> (key column in the fact table,
+# attributes), attributes not in the table are left out
+DIMENSIONS = {
+    "athletes": ("athlete_id", ["ID", "Name", "Sex"]),
+    "games": ("games_id", ["Games", "Year", "Season", "City"]),
+    "events": ("event_id", ["Sport", "Event"]),
+    "countries": ("noc_id", ["NOC", "Team", "Country", "ISO"]),
+}
+
+# athlete_regions has the region of the NOC instead of Country and ISO
+REGION_DIMENSIONS = {
+    **DIMENSIONS,
+    "countries": ("noc_id", ["NOC", "Team", "region", "notes"]),
+}
+
+# Measures kept in the fact table itself
+MEASURES = ["Age", "Height", "Weight"]
+
+# medal_code in the fact table, 0 for no medal
+MEDAL_CODES = {"Bronze": 1, "Silver": 2, "Gold": 3}
+MEDALS = ["Bronze", "Gold", "Silver"]
+# medal name of every medal_code, NaN for no medal like in the csv
+MEDAL_NAMES = np.array([np.nan, "Bronze", "Silver", "Gold"], dtype=object)
+
+
+class StarSchema:
+    """Integer fact table with dimension tables, built from athlete_iso"""
+    def __init__(self, df, dimensions=DIMENSIONS):
+        self.dimensions = {}
+        self.keys = {}
+        fact = {}
+
+        for name, (key, attributes) in dimensions.items():
+            attributes = [attribute for attribute in attributes if attribute in df.columns]
+            if not attributes:
+                continue
+            # one dimension row per combination of the attribute values
+            codes = df.groupby(attributes, sort=True, dropna=False).ngroup().to_numpy()
+            dimension = df.loc[:, attributes].iloc[np.unique(codes, return_index=True)[1]]
+            self.dimensions[name] = dimension.reset_index(drop=True)
+            self.keys[name] = key
+            fact[key] = codes.astype(np.int32 if len(dimension) > 2**15 else np.int16)
+
+        fact["medal_code"] = (
+            df["Medal"].map(MEDAL_CODES).fillna(0).to_numpy().astype(np.int8)
+        )
+        for measure in MEASURES:
+            values = df[measure].to_numpy(dtype=np.float64)
+            # float32 only when no value changes, e.g. not for a weight of 72.3
+            compact = values.astype(np.float32)
+            lossless = np.array_equal(compact, values, equal_nan=True)
+            fact[measure] = compact if lossless else values
+        self.fact = pd.DataFrame(fact)
+
+        # attribute -> (dimension, fact key column)
+        self.attributes = {
+            attribute: (name, self.keys[name])
+            for name, dimension in self.dimensions.items()
+            for attribute in dimension.columns
+        }
+        # the columns of df that frame gives back, in the same order
+        self.columns = [
+            column for column in df.columns
+            if column in self.attributes or column in MEASURES or column == "Medal"
+        ]
+        # attribute -> (code of every dimension row, sorted values)
+        self.lookups = {}
+
+    def __len__(self):
+        return len(self.fact)
+
+    def memory_usage(self):
+        """Bytes of the fact table and of all dimension tables"""
+        return int(self.fact.memory_usage(deep=True).sum()) + sum(
+            int(dimension.memory_usage(deep=True).sum())
+            for dimension in self.dimensions.values()
+        )
+
+    def lookup(self, attribute):
+        """Codes of the attribute values per dimension row, and the values"""
+        if attribute not in self.lookups:
+            name, _ = self.attributes[attribute]
+            # codes is -1 where the value is missing
+            self.lookups[attribute] = pd.factorize(
+                self.dimensions[name][attribute], sort=True
+            )
+        return self.lookups[attribute]
+
+    def codes(self, attribute):
+        """
+        Gives back the attribute of every fact row as integer codes
+
+        Returns:
+            codes: array with one code per fact row, -1 for missing values
+            values: the attribute value of every code
+        """
+        if attribute in MEASURES:
+            return pd.factorize(self.fact[attribute], sort=True)
+        if attribute == "Medal":
+            return self.fact["medal_code"].to_numpy() - 1, pd.Index(MEDAL_NAMES[1:])
+        _, key = self.attributes[attribute]
+        dimension_codes, values = self.lookup(attribute)
+        return dimension_codes[self.fact[key].to_numpy()], values
+
+    def column(self, attribute, rows=None):
+        """
+        Values of the attribute per fact row, with the dtype of the csv column
+
+        Input:
+            attribute: column of the table, e.g. "Sport", "Year", "Age", "Medal"
+            rows: positions or boolean mask of the fact rows (None: all)
+        """
+        if attribute in MEASURES:
+            values = self.fact[attribute].to_numpy()
+            return (values if rows is None else values[rows]).astype(np.float64)
+        if attribute == "Medal":
+            keys = self.fact["medal_code"].to_numpy()
+            return MEDAL_NAMES[keys if rows is None else keys[rows]]
+        name, key = self.attributes[attribute]
+        keys = self.fact[key].to_numpy()
+        return self.dimensions[name][attribute].to_numpy()[keys if rows is None else keys[rows]]
+
+    def frame(self, columns=None, rows=None, categorical=False):
+        """
+        Materializes the table (or some columns and rows) as a DataFrame,
+        like the csv was read. It is not kept, for the aggregates built once
+
+        Input:
+            columns: list of columns (None: all, in the order of the csv)
+            rows: positions or boolean mask of the fact rows (None: all)
+            categorical: text columns as pd.Categorical on the codes,
+                instead of a Python string per row
+
+        Returns:
+            df: DataFrame with a new RangeIndex
+        """
+        df = {}
+        for column in self.columns if columns is None else columns:
+            values = self.column(column, rows)
+            if categorical and values.dtype == object:
+                codes, categories = self.codes(column)
+                values = pd.Categorical.from_codes(
+                    codes if rows is None else codes[rows], categories
+                )
+            df[column] = values
+        return pd.DataFrame(df)
+
+    def value_counts(self, attribute, medals=None, rows=None, **filters):
+        """
+        How many rows have each value of the attribute, like value_counts()
+        of the column after filtering; missing values are not counted
+
+        Input:
+            attribute: e.g. "Age", "Height", "Weight"
+            medals: medal names the rows must have (None: all rows)
+            rows: positions or boolean mask of the fact rows (None: all)
+            **filters: attribute=value to keep, e.g. Sport="Swimming"
+
+        Returns:
+            Series with the counts, index is the attribute values
+        """
+        mask = self.mask(rows, **filters)
+        if medals is not None:
+            codes = [MEDAL_CODES[medal] for medal in medals]
+            mask &= np.isin(self.fact["medal_code"].to_numpy(), codes)
+        values = pd.Series(self.column(attribute, mask), name=attribute)
+        return values[values.notna()].value_counts()
+
+    def mask(self, rows=None, **filters):
+        """
+        Fact rows where every attribute equals its value, e.g. Sport="Judo",
+        within rows (positions or boolean mask, None: all)
+        """
+        if rows is None:
+            mask = np.ones(len(self.fact), dtype=bool)
+        else:
+            mask = np.zeros(len(self.fact), dtype=bool)
+            mask[rows] = True
+        for attribute, value in filters.items():
+            codes, values = self.codes(attribute)
+            code = pd.Index(values).get_indexer([value])[0]
+            # -1 is an unknown value, not the code of the missing ones
+            if code == -1:
+                return np.zeros(len(self.fact), dtype=bool)
+            mask &= codes == code
+        return mask
+
+    def count_medals(self, *attributes, rows=None, **filters):
+        """
+        Gives back number of medals grouped by attributes, like count_medals_n
+
+        Input:
+            *attributes: attribute names, e.g. "Country", "ISO", "Year"
+            rows: positions or boolean mask of the fact rows (None: all)
+            **filters: attribute=value to keep, e.g. Sport="Swimming"
+
+        Returns:
+            df_medals: DataFrame with the attributes, Bronze, Gold, Silver
+                and Total, sorted by the attributes
+        """
+        medal_code = self.fact["medal_code"].to_numpy()
+        mask = self.mask(rows, **filters) & (medal_code > 0)
+
+        # one integer per combination of the attribute codes (mixed radix)
+        key = np.zeros(mask.sum(), dtype=np.int64)
+        keep = np.ones(len(key), dtype=bool)
+        all_values = []
+        for attribute in attributes:
+            codes, values = self.codes(attribute)
+            codes = codes[mask]
+            keep &= codes >= 0
+            key = key * len(values) + codes
+            all_values.append(values)
+
+        key, medal_code = key[keep], medal_code[mask][keep]
+        groups, group_codes = np.unique(key, return_inverse=True)
+        counts = np.zeros((len(groups), len(MEDAL_CODES) + 1), dtype=np.int64)
+        np.add.at(counts, (group_codes, medal_code), 1)
+
+        # back from the group keys to the attribute values
+        columns = {}
+        for attribute, values in reversed(list(zip(attributes, all_values))):
+            columns[attribute] = np.asarray(values)[groups % len(values)]
+            groups = groups // len(values)
+        df_medals = pd.DataFrame({attribute: columns[attribute] for attribute in attributes})
+
+        for medal in MEDALS:
+            df_medals[medal] = counts[:, MEDAL_CODES[medal]]
+        df_medals["Total"] = df_medals["Gold"] + df_medals["Silver"] + df_medals["Bronze"]
+        return df_medals
@@ -0,0 +1,137 @@
+# Functions for a fast startup of the dashboards: lazy imports, warm-up
+# in the background, and a report of where the startup time goes
+#
+# Usage:
+#   python startup.py                     (report for Q3_dashboard_main)
+#   python startup.py Q3_dashboard_main 20
+
+# Load libraries
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+
+
+# OLYMPICS_LAZY_STARTUP=1: the server is available right away, the data is
+# loaded in a background thread (or by the first request needing it)
+LAZY = os.environ.get("OLYMPICS_LAZY_STARTUP") == "1"
+
+
+class LazyModule:
+    """Module which is only imported when one of its attributes is used"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        # importlib's LazyLoader is not thread safe before Python 3.12:
+        # two requests using the module at once could see it half loaded
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def lazy_import(name):
+    """
+    Gives back a module which is only imported when it is first used
+
+    Input:
+        name: module name, e.g. "plotly_express"
+
+    Returns:
+        module (or LazyModule until it is imported)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def warm_up(func):
+    """
+    Runs func (e.g. loading the data) now, or in a background thread
+    in lazy startup mode
+
+    Returns:
+        thread, or None when func was run right away
+    """
+    if not LAZY:
+        func()
+        return None
+    thread = threading.Thread(target=func, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def parse_import_times(lines):
+    """
+    Gives back the import times from the -X importtime output
+
+    Input:
+        lines: stderr lines of python -X importtime
+
+    Returns:
+        imports: list of (module, self time in ms, cumulative time in ms)
+    """
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((module.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return imports
+
+
+def startup_report(module="Q3_dashboard_main", top=15):
+    """
+    Imports module in a new process and prints the import time per top-level
+    package, the slowest single imports, and the time per data table and
+    aggregate loaded by its warm_up()
+    """
+    script = (
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module} as dashboard\n"
+        "imported = time.perf_counter()\n"
+        "dashboard.warm_up()\n"
+        "print(json.dumps({'import_s': imported - start,"
+        " 'warm_up_s': time.perf_counter() - imported,"
+        " 'load_times': dashboard.data.load_times}))\n"
+    )
+    env = dict(os.environ, OLYMPICS_LAZY_STARTUP="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, env=env, check=True
+    )
+    imports = parse_import_times(result.stderr.splitlines())
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # self time summed over each top-level package
+    packages = {}
+    for name, self_ms, _ in imports:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_ms
+
+    print(f"Startup of {module}")
+    print(f"    import (lazy mode): {timings['import_s'] * 1000:8.0f} ms")
+    print(f"    warm_up:            {timings['warm_up_s'] * 1000:8.0f} ms")
+
+    print(f"\nImport time per package (top {top}):")
+    for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"    {ms:8.1f} ms  {package}")
+
+    print(f"\nSlowest imports, cumulative (top {top}):")
+    for name, _, cumulative_ms in sorted(imports, key=lambda item: -item[2])[:top]:
+        print(f"    {cumulative_ms:8.1f} ms  {name}")
+
+    print("\nData tables and aggregates:")
+    for key, seconds in sorted(timings["load_times"].items(), key=lambda item: -item[1]):
+        print(f"    {seconds * 1000:8.1f} ms  {key}")
+
+
+if __name__ == "__main__":
+    startup_report(*sys.argv[1:2], *[int(arg) for arg in sys.argv[2:3]])
@@ -0,0 +1,66 @@
+// Thin client of the static export (export_static.py): answers the
+// callback requests of the dash renderer from the exported files instead
+// of the server. Loaded before the renderer, in the exported pages only.
+
+(function () {
+    var EXPORT_URL = "/export/";
+    var serverFetch = window.fetch.bind(window);
+    var manifest = null;
+    var indexes = {};
+
+    function getJSON(url) {
+        return serverFetch(url).then(function (response) {
+            return response.json();
+        });
+    }
+
+    function callbackIndex(output) {
+        if (manifest === null) {
+            manifest = getJSON(EXPORT_URL + "manifest.json");
+        }
+        return manifest.then(function (files) {
+            var name = files[output];
+            if (!name) {
+                return {};
+            }
+            if (!indexes[name]) {
+                indexes[name] = getJSON(EXPORT_URL + name);
+            }
+            return indexes[name];
+        });
+    }
+
+    // the same key as value_key in export_static.py
+    function valueKey(body) {
+        var values = (body.inputs || []).concat(body.state || []).map(function (item) {
+            return item.value === undefined ? null : item.value;
+        });
+        return JSON.stringify(values);
+    }
+
+    function figureResponse(hash) {
+        return serverFetch(EXPORT_URL + "figures/" + hash + ".json.gz").then(function (response) {
+            var json = response.body.pipeThrough(new DecompressionStream("gzip"));
+            return new Response(json, {
+                status: 200,
+                headers: {"Content-Type": "application/json"}
+            });
+        });
+    }
+
+    window.fetch = function (url, options) {
+        var path = typeof url === "string" ? url : url.url;
+        if (path.indexOf("_dash-update-component") === -1) {
+            return serverFetch(url, options);
+        }
+        var body = JSON.parse(options.body);
+        return callbackIndex(body.output).then(function (index) {
+            var hash = index[valueKey(body)];
+            // not exported (e.g. typed search): no update, like PreventUpdate
+            if (!hash) {
+                return new Response(null, {status: 204});
+            }
+            return figureResponse(hash);
+        });
+    };
+})();
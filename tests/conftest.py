@@ -0,0 +1,67 @@
+# Shared by the tests: the repository on sys.path, and generated data
+# files with the columns of the real ones
+
+# Load libraries
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+countries = [
+    ("Canada", "CAN", "CAN"), ("Sweden", "SWE", "SWE"), ("Norway", "NOR", "NOR"),
+    ("Germany", "GER", "DEU"), ("Japan", "JPN", "JPN"), ("Kenya", "KEN", "KEN"),
+]
+sports = ["Swimming", "Athletics", "Rowing", "Judo"]
+
+
+def athlete_rows(rows, seed=0, years=range(1960, 2017, 4)):
+    """Athlete events like athlete_iso, without the Country and ISO columns"""
+    rng = np.random.default_rng(seed)
+    country = rng.integers(len(countries), size=rows)
+    df = pd.DataFrame({
+        "ID": rng.integers(1, max(rows // 3, 2), size=rows),
+        "Sex": rng.choice(["F", "M"], size=rows),
+        "Age": rng.integers(16, 40, size=rows).astype(float),
+        "Height": rng.integers(150, 210, size=rows).astype(float),
+        "Weight": rng.integers(45, 120, size=rows).astype(float),
+        "NOC": [countries[i][1] for i in country],
+        "Year": rng.choice(np.asarray(years), size=rows),
+        "Season": "Summer",
+        "City": "City",
+        "Sport": rng.choice(sports, size=rows),
+        "Medal": rng.choice(["Gold", "Silver", "Bronze", None], size=rows, p=[.1, .1, .1, .7]),
+    })
+    df["Name"] = "Athlete " + df["ID"].astype(str)
+    df["Team"] = df["NOC"]
+    df["Games"] = df["Year"].astype(str) + " Summer"
+    df["Event"] = df["Sport"] + " Event"
+    columns = ["ID", "Name", "Sex", "Age", "Height", "Weight", "Team", "NOC", "Games",
+               "Year", "Season", "City", "Sport", "Event", "Medal"]
+    return df[columns]
+
+
+def write_data(directory, rows=3000, seed=0):
+    """Writes athlete_iso, athlete_regions, canada and noc_iso like the real files"""
+    df = athlete_rows(rows, seed)
+    noc_iso = pd.DataFrame(countries, columns=["Country", "NOC", "ISO"])
+    athlete_iso = with_country(df)
+    athlete_regions = df.assign(region=athlete_iso["Country"], notes=None)
+    canada = df[df["NOC"] == "CAN"].assign(HashName=df["Name"])
+
+    os.makedirs(os.path.join(directory, "data"), exist_ok=True)
+    athlete_iso.to_csv(os.path.join(directory, "data", "athlete_iso.csv"))
+    athlete_regions.to_csv(os.path.join(directory, "data", "athlete_regions.csv"), index=False)
+    canada.to_csv(os.path.join(directory, "data", "canada.csv"))
+    noc_iso.to_csv(os.path.join(directory, "data", "noc_iso.csv"))
+
+
+def with_country(df):
+    """Adds the Country and ISO columns of athlete_iso, in the same row order"""
+    noc_iso = pd.DataFrame(countries, columns=["Country", "NOC", "ISO"]).set_index("NOC")
+    return df.assign(Country=df["NOC"].map(noc_iso["Country"]), ISO=df["NOC"].map(noc_iso["ISO"]))
@@ -0,0 +1,147 @@
+# Shared callback results (callback_cache.py): identical concurrent calls
+# computed once, the lock files of the workers, one client id per browser
+# for the popularity counts, and the speculated calls
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import fcntl
+import os
+import threading
+import time
+
+import flask
+import pytest
+
+import callback_cache
+
+
+@pytest.mark.parametrize("file_lock", [False, True])
+def test_concurrent_calls_run_once(tmp_path, file_lock):
+    calls = []
+    requests = 8
+    barrier = threading.Barrier(requests)
+
+    @callback_cache.single_flight("concurrent", lock_dir=str(tmp_path) if file_lock else None)
+    def figure(sport):
+        calls.append(sport)
+        # the other requests arrive while this one is computed
+        time.sleep(0.2)
+        return {"sport": sport}
+
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(figure("Judo"))
+
+    threads = [threading.Thread(target=request) for _ in range(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["Judo"]
+    assert results == [{"sport": "Judo"}] * requests
+
+
+def test_sweep_lock_dir(tmp_path):
+    lock_dir = str(tmp_path)
+
+    @callback_cache.single_flight("swept", lock_dir=lock_dir)
+    def figure(sport):
+        return {"sport": sport}
+
+    for sport in ["Judo", "Rowing"]:
+        figure(sport)
+    assert len(os.listdir(lock_dir)) == 4
+    old = time.time() - 2 * callback_cache.LOCK_RESULT_TTL
+    for name in os.listdir(lock_dir):
+        os.utime(os.path.join(lock_dir, name), (old, old))
+
+    # a key which another worker holds the lock of stays
+    held = next(name for name in os.listdir(lock_dir) if name.endswith(".lock"))
+    with open(os.path.join(lock_dir, held)) as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert callback_cache.sweep_lock_dir(lock_dir) == 2
+    assert sorted(os.listdir(lock_dir)) == [held, held[:-len(".lock")] + ".pkl"]
+
+    assert callback_cache.sweep_lock_dir(lock_dir) == 2
+    assert os.listdir(lock_dir) == []
+
+
+def test_client_id_per_browser():
+    server = flask.Flask(__name__)
+    callback_cache.init_client_cookie(server)
+
+    @server.route("/client")
+    def client():
+        return callback_cache.client_key()
+
+    # two browsers behind one address, with the same User-Agent
+    first, second = server.test_client(), server.test_client()
+    first_id = first.get("/client").get_data(as_text=True)
+    second_id = second.get("/client").get_data(as_text=True)
+    assert first_id != second_id
+
+    # the cookie keeps the id of a browser over its requests
+    response = first.get("/client")
+    assert response.get_data(as_text=True) == first_id
+    assert "Set-Cookie" not in response.headers
+    assert callback_cache.client_key() is None
+
+
+def test_no_client_cookie_without_speculation(monkeypatch):
+    monkeypatch.setattr(callback_cache, "SPECULATE", False)
+    server = flask.Flask(__name__)
+    callback_cache.init_client_cookie(server)
+
+    @callback_cache.single_flight("cookieless")
+    def figure(sport):
+        return {"sport": sport}
+
+    @server.route("/figure")
+    def figure_route():
+        return figure("Judo")
+
+    response = server.test_client().get("/figure")
+    assert response.get_json() == {"sport": "Judo"}
+    assert "Set-Cookie" not in response.headers
+    assert "cookieless" not in callback_cache.popularity
+
+
+def test_popularity_decays():
+    popularity = callback_cache.Popularity(half_life=4)
+    for sport in ["Judo", "Judo", "Rowing"]:
+        popularity.record("first", (sport, "Gold"))
+    assert popularity.values[0] == {'"Judo"': 2, '"Rowing"': 1}
+
+    # the fourth call halves the counts, a value chosen once is dropped
+    popularity.record("second", ("Fencing", "Gold"))
+    assert popularity.values[0] == {'"Judo"': 1, '"Fencing"': 1}
+    assert popularity.values[1] == {'"Gold"': 2}
+
+
+def test_speculated_calls_keep_the_flags(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(callback_cache, "SPECULATE", True)
+    monkeypatch.setattr(callback_cache.result_cache, "max_entries", 8)
+    monkeypatch.setattr(callback_cache, "client_key", lambda: "client")
+    monkeypatch.setattr(
+        callback_cache.speculator, "submit",
+        lambda probability, compute, args: submitted.append(args)
+    )
+
+    @callback_cache.single_flight("flagged", inputs=2)
+    def figure(sport, medal, patch):
+        return {"sport": sport, "medal": medal, "patch": patch}
+
+    figure("Judo", "Gold", False)
+    figure("Judo", "Silver", True)
+    figure("Judo", "Gold", True)
+
+    # the medal is predicted to change again, the patch flag is the caller's
+    assert submitted
+    assert all(args[2] is True and len(args) == 3 for args in submitted)
+    assert callback_cache.popularity["flagged"].values.keys() == {0, 1}
@@ -0,0 +1,263 @@
+# Hot reload of the data files (data_context.DataManager): a new data
+# version is loaded next to the old one, which keeps serving the requests
+# started on it
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import os
+import subprocess
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+import analyze_functions as af
+import sql_backend
+import year_partitions
+from callback_cache import data_fingerprint
+from conftest import REPO, athlete_rows, with_country, write_data
+from data_context import DataManager
+from medal_rankings import MedalRankings
+
+
+def new_manager(tmp_path):
+    write_data(str(tmp_path))
+    manager = DataManager(str(tmp_path / "data") + "/")
+    # built before a new version is swapped in, like the dashboard warm_up
+    manager.add_warm_up(lambda: manager.snapshot().medal_rankings)
+    manager.current.warm_up()
+    return manager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return new_manager(tmp_path)
+
+
+def append_athletes(manager, rows, seed, years):
+    """Appends generated rows to athlete_iso.csv, like the results of new Games"""
+    path = manager.data_path + "athlete_iso.csv"
+    df = pd.read_csv(path, index_col=0)
+    new = with_country(athlete_rows(rows, seed, years))
+    new.index += len(df)
+    new.to_csv(path, mode="a", header=False)
+    return new
+
+
+def test_appended_rows_update_rankings(manager, monkeypatch):
+    old_context = manager.current
+    old_table = old_context.medal_rankings.table.copy()
+
+    appended = append_athletes(manager, 200, seed=1, years=[2016, 2020])
+    counted = []
+    count = MedalRankings.count
+    monkeypatch.setattr(
+        MedalRankings, "count", staticmethod(lambda df: counted.append(len(df)) or count(df))
+    )
+    assert manager.reload()
+    context = manager.current
+
+    # only the appended rows were counted, no whole new ranking
+    assert counted == [len(appended)]
+    assert context.previous is None
+
+    rebuilt = MedalRankings.rank_order(MedalRankings(context.athlete_iso).table)
+    table = context.medal_rankings.table
+    assert set(table["Games"].astype(str)) == set(rebuilt["Games"].astype(str))
+    pd.testing.assert_frame_equal(
+        table.astype({"Games": str, "Season": str, "Country": str}),
+        rebuilt.astype({"Games": str, "Season": str, "Country": str}),
+    )
+    # the old version still serves its own ranking
+    pd.testing.assert_frame_equal(old_context.medal_rankings.table, old_table)
+
+
+def test_appended_rows_extend_partitions(manager, monkeypatch):
+    manager.add_warm_up(lambda: manager.snapshot().athlete_partitions)
+    old_partitions = manager.current.athlete_partitions
+    built = []
+    build = year_partitions.YearPartitions.build
+    monkeypatch.setattr(
+        year_partitions.YearPartitions, "build",
+        classmethod(lambda cls, *args: built.append(args) or build(*args))
+    )
+
+    append_athletes(manager, 200, seed=1, years=[2016, 2020])
+    assert manager.reload()
+    partitions = manager.current.athlete_partitions
+
+    # no new build, the partitions of the old version and the new Games
+    assert built == []
+    assert partitions.directory != old_partitions.directory
+    assert partitions.prune(2020) == ["games=2020-Summer"]
+    assert partitions.source == data_fingerprint([manager.data_path + "athlete_iso.csv"])
+    expected = af.count_medals_n(manager.current.athlete_iso, "Country")
+    df_medals = partitions.medals(None, None, "Country")
+    pd.testing.assert_frame_equal(
+        df_medals.sort_values("Country").reset_index(drop=True)[["Country", "Gold", "Total"]],
+        expected.sort_values("Country").reset_index(drop=True)[["Country", "Gold", "Total"]],
+        check_dtype=False, check_names=False
+    )
+
+
+def test_changed_rows_rank_everything_again(manager):
+    path = manager.data_path + "athlete_iso.csv"
+    df = pd.read_csv(path, index_col=0)
+    df.loc[df["Medal"].isna().idxmax(), "Medal"] = "Gold"
+    df.to_csv(path)
+    os.utime(path)
+
+    assert manager.reload()
+    context = manager.current
+    rebuilt = MedalRankings(context.athlete_iso)
+    pd.testing.assert_frame_equal(context.medal_rankings.table, rebuilt.table)
+
+
+def test_sql_backend_per_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql_backend, "BACKEND", "sqlite")
+    monkeypatch.setattr(sql_backend, "DATABASE_PATH", str(tmp_path / "olympics.db"))
+    manager = new_manager(tmp_path)
+    # with a backend, athlete_regions is read from the database only
+    assert manager.current.built("regions_star") is None
+    assert manager.current.sport_list[1:] == manager.current.regions_star.lookup("Sport")[1].tolist()
+    # the database is built from the csv files in chunks, read like the tables
+    pd.testing.assert_frame_equal(
+        pd.concat(manager.current.chunks("athlete_iso", chunksize=100), ignore_index=True),
+        manager.current.athlete_iso
+    )
+
+    def backend(context):
+        return context.backend
+
+    def gold(backend):
+        return int(backend.count_medals("athlete_iso", "Season")["Gold"].sum())
+
+    manager.add_warm_up(lambda: backend(manager.snapshot()))
+    old_backend = backend(manager.current)
+    old_gold = gold(old_backend)
+
+    data_path = manager.data_path + "athlete_iso.csv"
+    df = pd.read_csv(data_path, index_col=0)
+    df.loc[df["Medal"].isna().idxmax(), "Medal"] = "Gold"
+    df.to_csv(data_path)
+    os.utime(data_path)
+
+    # a request started on the old version, the reload happens meanwhile
+    with manager.pinned() as context:
+        assert manager.reload()
+        new_backend = backend(manager.current)
+        assert new_backend.path != old_backend.path
+        assert gold(new_backend) == old_gold + 1
+
+        # the old version still reads its own file, also from a new thread
+        results = []
+        thread = threading.Thread(target=lambda: results.append(gold(backend(context))))
+        thread.start()
+        thread.join()
+        assert results == [old_gold]
+        assert not old_backend.closed
+
+    # the request is done: the old connections are closed, its file removed
+    assert old_backend.closed and old_backend.connections == []
+    assert not os.path.exists(old_backend.path)
+    assert os.path.exists(new_backend.path)
+
+
+def versions(directory):
+    """The version directories in directory, without their lock files"""
+    return sorted(name for name in os.listdir(directory) if not name.endswith(".lock"))
+
+
+def test_partitions_per_version(manager):
+    directory = os.path.join(manager.data_path, "partitions", "athlete_iso")
+    manager.add_warm_up(lambda: manager.snapshot().athlete_partitions)
+    old_partitions = manager.current.athlete_partitions
+
+    def gold(partitions):
+        return int(partitions.medals(None, None, "Season")["Gold"].sum())
+
+    # the medals of the last Games change; the old version hasn't read them yet
+    data_path = manager.data_path + "athlete_iso.csv"
+    df = pd.read_csv(data_path, index_col=0)
+    last_games = df["Year"] == df["Year"].max()
+    old_gold = int((df["Medal"] == "Gold").sum())
+    df.loc[last_games, "Medal"] = "Gold"
+    df.to_csv(data_path)
+    os.utime(data_path)
+
+    with manager.pinned() as context:
+        assert manager.reload()
+        new_partitions = manager.current.athlete_partitions
+        assert new_partitions.directory != old_partitions.directory
+        assert gold(new_partitions) == int((df["Medal"] == "Gold").sum())
+        # the old version reads its own files, not those of the new one
+        assert gold(context.athlete_partitions) == old_gold
+        assert versions(directory) == sorted(
+            os.path.basename(partitions.directory)
+            for partitions in [old_partitions, new_partitions]
+        )
+
+    # the request is done: only the new version is left
+    assert versions(directory) == [os.path.basename(new_partitions.directory)]
+
+
+def test_partitions_of_another_process(tmp_path):
+    directory = str(tmp_path / "partitions")
+    df = with_country(athlete_rows(100))
+    df.to_pickle(tmp_path / "df.pkl")
+    # another worker reads the partitions of its data version, and keeps them
+    worker = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, pandas as pd, year_partitions\n"
+         "df = pd.read_pickle(sys.argv[1])\n"
+         f"year_partitions.open_partitions(lambda: df, {directory!r}, 'a' * 40)\n"
+         "print('open', flush=True)\n"
+         "sys.stdin.read()\n",
+         str(tmp_path / "df.pkl")],
+        cwd=REPO, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert worker.stdout.readline() == "open\n"
+        partitions = year_partitions.open_partitions(lambda: df, directory, "b" * 40)
+        year_partitions.remove_unused(directory)
+        assert versions(directory) == ["a" * 12, "b" * 12]
+    finally:
+        worker.stdin.close()
+        worker.wait()
+
+    # the other worker stopped: its version is no longer used
+    year_partitions.close_partitions(partitions, directory)
+    assert versions(directory) == []
+
+
+def test_sql_backend_of_another_process(tmp_path):
+    path = str(tmp_path / "olympics.db")
+    tables = {"athlete_iso": with_country(athlete_rows(50))}
+    # another worker opens the database of its data version, and keeps it
+    worker = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, pandas as pd, sql_backend\n"
+         f"sql_backend.open_backend({{'t': pd.DataFrame({{'a': [1]}})}}, 'a' * 40, 'sqlite', {path!r})\n"
+         "print('open', flush=True)\n"
+         "sys.stdin.read()\n"],
+        cwd=REPO, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert worker.stdout.readline() == "open\n"
+        other_path = sql_backend.version_path(path, "a" * 40)
+
+        # this worker runs a newer version, the file of the other one stays
+        backend = sql_backend.open_backend(tables, "b" * 40, "sqlite", path)
+        sql_backend.remove_unused(path)
+        assert os.path.exists(other_path)
+    finally:
+        worker.stdin.close()
+        worker.wait()
+
+    # the other worker stopped: its file is no longer used
+    sql_backend.close_backend(backend, path)
+    assert not os.path.exists(other_path)
+    assert not os.path.exists(backend.path)
@@ -0,0 +1,43 @@
+# World map geometry served from our own server (geo_assets.py): the
+# versioned URLs are cached for good, the old ones checked again
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import flask
+
+import geo_assets
+
+
+def write_topojson(path, content):
+    for name in geo_assets.topojson_files.values():
+        (path / name).write_text(content + name)
+
+
+def test_versioned_urls(tmp_path):
+    path = str(tmp_path) + "/"
+    write_topojson(tmp_path, '{"old": 1}')
+    old_url = geo_assets.graph_config(path)["topojsonURL"]
+
+    write_topojson(tmp_path, '{"new": 22}')
+    url = geo_assets.graph_config(path)["topojsonURL"]
+    assert url != old_url and url.startswith(geo_assets.TOPOJSON_URL)
+
+    server = flask.Flask(__name__)
+    assert geo_assets.init_geo_assets(server, path)
+    # a second dashboard on the same server
+    assert geo_assets.init_geo_assets(server, path)
+    client = server.test_client()
+
+    response = client.get(url + "world_110m.json")
+    assert response.get_data(as_text=True) == '{"new": 22}world_110m.json'
+    assert "immutable" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+    assert client.get(url + "world_110m.json", headers={"If-None-Match": etag}).status_code == 304
+
+    # a page loaded before the files changed gets the new ones, not for good
+    response = client.get(old_url + "world_110m.json")
+    assert response.get_data(as_text=True) == '{"new": 22}world_110m.json'
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert client.get(url + "world_1m.json").status_code == 404
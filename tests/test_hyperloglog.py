@@ -0,0 +1,69 @@
+# Distinct counts (hyperloglog.py): exact below the exact limit, within the
+# HyperLogLog error beyond, and the same registers however counters merge
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import numpy as np
+import pytest
+
+from conftest import athlete_rows, with_country
+from hyperloglog import DistinctCounter, ParticipationSketches
+
+
+def test_exact_below_limit():
+    counter = DistinctCounter(p=12)
+    values = np.arange(counter.exact_limit - 100)
+    # duplicates, and values added in several calls
+    counter.add(values).add(values[:100]).add(values[:100].astype(str))
+    assert counter.exact
+    assert counter.count() == counter.exact_limit
+    # one more value is beyond the limit
+    assert not counter.add([-1]).exact
+
+    with pytest.raises(ValueError):
+        DistinctCounter(p=4)
+
+
+@pytest.mark.parametrize("n", [1_000, 20_000, 300_000])
+def test_estimate_within_error(n):
+    counter = DistinctCounter(p=12).add(np.arange(n) * 7919)
+    assert not counter.exact
+    # 1.6% standard error for p=12
+    assert abs(counter.count() - n) <= 0.03 * n
+
+
+def test_exact_and_sketch_merge():
+    small = np.arange(300)
+    large = np.arange(200, 10_000)
+    single = DistinctCounter().add(np.concatenate((small, large)))
+
+    # an exact counter into a sketch, and a sketch into an exact counter
+    for first, second in [(large, small), (small, large)]:
+        merged = DistinctCounter().add(first).merge(DistinctCounter().add(second))
+        assert not merged.exact
+        np.testing.assert_array_equal(merged.registers, single.registers)
+        assert merged.count() == single.count()
+
+    # two exact counters stay exact while their union is small enough
+    merged = DistinctCounter().add(small[:200]).merge(DistinctCounter().add(small[100:]))
+    assert merged.exact and merged.count() == len(small)
+    # and turn into the sketch of their union beyond
+    merged = DistinctCounter().add(large[:400]).merge(DistinctCounter().add(large[300:700]))
+    np.testing.assert_array_equal(merged.registers, DistinctCounter().add(large[:700]).registers)
+
+
+def test_per_year_like_pandas():
+    df = with_country(athlete_rows(3000, seed=9))
+    sketches = ParticipationSketches(df, chunk_size=700)
+
+    per_year = sketches.per_year(sport="Judo").set_index("Year")
+    judo = df[df["Sport"] == "Judo"].groupby("Year")
+    assert per_year["Athletes"].to_dict() == judo["ID"].nunique().to_dict()
+    assert per_year["Countries"].to_dict() == judo["Country"].nunique().to_dict()
+    assert per_year["Exact"].all()
+    # all years: more athletes than the exact limit, estimated
+    athletes = sketches.query("athletes")
+    assert not athletes.exact
+    assert abs(athletes.count() - df["ID"].nunique()) <= 0.03 * df["ID"].nunique()
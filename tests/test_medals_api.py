@@ -0,0 +1,39 @@
+# Medal query API (medals_api.py): pages and their next links
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import json
+
+import flask
+import pytest
+
+import medals_api
+from conftest import athlete_rows, with_country
+
+
+@pytest.fixture
+def client():
+    server = flask.Flask(__name__)
+    server.register_blueprint(medals_api.create_blueprint(with_country(athlete_rows(500))))
+    return server.test_client()
+
+
+def test_pages_follow_next_links(client):
+    url, rows = "/api/medals?group=Country&limit=3", []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        rows += [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        url = response.headers.get("Link", "").partition(">")[0].lstrip("<")
+
+    assert len(rows) == int(response.headers["X-Total-Count"])
+    assert len({row["Country"] for row in rows}) == len(rows)
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=-1", "offset=-1", "limit=ten"])
+def test_bad_pages(client, query):
+    response = client.get(f"/api/medals?group=Country&{query}")
+    assert response.status_code == 400
+    assert "Link" not in response.headers
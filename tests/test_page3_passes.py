@@ -0,0 +1,175 @@
+# Page 3 is one computation graph: every user action fires each dependent
+# callback once, and the shared intermediate (medals per country and year
+# of a sport) is aggregated once per sport, not once per figure.
+#
+# The dashboard runs on a small generated data set, in a temporary
+# directory, with the callbacks posted like the Dash renderer posts them.
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import collections
+import importlib
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from conftest import write_data
+from load_test import Renderer, TestClientTransport, server_callbacks
+
+
+# Values of the page 3 inputs before the user does anything
+page_values = {
+    "sport-dropdown-world.value": "Swimming",
+    "medal-radio-world.value": "Gold",
+    "selected-country.data": None,
+    "selected-athletes.data": None,
+    "region-dropdown.value": "All regions",
+    "athlete-radio-world.value": "Height",
+    "total-athletes-radio.value": "No",
+    "bands-attribute-radio.value": "Height",
+    "bands-gender-radio.value": "Both",
+}
+
+
+@pytest.fixture(scope="module")
+def dashboard(tmp_path_factory):
+    """Q3_dashboard_main on the generated data, with pandas and whole figures"""
+    directory = tmp_path_factory.mktemp("olympics")
+    write_data(str(directory))
+
+    environ = dict(os.environ)
+    cwd = os.getcwd()
+    os.environ.update(
+        OLYMPICS_BACKEND="pandas", OLYMPICS_CLIENTSIDE_MEDALS="0",
+        OLYMPICS_RESULT_CACHE_SIZE="0", OLYMPICS_LAZY_STARTUP="0",
+    )
+    os.environ.pop("OLYMPICS_SPECULATE", None)
+    # the data is read from data/ on first use, so stay there for the tests
+    os.chdir(directory)
+    try:
+        sys.modules.pop("Q3_dashboard_main", None)
+        yield importlib.import_module("Q3_dashboard_main")
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def page3_values():
+    """The page 3 inputs, and the ids of their components, as on the page"""
+    values = dict(page_values)
+    values.update({name.rsplit(".", 1)[0] + ".id": name.rsplit(".", 1)[0] for name in page_values})
+    return values
+
+
+def check_status(key, status, seconds, size):
+    assert status in (200, 204), key
+
+
+@pytest.fixture
+def renderer(dashboard, monkeypatch):
+    app = dashboard.app
+    # the renderer of the load test, counting the callback invocations
+    renderer = Renderer(
+        server_callbacks(app), TestClientTransport(app), page3_values(), record=check_status
+    )
+    renderer.invocations = collections.Counter()
+
+    def counted(key, func):
+        def wrapper(*args, **kwargs):
+            renderer.invocations[key] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    for key, callback in app.callback_map.items():
+        if "callback" in callback:
+            monkeypatch.setitem(callback, "callback", counted(key, callback["callback"]))
+    # the page is shown once before the user does anything
+    renderer.change(page3_values())
+    renderer.invocations.clear()
+
+    # counters of the aggregations
+    renderer.aggregations = collections.Counter()
+
+    def count(name, func):
+        def wrapper(*args, **kwargs):
+            renderer.aggregations[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    af = dashboard.af
+    star_schema = sys.modules["star_schema"]
+    monkeypatch.setattr(af, "count_medals_n", count("count_medals_n", af.count_medals_n))
+    monkeypatch.setattr(af, "top_n_index", count("top_n_index", af.top_n_index))
+    monkeypatch.setattr(
+        star_schema.StarSchema, "count_medals",
+        count("StarSchema.count_medals", star_schema.StarSchema.count_medals)
+    )
+    monkeypatch.setattr(pd, "read_json", count("read_json", pd.read_json))
+    return renderer
+
+
+def callback_key(app, output):
+    return next(key for key in app.callback_map if output in key)
+
+
+def test_sport_change(dashboard, renderer):
+    renderer.change({"sport-dropdown-world.value": "Rowing"})
+    app = dashboard.app
+
+    # every figure of the sport once, from one callback per figure group
+    expected = {
+        callback_key(app, output): 1 for output in [
+            "sum-medals-map.figure", "participation-graph-world.figure",
+            "athlete-distribution-graph.figure", "physique-bands-graph.figure",
+        ]
+    }
+    assert renderer.invocations == expected
+    # the medals per country and year of the new sport, aggregated once
+    # for the four medal figures, the top 10 come from the top-10 index
+    assert renderer.aggregations == {"StarSchema.count_medals": 1}
+
+
+def test_medal_change(dashboard, renderer):
+    renderer.change({"medal-radio-world.value": "Silver"})
+    app = dashboard.app
+
+    expected = {
+        callback_key(app, output): 1 for output in [
+            "sum-medals-map.figure", "athlete-distribution-graph.figure",
+            "physique-bands-graph.figure",
+        ]
+    }
+    assert renderer.invocations == expected
+    # the same sport: its intermediate is used again
+    assert renderer.aggregations == {}
+
+
+def test_region_change(dashboard, renderer):
+    renderer.change({"region-dropdown.value": "Canada"})
+
+    expected = {callback_key(dashboard.app, "athlete-distribution-graph.figure"): 1}
+    assert renderer.invocations == expected
+    assert renderer.aggregations == {}
+
+
+def test_region_search(dashboard, renderer):
+    app = dashboard.app
+    key = callback_key(app, "region-dropdown.options")
+
+    # nothing chosen yet: only the regions found
+    renderer.values.update({"region-dropdown.search_value": "swe", "region-dropdown.value": None})
+    status, payload = renderer.post(key, ["region-dropdown.search_value"])
+    options = json.loads(payload)["response"]["region-dropdown"]["options"]
+    assert options == [{"label": "Sweden", "value": "Sweden"}]
+
+    # the chosen region stays among the options
+    renderer.values["region-dropdown.value"] = "Canada"
+    status, payload = renderer.post(key, ["region-dropdown.search_value"])
+    options = json.loads(payload)["response"]["region-dropdown"]["options"]
+    assert [option["value"] for option in options] == ["Sweden", "Canada"]
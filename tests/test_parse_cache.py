@@ -0,0 +1,101 @@
+# On-disk cache of parsed files (parse_cache.py): the DataFrames come back
+# with their dtypes, a changed file gets a new entry, and the least
+# recently used entries are removed first
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import parse_cache
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "athletes.csv"
+    path.write_text("ID,Name\n1,A\n")
+    return str(path)
+
+
+def parse_counted(result, calls):
+    def parser():
+        calls.append(1)
+        return result
+    return parser
+
+
+def test_dtypes_round_trip(data_file, tmp_path):
+    df = pd.DataFrame({
+        "ID": np.arange(4, dtype=np.int64),
+        "Height": [180.5, np.nan, 170.0, 165.0],
+        "Medalist": [True, False, False, True],
+        "Date": pd.to_datetime(["1996-07-19", "2000-09-15", "2004-08-13", "2008-08-08"]),
+        "Sport": pd.Categorical(["Judo", "Rowing", "Judo", "Judo"]),
+        "Name": ["A", None, "C", "D"],
+        "Age": pd.array([20, None, 31, 25], dtype="Int64"),
+    }, index=pd.Index(["a", "b", "c", "d"], name="key"))
+    cache_dir = str(tmp_path / "cache")
+    calls = []
+
+    first = parse_cache.cached_parse(data_file, parse_counted(df, calls), cache_dir=cache_dir)
+    second = parse_cache.cached_parse(data_file, parse_counted(df, calls), cache_dir=cache_dir)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(second, df)
+    pd.testing.assert_frame_equal(first, df)
+    # the numbers are memory mapped, and may be changed in memory only
+    second.iloc[0, 0] = 99
+    pd.testing.assert_frame_equal(
+        parse_cache.cached_parse(data_file, parse_counted(df, calls), cache_dir=cache_dir), df
+    )
+
+    # the sheets of an Excel file, under their sheet_name
+    sheets = {"Summer": df, "Winter": df.iloc[:2]}
+    names = ["Summer", "Winter"]
+    parse_cache.cached_parse(data_file, parse_counted(sheets, calls), names, cache_dir)
+    cached = parse_cache.cached_parse(data_file, parse_counted(sheets, calls), names, cache_dir)
+    assert calls == [1, 1]
+    assert list(cached) == ["Summer", "Winter"]
+    pd.testing.assert_frame_equal(cached["Winter"], df.iloc[:2])
+
+
+def test_changed_file_new_key(data_file):
+    key = parse_cache.cache_key(data_file)
+    assert parse_cache.cache_key(data_file) == key
+    assert parse_cache.cache_key(data_file, sheet_name="Summer") != key
+
+    stat = os.stat(data_file)
+    # the same size and modification time, other content
+    with open(data_file, "w") as f:
+        f.write("ID,Name\n2,B\n")
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(data_file).st_size == stat.st_size
+    assert parse_cache.cache_key(data_file) != key
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    df = pd.DataFrame({"Height": np.arange(1000, dtype=float)})
+    paths = []
+    for number, name in enumerate(["a", "b", "c"]):
+        path = tmp_path / f"{name}.csv"
+        path.write_text(name)
+        paths.append(str(path))
+        parse_cache.cached_parse(str(path), lambda: df, cache_dir=cache_dir, max_bytes=2 ** 30)
+        # written one after another
+        directory = os.path.join(cache_dir, parse_cache.cache_key(str(path)))
+        os.utime(directory, (1_000_000 + number, 1_000_000 + number))
+    size = parse_cache.entry_size(directory)
+
+    # a is used again: b is the least recently used entry
+    calls = []
+    parse_cache.cached_parse(paths[0], parse_counted(df, calls), cache_dir=cache_dir)
+    assert calls == []
+    assert parse_cache.evict(cache_dir, max_bytes=2 * size) == 1
+    assert sorted(os.listdir(cache_dir)) == sorted(
+        parse_cache.cache_key(path) for path in [paths[0], paths[2]]
+    )
@@ -0,0 +1,85 @@
+# Profiling of live callbacks (profiling.py): overlapping profiled calls
+# and speculative computations
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import sys
+import threading
+
+import pytest
+
+import callback_cache
+import profiling
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "_armed", {})
+    monkeypatch.setattr(profiling, "_results", {})
+
+
+def test_overlapping_calls_restore_switch_interval(enabled):
+    switch_interval = sys.getswitchinterval()
+    first_started, second_started, first_done = (threading.Event() for _ in range(3))
+    intervals = []
+
+    @profiling.profiled("first")
+    def first():
+        first_started.set()
+        second_started.wait(5)
+        return {}
+
+    @profiling.profiled("second")
+    def second():
+        second_started.set()
+        first_done.wait(5)
+        intervals.append(sys.getswitchinterval())
+        return {}
+
+    profiling._armed.update(first=1, second=1)
+    thread = threading.Thread(target=second)
+    first_thread = threading.Thread(target=first)
+    first_thread.start()
+    first_started.wait(5)
+    thread.start()
+    # the first call ends while the second one is still running
+    first_thread.join()
+    first_done.set()
+    thread.join()
+
+    assert intervals == [pytest.approx(profiling.INTERVAL / 4)]
+    assert sys.getswitchinterval() == pytest.approx(switch_interval)
+    assert len(profiling._results["first"]) == len(profiling._results["second"]) == 1
+
+
+def test_speculative_calls_are_not_profiled(enabled, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(callback_cache, "SPECULATE", True)
+    monkeypatch.setattr(callback_cache.result_cache, "max_entries", 8)
+    monkeypatch.setattr(callback_cache, "client_key", lambda: "client")
+    monkeypatch.setattr(
+        callback_cache.Popularity, "predict", lambda self, args, changed: [(1.0, ("next",))]
+    )
+    monkeypatch.setattr(
+        callback_cache.speculator, "submit",
+        lambda probability, compute, args: submitted.append((compute, args))
+    )
+
+    @callback_cache.single_flight("speculated")
+    def figure(value):
+        return {"value": value}
+
+    figure("first")
+    profiling._armed["speculated"] = 1
+    compute, args = submitted[0]
+    assert compute(args)
+
+    # the armed call is left for the next request
+    assert profiling._armed["speculated"] == 1
+    assert "speculated" not in profiling._results
+    figure("second")
+    assert profiling._armed["speculated"] == 0
+    assert len(profiling._results["speculated"]) == 1
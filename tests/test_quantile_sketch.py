@@ -0,0 +1,78 @@
+# KLL quantile sketches (quantile_sketch.py): the quantiles are within the
+# rank error of the sketch, and merged sketches are as good as one sketch
+# of the whole stream
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import numpy as np
+import pytest
+
+from conftest import athlete_rows, with_country
+from quantile_sketch import NO_MEDAL, KLLSketch, PhysiqueSketches
+
+
+QS = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+# rank error allowed, the sketch has about 1.7/k
+RANK_ERROR = 0.02
+
+
+def rank(values, value):
+    """Share of values below or at value"""
+    return np.searchsorted(np.sort(values), value, side="right") / len(values)
+
+
+@pytest.fixture(scope="module")
+def stream():
+    return np.random.default_rng(6).normal(175, 10, size=100_000).round(1)
+
+
+def test_quantiles_within_rank_error(stream):
+    sketch = KLLSketch(k=200).update(stream)
+    assert sketch.n == len(stream)
+    # about 3k values kept of 100 000
+    assert sketch.size < 4 * sketch.k
+
+    for q, value in zip(QS, sketch.quantiles(QS)):
+        assert abs(rank(stream, value) - q) <= RANK_ERROR, q
+
+
+def test_exact_while_small():
+    values = np.random.default_rng(7).integers(0, 1000, size=150)
+    sketch = KLLSketch(k=200).update(values)
+    assert sketch.quantiles([0.5, 1.0]) == [np.sort(values)[74], values.max()]
+    assert np.isnan(KLLSketch().quantile(0.5))
+
+
+def test_merge_like_one_stream(stream):
+    single = KLLSketch(k=200).update(stream)
+    merged = KLLSketch(k=200)
+    for part in np.array_split(stream, 16):
+        merged.merge(KLLSketch(k=200).update(part))
+
+    assert merged.n == single.n
+    assert merged.size < 4 * merged.k
+    for q, value, single_value in zip(QS, merged.quantiles(QS), single.quantiles(QS)):
+        assert abs(rank(stream, value) - q) <= RANK_ERROR, q
+        assert abs(rank(stream, value) - rank(stream, single_value)) <= 2 * RANK_ERROR, q
+
+    # sketches without a full level merge into the exact quantiles
+    small = [np.arange(start, start + 50, dtype=float) for start in (0, 50, 100)]
+    merged = KLLSketch(k=200)
+    for values in small:
+        merged.merge(KLLSketch(k=200).update(values))
+    assert merged.quantiles(QS) == KLLSketch(k=200).update(np.concatenate(small)).quantiles(QS)
+
+
+def test_percentile_bands_like_pandas():
+    df = with_country(athlete_rows(3000, seed=8))
+    sketches = PhysiqueSketches(df, chunk_size=700)
+
+    bands = sketches.percentile_bands("Height", qs=(0.5,), sport="Rowing", medals=[NO_MEDAL])
+    rowing = df[(df["Sport"] == "Rowing") & df["Medal"].isna()]
+    counts = rowing.groupby("Year")["Height"].count()
+    assert bands.set_index("Year")["Count"].to_dict() == counts.to_dict()
+    # the cells are small: exact medians (the lower one of an even count)
+    medians = rowing.groupby("Year")["Height"].quantile(0.5, interpolation="lower")
+    assert bands.set_index("Year")[0.5].to_dict() == medians.to_dict()
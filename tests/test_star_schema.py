@@ -0,0 +1,80 @@
+# Star schema of the athlete events (star_schema.py) against the pandas
+# functions in analyze_functions
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze_functions as af
+from conftest import athlete_rows, with_country
+from star_schema import REGION_DIMENSIONS, StarSchema
+
+
+@pytest.fixture(scope="module")
+def athlete_iso():
+    df = with_country(athlete_rows(2000, seed=2))
+    # missing measures, which get the code -1
+    df.loc[df.index[::7], "Age"] = np.nan
+    return df
+
+
+def test_count_medals_like_pandas(athlete_iso):
+    star = StarSchema(athlete_iso)
+    expected = af.count_medals_n(athlete_iso[athlete_iso["Sport"] == "Judo"], "Country", "Year")
+    df_medals = star.count_medals("Country", "Year", Sport="Judo")
+    expected.columns.name = None
+    pd.testing.assert_frame_equal(df_medals, expected, check_dtype=False)
+
+
+def test_unknown_value_matches_nothing(athlete_iso):
+    star = StarSchema(athlete_iso)
+    assert star.mask(Age=999).sum() == 0
+    assert star.mask(Sport="Curling").sum() == 0
+    assert star.count_medals("Country", Age=999).empty
+    assert star.mask(Age=20).sum() == (athlete_iso["Age"] == 20).sum()
+
+
+def test_frame_like_the_table(athlete_iso):
+    star = StarSchema(athlete_iso)
+    pd.testing.assert_frame_equal(star.frame(), athlete_iso)
+
+    rows = np.flatnonzero(athlete_iso["Sport"] == "Rowing")
+    pd.testing.assert_frame_equal(
+        star.frame(["Name", "Year", "Medal"], rows=rows),
+        athlete_iso.iloc[rows].loc[:, ["Name", "Year", "Medal"]].reset_index(drop=True),
+    )
+    df = star.frame(["Sport", "Medal"], categorical=True)
+    assert isinstance(df["Sport"].dtype, pd.CategoricalDtype)
+    assert df["Medal"].isna().sum() == athlete_iso["Medal"].isna().sum()
+
+
+def test_measures_keep_their_values():
+    df = with_country(athlete_rows(300, seed=3))
+    df["Weight"] += 0.3
+    star = StarSchema(df)
+    # 72.3 is not a float32, the column stays float64
+    assert star.fact["Weight"].dtype == np.float64
+    assert star.fact["Age"].dtype == np.float32
+    np.testing.assert_array_equal(star.column("Weight"), df["Weight"])
+
+
+def test_value_counts_like_pandas():
+    df = athlete_rows(2000, seed=4)
+    df = df.assign(region=df["NOC"], notes=None)
+    star = StarSchema(df, REGION_DIMENSIONS)
+
+    selected = df[(df["region"] == "SWE") & (df["Medal"].isin(["Gold", "Silver"]))]
+    expected = selected["Height"].value_counts()
+    counts = star.value_counts("Height", ["Gold", "Silver"], region="SWE")
+    pd.testing.assert_series_equal(counts.sort_index(), expected.sort_index())
+
+    rows = np.flatnonzero(df["Sport"] == "Judo")
+    counts = star.value_counts("Age", rows=rows)
+    pd.testing.assert_series_equal(
+        counts.sort_index(), df["Age"].iloc[rows].value_counts().sort_index()
+    )
+    assert star.count_medals("Sex", rows=rows)["Total"].sum() == df["Medal"].iloc[rows].notna().sum()
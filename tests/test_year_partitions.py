@@ -0,0 +1,84 @@
+# Athlete events partitioned by Games (year_partitions.py): pruning to a
+# time range, the medals added up from the partitions, and appending Games
+#
+# Usage:
+#   python -m pytest tests
+
+# Load libraries
+import os
+
+import pandas as pd
+import pytest
+
+import analyze_functions as af
+from conftest import athlete_rows, with_country
+from year_partitions import YearPartitions
+
+
+@pytest.fixture
+def athlete_iso():
+    return with_country(athlete_rows(1500, seed=5))
+
+
+def sorted_medals(df, *group):
+    return df.sort_values(list(group)).reset_index(drop=True)[list(group) + ["Gold", "Total"]]
+
+
+def test_prune(athlete_iso, tmp_path):
+    partitions = YearPartitions.build(athlete_iso, str(tmp_path / "v1"))
+
+    assert len(partitions.prune()) == athlete_iso["Year"].nunique()
+    names = partitions.prune(1980, 2000)
+    assert names == [f"games={year}-Summer" for year in range(1980, 2001, 4)]
+    assert partitions.prune(1980, 2000, season="Winter") == []
+
+    in_range = athlete_iso[athlete_iso["Year"].between(1980, 2000)]
+    events = partitions.events(1980, 2000)
+    assert len(events) == len(in_range)
+    assert sorted(events["ID"]) == sorted(in_range["ID"])
+
+
+def test_medals_like_pandas(athlete_iso, tmp_path):
+    partitions = YearPartitions.build(athlete_iso, str(tmp_path / "v1"))
+
+    in_range = athlete_iso[athlete_iso["Year"].between(1984, 2008)]
+    expected = af.count_medals_n(in_range[in_range["Sport"] == "Rowing"], "Country")
+    df_medals = partitions.medals(1984, 2008, "Country", Sport="Rowing")
+    pd.testing.assert_frame_equal(
+        sorted_medals(df_medals, "Country"), sorted_medals(expected, "Country"), check_dtype=False
+    )
+    with pytest.raises(ValueError):
+        partitions.medals(None, None, "Height")
+
+
+def test_append(athlete_iso, tmp_path):
+    old = athlete_iso[athlete_iso["Year"] < 2008]
+    appended = athlete_iso[athlete_iso["Year"] >= 2008]
+    partitions = YearPartitions.build(old, str(tmp_path / "v1"))
+
+    # a new version, from the partitions of the old one and the appended rows
+    extended = partitions.extend(appended, str(tmp_path / "v2"), source="v2")
+    assert extended.source == "v2"
+    assert extended.prune(2008) == ["games=2008-Summer", "games=2012-Summer", "games=2016-Summer"]
+    # the partitions of the old Games are the files of the old version
+    name = "games=1960-Summer"
+    assert os.path.samefile(
+        os.path.join(partitions.directory, name, "events.pkl"),
+        os.path.join(extended.directory, name, "events.pkl"),
+    )
+    # the old version is left as it was
+    assert YearPartitions(partitions.directory).prune(2008) == []
+
+    whole = YearPartitions.build(athlete_iso, str(tmp_path / "whole"))
+    pd.testing.assert_frame_equal(
+        sorted_medals(extended.medals(None, None, "Country", "Year"), "Country", "Year"),
+        sorted_medals(whole.medals(None, None, "Country", "Year"), "Country", "Year"),
+    )
+
+    # rows of a Games already stored are added to its partition
+    written = extended.append(athlete_iso[athlete_iso["Year"] == 1960])
+    assert written == ["games=1960-Summer"]
+    assert len(extended.events(1960, 1960)) == 2 * (athlete_iso["Year"] == 1960).sum()
+    # written next to the link, the file of the old version is unchanged
+    assert len(YearPartitions(partitions.directory).events(1960, 1960)) == \
+        (athlete_iso["Year"] == 1960).sum()
@@ -0,0 +1,340 @@
+# Athlete events stored in one partition per Games, with the medals of
+# every partition counted once when it is written
+#
+# directory/
+#     manifest.json                  partitions with Year, Season and rows
+#     games=1996-Summer/events.pkl   the athlete rows of the Games
+#     games=1996-Summer/medals.pkl   count_medals_n of the rows, per
+#                                    aggregate columns (Sport, Country, ...)
+#
+# A time-range query reads the manifest, keeps only the partitions in the
+# range (partition pruning) and adds up their medal counts, so it costs as
+# much as the range and not the 120 years. Appending a Games writes only
+# its partition and the manifest.
+#
+# The dashboards keep every version of a data file in a directory of its
+# own, data/partitions/<table>/<version>/ (open_partitions): a new version
+# is written next to the old one, which the requests started on it keep
+# reading, and removed when no longer used (close_partitions). Every
+# process reading a version holds a shared lock on <version>.lock, a version
+# is only removed when nobody does, so worker processes sharing the data
+# directory may run different versions for a while.
+
+# Load libraries
+import collections
+import json
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+import analyze_functions as af
+from callback_cache import hold_shared_lock, remove_unlocked
+
+
+MANIFEST = "manifest.json"
+
+# Columns the medals of every partition are counted by, when in the table
+AGGREGATE_COLUMNS = ["Year", "Season", "Games", "Sport", "Country", "ISO", "NOC", "Sex", "City"]
+
+MEDAL_COLUMNS = ["Bronze", "Gold", "Silver", "Total"]
+
+
+# Version directories of the partitions open in this process, {path: users},
+# and the lock files held for them
+_open_directories = collections.Counter()
+_directory_locks = {}
+_open_lock = threading.Lock()
+
+
+def partition_name(year, season):
+    return f"games={year}-{season}"
+
+
+def link_or_copy(source, destination):
+    """Hard links a partition file, copies it where links are not possible"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def write_atomic(path, write):
+    """Calls write(temporary path) and moves the file to path when done"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    write(temporary)
+    os.replace(temporary, path)
+
+
+class YearPartitions:
+    """A table of athlete events partitioned by Games, in directory"""
+    def __init__(self, directory):
+        self.directory = directory
+        # partitions read so far, {name: DataFrame}
+        self._events = {}
+        self._medals = {}
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.source = manifest.get("source")
+        self.aggregate_columns = manifest["aggregate_columns"]
+        self.manifest = pd.DataFrame(
+            manifest["partitions"], columns=["name", "Year", "Season", "rows"]
+        )
+
+    @classmethod
+    def build(cls, athlete_df, directory, source=None):
+        """
+        Writes athlete_df (columns like athlete_iso) as one partition per Games
+
+        Input:
+            athlete_df: DataFrame with Year and Season columns
+            directory: where the partitions are written, a new directory:
+                it is written under another name and moved there when done,
+                when another process was faster its partitions are used
+            source: identifies the data (e.g. its fingerprint), kept in the manifest
+
+        Returns:
+            YearPartitions of directory
+        """
+        temporary = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        # rows with a missing group value would be left out of the counts
+        columns = [
+            column for column in AGGREGATE_COLUMNS
+            if column in athlete_df.columns and athlete_df[column].notna().all()
+        ]
+        partitions = [
+            cls.write_partition(temporary, df_games, columns)
+            for _, df_games in athlete_df.groupby(["Year", "Season"], sort=True)
+        ]
+        cls.write_manifest(temporary, partitions, columns, source)
+        try:
+            os.replace(temporary, directory)
+        except OSError:
+            # written by another process meanwhile
+            shutil.rmtree(temporary, ignore_errors=True)
+        return cls(directory)
+
+    def extend(self, appended_df, directory, source=None):
+        """
+        Writes a new version of the partitions with the rows of appended_df
+        added: the partition files of this version are hard linked, only the
+        Games of the appended rows are written (append). Written files
+        replace the links, the files of this version stay as they are
+
+        Input:
+            appended_df: the rows the new version has in addition
+            directory: a new directory, see build
+            source: identifies the new data, kept in the manifest
+
+        Returns:
+            YearPartitions of directory, or None when the appended rows miss
+            values of an aggregate column (build the new version then)
+        """
+        if appended_df[self.aggregate_columns].isna().any().any():
+            return None
+        temporary = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        shutil.copytree(self.directory, temporary, copy_function=link_or_copy)
+        partitions = YearPartitions(temporary)
+        partitions.source = source
+        partitions.append(appended_df)
+        try:
+            os.replace(temporary, directory)
+        except OSError:
+            # written by another process meanwhile
+            shutil.rmtree(temporary, ignore_errors=True)
+        return YearPartitions(directory)
+
+    @staticmethod
+    def write_partition(directory, df_games, columns):
+        """Writes the rows of one Games and their medal counts"""
+        year, season = int(df_games["Year"].iloc[0]), df_games["Season"].iloc[0]
+        name = partition_name(year, season)
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+        df_games = df_games.reset_index(drop=True)
+        if df_games["Medal"].notna().any():
+            df_medals = af.count_medals_n(df_games, *columns)
+        else:
+            df_medals = pd.DataFrame(columns=columns + MEDAL_COLUMNS)
+        for file_name, df in [("events.pkl", df_games), ("medals.pkl", df_medals)]:
+            write_atomic(os.path.join(directory, name, file_name), df.to_pickle)
+        return {"name": name, "Year": year, "Season": season, "rows": len(df_games)}
+
+    @staticmethod
+    def write_manifest(directory, partitions, columns, source=None):
+        manifest = {"source": source, "aggregate_columns": columns, "partitions": partitions}
+
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(manifest, f, indent=1)
+        write_atomic(os.path.join(directory, MANIFEST), write)
+
+    def append(self, athlete_df):
+        """
+        Adds the rows of new Games: only their partitions and the manifest
+        are written. Rows of a Games already stored are added to its partition
+
+        Returns:
+            names of the partitions written
+        """
+        partitions = self.manifest.set_index("name").to_dict("index")
+        written = []
+        for (year, season), df_games in athlete_df.groupby(["Year", "Season"], sort=True):
+            name = partition_name(int(year), season)
+            if name in partitions:
+                df_games = pd.concat([self.partition_events(name), df_games], ignore_index=True)
+            partition = self.write_partition(self.directory, df_games, self.aggregate_columns)
+            partitions[name] = {key: value for key, value in partition.items() if key != "name"}
+            self._events.pop(name, None)
+            self._medals.pop(name, None)
+            written.append(name)
+
+        records = sorted(
+            ({"name": name, **partition} for name, partition in partitions.items()),
+            key=lambda partition: (partition["Year"], partition["Season"])
+        )
+        self.write_manifest(self.directory, records, self.aggregate_columns, self.source)
+        self.manifest = pd.DataFrame(records, columns=["name", "Year", "Season", "rows"])
+        return written
+
+    def prune(self, start=None, end=None, season=None):
+        """Names of the partitions with start <= Year <= end (and of season)"""
+        keep = pd.Series(True, index=self.manifest.index)
+        if start is not None:
+            keep &= self.manifest["Year"] >= start
+        if end is not None:
+            keep &= self.manifest["Year"] <= end
+        if season is not None:
+            keep &= self.manifest["Season"] == season
+        return self.manifest.loc[keep, "name"].tolist()
+
+    def partition_events(self, name):
+        if name not in self._events:
+            self._events[name] = pd.read_pickle(os.path.join(self.directory, name, "events.pkl"))
+        return self._events[name]
+
+    def partition_medals(self, name):
+        if name not in self._medals:
+            self._medals[name] = pd.read_pickle(os.path.join(self.directory, name, "medals.pkl"))
+        return self._medals[name]
+
+    def events(self, start=None, end=None, season=None):
+        """Athlete rows of the Games in the range"""
+        names = self.prune(start, end, season)
+        if not names:
+            return self.partition_events(self.manifest["name"].iloc[0]).iloc[:0]
+        return pd.concat([self.partition_events(name) for name in names], ignore_index=True)
+
+    def medals(self, start=None, end=None, *group, season=None, **filters):
+        """
+        Medals of the Games in the range, added up from the partition counts
+
+        Input:
+            start, end: first and last year (None: no limit)
+            *group: aggregate columns to group by, like count_medals_n
+            season: only Games of this season
+            **filters: aggregate column = value
+
+        Returns:
+            DataFrame like count_medals_n, without the groups with no medals
+        """
+        columns = list(group) + list(filters)
+        unknown = [column for column in columns if column not in self.aggregate_columns]
+        if unknown:
+            raise ValueError(f"not counted per partition: {unknown}")
+
+        names = self.prune(start, end, season)
+        frames = [self.partition_medals(name) for name in names]
+        frames = [df for df in frames if len(df)]
+        if not frames:
+            return pd.DataFrame(columns=list(group) + MEDAL_COLUMNS)
+
+        df = pd.concat(frames, ignore_index=True)
+        for column, value in filters.items():
+            df = df[df[column] == value]
+        df = df.groupby(list(group), sort=True)[MEDAL_COLUMNS].sum().reset_index()
+        return df[df["Total"] > 0].reset_index(drop=True)
+
+
+def version_directory(directory, source):
+    """Directory of one version of the data file, e.g. partitions/canada/1a2b3c4d5e6f"""
+    return os.path.join(directory, source[:12])
+
+
+def open_partitions(load, directory, source, previous=None, load_appended=None):
+    """
+    Gives back the partitions of one version of a data file, written when missing
+
+    Input:
+        load: function giving back the table (columns like athlete_iso)
+        directory: directory of the table, e.g. data/partitions/canada
+        source: fingerprint of the data file
+        previous: YearPartitions of the previous version of the data file
+        load_appended: function giving back the rows appended to the
+            previous version, or None when other rows changed as well;
+            then only the appended rows are written (YearPartitions.extend)
+
+    Returns:
+        YearPartitions of directory/<version>, close it with close_partitions
+    """
+    version = os.path.abspath(version_directory(directory, source))
+    os.makedirs(directory, exist_ok=True)
+    with _open_lock:
+        _open_directories[version] += 1
+        if version not in _directory_locks:
+            # before the version is written: no other process removes it then
+            _directory_locks[version] = hold_shared_lock(version + ".lock")
+    partitions = None
+    if os.path.exists(os.path.join(version, MANIFEST)):
+        partitions = YearPartitions(version)
+    elif previous is not None and load_appended is not None:
+        appended = load_appended()
+        if appended is not None:
+            partitions = previous.extend(appended, version, source)
+    if partitions is None:
+        partitions = YearPartitions.build(load(), version, source)
+    remove_unused(directory)
+    return partitions
+
+
+def close_partitions(partitions, directory):
+    """The partitions are no longer read: removes the versions nobody uses"""
+    version = os.path.abspath(partitions.directory)
+    with _open_lock:
+        _open_directories[version] -= 1
+        if _open_directories[version] <= 0:
+            del _open_directories[version]
+            lock_file = _directory_locks.pop(version)
+            if lock_file is not None:
+                lock_file.close()
+    remove_unused(directory)
+
+
+def remove_version(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def remove_unused(directory):
+    """
+    Removes the versions in directory which no process holds a lock on
+    (not open in this process nor in another one)
+    """
+    with _open_lock:
+        # the versions, and the lock files left without their version
+        versions = {
+            name[:-len(".lock")] if name.endswith(".lock") else name
+            for name in os.listdir(directory)
+            # being written, by this or another process
+            if not name.endswith(".tmp")
+        }
+        for name in versions:
+            path = os.path.abspath(os.path.join(directory, name))
+            if path not in _open_directories:
+                remove_unlocked(path + ".lock", lambda: remove_version(path))